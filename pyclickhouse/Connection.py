@@ -4,11 +4,15 @@ import logging
 import traceback
 import base64
 import os
+import itertools
+import threading
 
 import requests
 from requests.adapters import HTTPAdapter
 
 from pyclickhouse.Cursor import Cursor
+from pyclickhouse.compression import compress_chunks, iter_slices, make_compressor
+from pyclickhouse.transport import HTTPClientTransport
 
 
 class Connection(object):
@@ -22,10 +26,12 @@ class Connection(object):
     Session=None
     Pool_connections=1
     Pool_maxsize=10
+    SessionLock=threading.Lock()
 
     def __init__(self, host, port=None, username='default', password='', pool_connections=1, pool_maxsize=10,
                  timeout=5, clickhouse_settings='', auth_method=None, use_own_session=False, secure=None,
-                 server_cert=True):
+                 server_cert=True, compression=None, compression_level=None, compress_response=False,
+                 transport='requests'):
         """
         Create a new Connection object. Because HTTP protocol is used underneath, no real Connection is
         created. The Connection is rather an temporary object to create cursors.
@@ -49,6 +55,15 @@ class Connection(object):
         otherwise it is False by default (you can override the setting by passing the parameter explicitely)
         :param server_cert: if using TLS, you can pass here the file to CA Bundle or the server self-signed
         certificate. This parameter will be sent to the parameter "verify" of requests.
+        :param compression: optional Content-Encoding to compress the inserted data with: 'gzip', 'deflate', 'zstd'
+        (requires zstandard) or 'lz4' (requires lz4). The data is compressed in chunks while it is being sent.
+        :param compression_level: optional level of the compression, the default of the compression library is used
+        if omitted
+        :param compress_response: True to ask Clickhouse to compress the results (enable_http_compression=1), they
+        are decompressed transparently while being received
+        :param transport: 'requests' to send the requests with requests Sessions, 'http.client' for the leaner
+        HTTPClientTransport with less overhead per request, or any object with the methods request and close of
+        HTTPClientTransport
         :return: the Connection object
         """
         tmp = host.split(':')
@@ -76,15 +91,43 @@ class Connection(object):
         if len(clickhouse_settings) > 0:
             self.clickhouse_settings_encoded = '&' + '&'.join(['%s=%s' % pair for pair in list(clickhouse_settings.items())])
 
+        if compression is not None:
+            make_compressor(compression, compression_level) # fail early, if the compression is not available
+        self.compression = compression
+        self.compression_level = compression_level
+        if compress_response:
+            self.clickhouse_settings_encoded += '&enable_http_compression=1'
+
         self.pool_connections = pool_connections
         self.pool_maxsize = pool_maxsize
 
-        if use_own_session:
-            self.session = Connection._newsession(self.pool_connections, self.pool_maxsize)
+        # the parts of the requests which are the same for all calls
+        self.baseurl = 'http%s://%s:%s' % (self.secure, self.host, self.port)
+        self.path = '/?%s' % self.clickhouse_settings_encoded
+        if auth_method == 'legacy':
+            credentials = base64.b64encode((username + ':' + password).encode('ISO-8859-1')).decode('ascii')
+            self.headers = {'Authorization': 'Basic %s' % credentials}
+        elif auth_method == 'x':
+            self.headers = {'X-ClickHouse-User': username, 'X-ClickHouse-Key': password}
         else:
-            if Connection.Session is None or pool_connections != Connection.Pool_connections or pool_maxsize != Connection.Pool_maxsize:
+            self.headers = {}
+        if compress_response:
+            # http.client, unlike requests, doesn't ask for compressed responses by itself
+            self.headers['Accept-Encoding'] = 'gzip, deflate'
+        self.payloadheaders = dict(self.headers)
+        if compression is not None:
+            self.payloadheaders['Content-Encoding'] = compression
+
+        self.session = None
+        if transport == 'http.client':
+            transport = HTTPClientTransport(self.host, self.port, secure, self.server_cert, timeout, pool_maxsize)
+        elif transport == 'requests':
+            transport = None
+            if use_own_session:
+                self.session = Connection._newsession(self.pool_connections, self.pool_maxsize)
+            elif Connection.Session is None or pool_connections != Connection.Pool_connections or pool_maxsize != Connection.Pool_maxsize:
                 Connection.reopensession(pool_connections, pool_maxsize)
-            self.session = None
+        self.transport = transport
 
     @staticmethod
     def _newsession(pool_connections=1, pool_maxsize=10):
@@ -95,65 +138,31 @@ class Connection(object):
 
     @staticmethod
     def reopensession(pool_connections=1, pool_maxsize=10):
-        if Connection.Session is not None:
-            Connection.Session.close()
-        Connection.Session = Connection._newsession(pool_connections, pool_maxsize)
-        Connection.Pool_connections = pool_connections
-        Connection.Pool_maxsize = pool_maxsize
+        with Connection.SessionLock:
+            if Connection.Session is not None:
+                Connection.Session.close()
+            Connection.Session = Connection._newsession(pool_connections, pool_maxsize)
+            Connection.Pool_connections = pool_connections
+            Connection.Pool_maxsize = pool_maxsize
 
-    def _call(self, query = None, payload = None):
+    def _call(self, query = None, payload = None, stream=False, params=None):
         """
         Private method, use Cursor to make calls to Clickhouse.
+
+        The payload can be a string (text data, which is terminated with a newline if necessary), bytes (binary data,
+        sent as is) or an iterable of byte chunks, which is streamed to the server.
+
+        If stream is True, the response body is not read in advance and has to be consumed by the caller
+        (e.g. using iter_content) and then closed.
+
+        params is an optional dictionary of additional URL parameters of this call, e.g. the query_id.
         """
         try:
-            credentials = self.username + ':' + self.password
-            if self.auth_method == 'legacy':
-                header = {'Authorization': 'Basic %s' % (base64.b64encode(credentials.encode('ISO-8859-1')),)}
-            elif self.auth_method == 'x':
-                header = {'X-ClickHouse-User': self.username, 'X-ClickHouse-Key': self.password}
-            else:
-                header = {}
-
-            session = self.session
-            if session is None:
-                session = Connection.Session
-
-            if query is None:
-                return session.get('http%s://%s:%s' % (self.secure, self.host, self.port), timeout=self.timeout,
-                                   headers=header, verify=self.server_cert)
-
-            if payload is None:
-                url = 'http%s://%s:%s?%s' % \
-                                    (
-                                        self.secure,
-                                        self.host,
-                                        str(self.port),
-                                        self.clickhouse_settings_encoded
-                                    )
-                if isinstance(query, str):
-                    query = query.encode('utf8')
-                r = session.post(url, query, timeout=self.timeout, headers=header, verify=self.server_cert)
-            else:
-                url = 'http%s://%s:%s?%s' % \
-                                    (
-                                        self.secure,
-                                        self.host,
-                                        str(self.port),
-                                        self.clickhouse_settings_encoded
-                                    )
-                if not payload.endswith('\n'):
-                    payload = payload + '\n'
-                if isinstance(payload, str):
-                    payload = payload.encode('utf8')
-                payload = query.encode('utf-8') + '\n'.encode() + payload  # on python 3, all parts must be encoded (no implicit conversion)
-                r = session.post(url, payload, timeout=self.timeout, headers=header, verify=self.server_cert)
-            if not r.ok:
-                raise Exception('Query %s raised error %s' % (query, r.content))
-            return r
+            return self._request(query, payload, stream, params)
         except Exception as e:
             self.close()
             try:
-                if 'BadStatusLine' in str(e):  # e.g. ConnectionError has no attr. message
+                if 'BadStatusLine' in str(e) and self.transport is None:  # e.g. ConnectionError has no attr. message
                     if self.session is not None:
                         self.session.close()
                         self.session = Connection._newsession(self.pool_connections, self.pool_maxsize)
@@ -164,13 +173,62 @@ class Connection(object):
             logging.exception('When executing query %s' % query)
             raise
 
+    def _request(self, query=None, payload=None, stream=False, params=None):
+        """
+        Private method. Like _call, but errors are only raised, neither logged nor handled by closing the Connection.
+        """
+        path = self.path
+        if params is not None:
+            path += '&' + urllib.parse.urlencode(params)
+        if query is None:
+            r = self._send('GET', '/', None, self.headers, False)
+        elif payload is None:
+            if isinstance(query, str):
+                query = query.encode('utf8')
+            r = self._send('POST', path, query, self.headers, stream)
+        else:
+            if isinstance(payload, (str, bytes)):
+                if isinstance(payload, str):
+                    if not payload.endswith('\n'):
+                        payload = payload + '\n'
+                    payload = payload.encode('utf8')
+                chunks = iter_slices(payload)
+            else:
+                # an iterable of byte chunks, which is sent with chunked transfer encoding while it is consumed
+                chunks = payload
+            if self.compression is not None:
+                payload = compress_chunks(itertools.chain([query.encode('utf-8') + b'\n'], chunks),
+                                          self.compression, self.compression_level)
+            elif isinstance(payload, bytes):
+                payload = query.encode('utf-8') + b'\n' + payload
+            else:
+                payload = itertools.chain([query.encode('utf-8') + b'\n'], chunks)
+            r = self._send('POST', path, payload, self.payloadheaders, stream)
+        if not r.ok:
+            raise Exception('Query %s raised error %s' % (query, r.content))
+        return r
+
+    def _send(self, method, path, body, headers, stream):
+        if self.transport is not None:
+            return self.transport.request(method, path, body, headers, stream)
+        session = self.session
+        if session is None:
+            session = Connection.Session
+        return session.request(method, self.baseurl + path, data=body, timeout=self.timeout, headers=headers,
+                               verify=self.server_cert, stream=stream)
+
+    def ping(self):
+        """
+        :return: whether Clickhouse is responding. Raises an exception if it cannot be reached.
+        """
+        return self._call().content == b'Ok.\n'
+
     def open(self):
         """
         If connection is not yet opened, checks whether Clickhouse is responding and sets the state to 'opened'
         """
         if self.state != 'opened':
-            result = self._call()
-            if result.content != b'Ok.\n':  # is this ok, or should we use .encode() on LHS?
+            if not self.ping():
                 self.state = 'failed'
                 raise Exception('Clickhouse not responding')
             self.state = 'opened'
@@ -181,7 +239,9 @@ class Connection(object):
          after calling this method.
         """
         self.state = 'closed'
-        if self.session is not None:
+        if self.transport is not None:
+            self.transport.close()
+        elif self.session is not None:
             self.session.close()
         else:
             Connection.Session.close()
@@ -1,11 +1,18 @@
 import datetime as dt
 import logging
+import sys
 import time
 import re
+import itertools
+import queue
+import threading
 import ujson
 
 from pyclickhouse.FilterableCache import FilterableCache
 from pyclickhouse.formatter import TabSeparatedWithNamesAndTypesFormatter, NestingLevelTooHigh
+from pyclickhouse.rowbinary import RowBinaryWithNamesAndTypesFormatter
+from pyclickhouse.native import NativeFormatter
+from pyclickhouse.records import LazyResult
 
 
 class Cursor(object):
@@ -24,13 +31,26 @@ class Cursor(object):
         "insert" for inserting a single row (not recommended by Clickhouse)
 
     When calling "select", you can only use FORMAT TabSeparatedWithNamesAndTypes in your query, or omit it, in
-    which case it will be added to the query automatically.
-
-    After calling "select", you can call "fetchone" or "fetchall" to retrieve results, which will come in form
-    of dictionaries.
+    which case it will be added to the query automatically. To receive the results in binary form instead, which
+    is faster to parse, set the select_format attribute of the Cursor to 'RowBinaryWithNamesAndTypes'. Likewise, set the
+    insert_format attribute to 'RowBinaryWithNamesAndTypes' to send the data of "bulkinsert" in binary form, which is
+    smaller and faster to encode especially for numeric data. In this case, the types of the fields are taken from the
+    table, unless passed explicitly.
+
+    After calling "select", you can call "fetchone", "fetchmany" or "fetchall" or iterate over the Cursor to retrieve
+    results, which will come in form of dictionaries. The rows are parsed only when they are fetched. For large
+    results, set the row_format attribute of the Cursor to 'tuple' or 'record' to receive more compact rows instead:
+    plain tuples of values, or records, which are tuples that also allow to access the values by field name
+    (row['field'] or row.field). The names and types of the fields of the last select are
+    available in the description attribute of the Cursor, as in the Python DB API.
 
     You can pass parameters to the queries, by marking their places in the query using %s, for example
     cursor.select('SELECT count() FROM table WHERE field=%s', 123)
+
+    A Cursor created with several Connections to replicas sends its calls to them in turn. To prefer fast or idle
+    replicas and to eject failing ones for a while, set the balancer attribute to a pyclickhouse.Balancer. To cut the
+    tail latency of selects by sending slow ones to a second replica, set the hedging attribute to a
+    pyclickhouse.Hedging.
     """
 
     def __init__(self, connections):
@@ -40,12 +60,30 @@ class Cursor(object):
         self.connections = connections
         self.connection_index = 0
         self.failed_connections = []
+        self.connectionlock = threading.Lock()
         self.lastresult = None
         self.lastparsedresult = None
         self.formatter = TabSeparatedWithNamesAndTypesFormatter()
+        self.rowbinaryformatter = RowBinaryWithNamesAndTypesFormatter()
+        self.nativeformatter = NativeFormatter()
+        self.select_format = 'TabSeparatedWithNamesAndTypes'
+        self.insert_format = 'TabSeparatedWithNamesAndTypes'
+        self.server_timezone = None
+        self.dataframe_engine = 'csv'
+        self.row_format = 'dict'
+        self.description = None
+        self.arraysize = 1
         self.rowindex = -1
         self.cache = FilterableCache()
         self.max_nesting_level = 2
+        self.stream_chunk_size = 65536
+        self.native_block_size = 1048576
+        self.max_batch_bytes = 2000000000
+        self.max_batch_rows = None
+        self.encoding_pool = None
+        self.adaptive_batching = None
+        self.balancer = None
+        self.hedging = None
 
 
     @staticmethod
@@ -72,19 +110,59 @@ class Cursor(object):
         Execute a select query.
 
         You can only use FORMAT TabSeparatedWithNamesAndTypes in your query, or omit it, in
-    which case it will be added to the query automatically.
+    which case it will be added to the query automatically. If you omit it and the select_format attribute is set to
+    'RowBinaryWithNamesAndTypes', the results will be transferred and parsed in the binary format instead.
 
     After calling "select", you can call "fetchone" or "fetchall" to retrieve results, which will come in form
     of dictionaries.
 
     You can pass parameters to the queries, by marking their places in the query using %s, for example
     cursor.select('SELECT count() FROM table WHERE field=%s', 123)
+        """
+        parseresult = re.match(r'^.+?\s+format\s+\w+$', query.lower()) is None
+        if parseresult:
+            if self.select_format not in ['TabSeparatedWithNamesAndTypes', 'RowBinaryWithNamesAndTypes']:
+                raise Exception('Format %s is not supported by select' % self.select_format)
+            query += ' FORMAT ' + self.select_format
+        if self.hedging is not None and len(self.connections) > 1:
+            if args is not None and len(args) > 0:
+                query = query % tuple([Cursor._escapeparameter(x) for x in args])
+            with self.connectionlock:
+                primary = self.connections[self.connection_index % len(self.connections)]
+                self.connection_index = (self.connection_index + 1) % len(self.connections)
+                secondary = self.connections[self.connection_index]
+            self._setresult(self.hedging.call(primary, secondary, query), parseresult)
+        else:
+            self.executewithpayload(query, None, parseresult, *args)
+
+    def iter_select(self, query, *args):
+        """
+        Execute a select query and iterate over its resulting rows (dictionaries) while the response is still
+        being streamed from Clickhouse. The rows are parsed line by line as the bytes arrive, so the memory
+        consumption doesn't depend on the size of the result, and the first row is available before the server has
+        finished the query. Note that the query is sent only when the iteration starts.
+
+        You can only use FORMAT TabSeparatedWithNamesAndTypes in your query, or omit it, in
+    which case it will be added to the query automatically.
+
+    This method doesn't change the state of the cursor, so fetchone or fetchall cannot be used with it.
+
+    You can pass parameters to the queries, by marking their places in the query using %s, for example
+    cursor.iter_select('SELECT * FROM table WHERE field=%s', 123)
         """
         if re.match(r'^.+?\s+format\s+\w+$', query.lower()) is None:
             query += ' FORMAT TabSeparatedWithNamesAndTypes'
-            self.executewithpayload(query, None, True, *args)
-        else:
-            self.executewithpayload(query, None, False, *args)
+        elif re.match(r'^.+?\s+format\s+tabseparatedwithnamesandtypes$', query.lower()) is None:
+            raise Exception('Only FORMAT TabSeparatedWithNamesAndTypes is supported by iter_select')
+        if args is not None and len(args) > 0:
+            query = query % tuple([Cursor._escapeparameter(x) for x in args])
+        r = self._callroundrobin(query, None, stream=True)
+        try:
+            for row in self.formatter.unformat_stream(r.iter_content(chunk_size=self.stream_chunk_size),
+                                                      self.row_format):
+                yield row
+        finally:
+            r.close()
 
     def select_as_dataframe(self, query, *args):
         """
@@ -93,15 +171,49 @@ class Cursor(object):
         You can only use FORMAT TabSeparatedWithNamesAndTypes in your query, or omit it, in
     which case it will be added to the query automatically.
 
+    If the dataframe_engine attribute of the Cursor is set to 'pyarrow', the result is requested in the Parquet
+    format instead (you can only use FORMAT Parquet in the query then) and read using pyarrow, which is much faster
+    for large results and keeps integer columns (including nullable ones) integer. pyarrow has to be installed.
+
     You can pass parameters to the queries, by marking their places in the query using %s, for example
     cursor.select_as_dataframe('SELECT count() FROM table WHERE field=%s', 123)
         """
+        if self.dataframe_engine == 'pyarrow':
+            if re.match(r'^.+?\s+format\s+\w+$', query.lower()) is None:
+                query += ' FORMAT Parquet'
+            elif re.match(r'^.+?\s+format\s+parquet$', query.lower()) is None:
+                raise Exception('Only FORMAT Parquet is supported by select_as_dataframe with the pyarrow engine')
+            self.executewithpayload(query, None, False, *args)
+            return self.formatter.unformat_parquet_as_dataframe(self.lastresult.content)
         if re.match(r'^.+?\s+format\s+\w+$', query.lower()) is None:
             query += ' FORMAT TabSeparatedWithNamesAndTypes'
         self.executewithpayload(query, None, False, *args)
         result = self.formatter.unformat_as_dataframe(self.lastresult.content)
         return result
 
+    def select_as_numpy(self, query, *args):
+        """
+        Execute a select query and return its result column-wise, as a dictionary with field names as keys and numpy
+        arrays as values. The result is transferred in the columnar Native format, so that numeric, date and datetime
+        columns are read directly from the response without creating a python object per value.
+
+        Nullable columns are returned as numpy masked arrays. Date and DateTime columns are returned as datetime64
+        arrays with values in UTC. Decimal32 and Decimal64 columns are returned as float64 arrays, which can lose
+        precision beyond about 15 significant digits.
+
+        You can only use FORMAT Native in your query, or omit it, in
+    which case it will be added to the query automatically.
+
+    You can pass parameters to the queries, by marking their places in the query using %s, for example
+    cursor.select_as_numpy('SELECT count() FROM table WHERE field=%s', 123)
+        """
+        if re.match(r'^.+?\s+format\s+\w+$', query.lower()) is None:
+            query += ' FORMAT Native'
+        elif re.match(r'^.+?\s+format\s+native$', query.lower()) is None:
+            raise Exception('Only FORMAT Native is supported by select_as_numpy')
+        self.executewithpayload(query, None, False, *args)
+        return self.nativeformatter.unformat_as_numpy(self.lastresult.content)
+
     def insert(self, query, *args):
         """
         Execute an insert query with data packed inside of the query parameter. Note that using "bulkinsert" can
@@ -128,38 +240,270 @@ class Cursor(object):
         objects passed in the values parameter. If some dictionary doesn't have that key, a None value will be assumed
         :param types: optional list of strings representing Clickhouse types of corresponding fields, to ensure proper
         escaping. If omitted, the types will be inferred automatically from the first element of the values list.
+
+        The values are sent in batches of at most max_batch_bytes of encoded data (by default 2 GB, so that normally
+        all values are sent as a single insert) and max_batch_rows rows (attributes of the Cursor, None for no limit),
+        each batch as a separate insert as soon as it is filled; if an insert fails, the batches sent before remain
+        inserted. Set the encoding_pool attribute of the Cursor to a pyclickhouse.EncodingPool to encode the values in
+        several processes. Set the adaptive_batching attribute to a pyclickhouse.AdaptiveBatching to choose the number
+        of rows per insert automatically instead, and to retry inserts the server pushes back (e.g. because of too many
+        parts).
+
+        If values is not a list or tuple, but any other iterable (e.g. a generator), it is passed to bulkinsert_stream.
+        """
+        if not isinstance(values, (list, tuple)):
+            return self.bulkinsert_stream(table, values, fields, types)
+        if len(values) == 0:
+            raise Exception('No data in rows')
+        if self.adaptive_batching is not None:
+            return self._adaptivebulkinsert(table, values, fields, types)
+        fields, types, encode = self._batchencoder(table, values, fields, types)
+        query = 'INSERT INTO %s (%s) FORMAT %s' % (table, ','.join(fields), self.insert_format)
+        payloads = encode(values, self.max_batch_bytes, self.max_batch_rows)
+        if self.encoding_pool is not None:
+            responses = []
+            try:
+                self.encoding_pool.send(lambda payload: responses.append(self._callroundrobin(query, payload)),
+                                        payloads)
+            finally:
+                # the state of the Cursor is that after the last insert, as without encoding_pool
+                if len(responses) > 0:
+                    self._setresult(responses[-1], False)
+        else:
+            for payload in payloads:
+                self.executewithpayload(query, payload, False)
+
+    def bulkinsert_pipelined(self, table, batches, fields=None, types=None, queue_size=2):
+        """
+        Insert an iterable of batches (lists of rows, see bulkinsert), for example produced by a generator reading a
+        file or a message queue. The next batches are encoded on a worker thread while the current one is being sent,
+        so that the throughput comes close to the slower of encoding and sending, instead of their sum. At most
+        queue_size encoded payloads wait to be sent, so that the worker thread doesn't run ahead of the server.
+
+        Each batch is inserted as one or more inserts (see max_batch_bytes and max_batch_rows), so that a failed batch
+        can be retried on another host. If the insert fails, the exception is raised and the batches already sent
+        remain inserted. The worker thread is given a second to stop; if it is blocked in the batches iterable (e.g.
+        waiting for a message queue), it is left behind as a daemon thread and stops when its next batch arrives.
+
+        :param table: Target table for inserting data, which can be optionally prepended with a database name.
+        :param batches: iterable of lists of dictionaries or python objects to insert
+        :param fields: optional list of fields to insert, see bulkinsert
+        :param types: optional list of Clickhouse types of the fields, see bulkinsert. If omitted, the types will be
+        inferred from the first batch and used for all batches.
+        :param queue_size: maximal number of encoded payloads waiting to be sent
+        """
+        batches = (batch for batch in batches if len(batch) > 0)
+        try:
+            first = next(batches)
+        except StopIteration:
+            return
+        fields, types, encode = self._batchencoder(table, first, fields, types)
+        query = 'INSERT INTO %s (%s) FORMAT %s' % (table, ','.join(fields), self.insert_format)
+        payloads = queue.Queue(queue_size)
+        stopped = threading.Event()
+
+        def put(item):
+            while not stopped.is_set():
+                try:
+                    payloads.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def produce():
+            try:
+                for batch in itertools.chain([first], batches):
+                    for payload in encode(batch, self.max_batch_bytes, self.max_batch_rows):
+                        if not put(payload):
+                            return
+                put(None)
+            except Exception as e:
+                put(e)
+
+        worker = threading.Thread(target=produce, name='pyclickhouse-encoder')
+        worker.daemon = True
+        worker.start()
+        try:
+            while True:
+                payload = payloads.get()
+                if payload is None:
+                    break
+                if isinstance(payload, Exception):
+                    raise payload
+                self.executewithpayload(query, payload, False)
+        finally:
+            stopped.set()
+            worker.join(1.0)
+
+    def _batchencoder(self, table, values, fields, types):
+        """
+        Private method. Determine the fields and types to insert into the table with the insert_format of the Cursor,
+        and return them together with a function encoding a list of rows into a generator of payloads, given the
+        maximal bytes and rows per payload.
+        """
+        if self.insert_format == 'RowBinaryWithNamesAndTypes':
+            fields, types = self._binaryschema(table, values[0], fields, types)
+            timezone = self._servertimezone()
+            adapter = self.rowbinaryformatter.adapter
+            encode_serial = lambda rows, max_bytes, max_rows: self.rowbinaryformatter.iter_batches(
+                rows, fields, types, max_bytes, max_rows, timezone)
+        elif self.insert_format == 'TabSeparatedWithNamesAndTypes':
+            fields, types = self.formatter.infer_schema(values, fields, types)
+            timezone = None
+            adapter = self.formatter.adapter
+            encode_serial = lambda rows, max_bytes, max_rows: self.formatter.iter_batches(
+                rows, fields, types, max_bytes, max_rows)
+        else:
+            raise Exception('Format %s is not supported by bulkinsert' % self.insert_format)
+        pool = self.encoding_pool
+        if pool is None:
+            return fields, types, encode_serial
+        return fields, types, lambda rows, max_bytes, max_rows: pool.iter_batches(
+            self.insert_format, rows, fields, types, max_bytes, max_rows, timezone, adapter)
+
+    def _adaptivebulkinsert(self, table, values, fields, types):
+        """
+        Private method. Insert the values in batches of the size chosen by the adaptive_batching of the Cursor, each
+        batch as one insert, which is retried when the server pushes back.
         """
-        fields, types, payload = self.formatter.format(values, fields, types)
-        if len(payload) < 2000000000:
-            self.executewithpayload('INSERT INTO %s (%s) FORMAT TabSeparatedWithNamesAndTypes' %
-                                    (table, ','.join(fields)), payload, False)
+        fields, types, encode = self._batchencoder(table, values, fields, types)
+        query = 'INSERT INTO %s (%s) FORMAT %s' % (table, ','.join(fields), self.insert_format)
+        adaptive = self.adaptive_batching
+        start = 0
+        while start < len(values):
+            rows = values[start:start + adaptive.batch_rows]
+            began = time.time()
+            try:
+                for payload in encode(rows, sys.maxsize, None):
+                    self.executewithpayload(query, payload, False)
+            except Exception as e:
+                time.sleep(adaptive.pushback(e))
+                continue
+            adaptive.success(len(rows), time.time() - began)
+            start += len(rows)
+
+    def bulkinsert_stream(self, table, values, fields=None, types=None):
+        """
+        Insert the rows of any iterable (for example a generator reading a file), which are formatted and sent to
+        Clickhouse in chunks while the iterable is consumed, using chunked transfer encoding. Neither the rows nor the
+        formatted payload are ever held in memory as a whole. Note that Clickhouse may have already inserted some
+        blocks of the data if the insert fails midway, and that the insert cannot be retried on another host, because
+        the iterable can be consumed only once.
+
+        :param table: Target table for inserting data, which can be optionally prepended with a database name.
+        :param values: iterable of dictionaries or python objects to insert
+        :param fields: optional list of fields to insert, see bulkinsert
+        :param types: optional list of Clickhouse types of the fields, see bulkinsert. If omitted, the types will be
+        inferred automatically from the first row.
+        """
+        if self.insert_format == 'RowBinaryWithNamesAndTypes':
+            if fields is None or types is None:
+                values = iter(values)
+                try:
+                    first = next(values)
+                except StopIteration:
+                    raise Exception('No data in rows')
+                values = itertools.chain([first], values)
+                fields, types = self._binaryschema(table, first, fields, types)
+            chunks = self.rowbinaryformatter.iter_format(values, fields, types, self._servertimezone(),
+                                                         self.stream_chunk_size)
+        elif self.insert_format == 'TabSeparatedWithNamesAndTypes':
+            fields, types, chunks = self.formatter.iter_format(values, fields, types, self.stream_chunk_size)
         else:
-            batch = int(2000000000.0 / len(payload) * len(values))
-            if batch < 1:
-                raise Exception("Payload of the values is larger than 2Gb, Clickhouse won't probably accept that")
-            for i in range(0, len(values), batch):
-                self.bulkinsert(table, values[i:i + batch], fields, types)
+            raise Exception('Format %s is not supported by bulkinsert' % self.insert_format)
+        self.executewithpayload('INSERT INTO %s (%s) FORMAT %s' %
+                                (table, ','.join(fields), self.insert_format), chunks, False)
+
+    def insert_columns(self, table, columns, fields=None, types=None):
+        """
+        Insert data given column-wise, for example the result of select_as_numpy. The columns are encoded as whole numpy
+        arrays into the columnar Native format, so that no python object is created per value for numeric, date and
+        datetime columns. The data is sent in blocks of native_block_size rows (an attribute of the Cursor), using
+        chunked transfer encoding, so that only one block is encoded in memory at a time.
+
+        :param table: Target table for inserting data, which can be optionally prepended with a database name.
+        :param columns: dictionary with field names as keys and numpy arrays (or lists) of the same length as values.
+        Use masked arrays, NaN, NaT or None for NULLs in Nullable columns. datetime64 values are taken as UTC (like
+        select_as_numpy returns them), python datetimes without timezone as wall clock time in the timezone of the
+        column or of the server, like by bulkinsert.
+        :param fields: optional list of fields to insert, by default all keys of columns
+        :param types: optional list of Clickhouse types of the fields. If omitted, the types of the columns of the
+        table are used, and the values are converted to them.
+        """
+        fields, types = self._binaryschema(table, columns, fields, types)
+        blocks = self.nativeformatter.iter_format(columns, fields, types, self.native_block_size,
+                                                  self._servertimezone())
+        self.executewithpayload('INSERT INTO %s (%s) FORMAT Native' % (table, ','.join(fields)), blocks, False)
+
+    def insert_dataframe(self, table, df, fields=None, types=None):
+        """
+        Insert a pandas dataframe, by passing its columns as numpy arrays to insert_columns, without creating a row
+        dictionary per row. Missing values (None, NaN, NaT, pd.NA) are inserted as NULL into Nullable columns,
+        timestamps with a timezone are converted to UTC, and datetime64 columns without timezone are taken as UTC.
+        Python datetimes without timezone in object columns are handled like by insert_columns.
+
+        :param table: Target table for inserting data, which can be optionally prepended with a database name.
+        :param df: the pandas dataframe
+        :param fields: optional list of fields to insert, by default all columns of the dataframe
+        :param types: optional list of Clickhouse types of the fields, see insert_columns
+        """
+        columns = self.nativeformatter.columns_from_dataframe(df, fields)
+        self.insert_columns(table, columns, fields or list(columns.keys()), types)
+
+    def _binaryschema(self, table, first, fields, types):
+        """
+        Private method. Binary formats require the types of the inserted data to be exactly the types of the columns,
+        so if types are omitted, they are taken from the table instead of being inferred from the values. If fields
+        are omitted, they are the keys of the first row.
+        """
+        if fields is None:
+            fields = list(self.formatter.adapter.getfields(first))
+        if types is None:
+            table_fields, table_types = self.get_schema(table)
+            schema = dict(zip(table_fields, table_types))
+            for field in fields:
+                if field not in schema:
+                    raise Exception('Column %s does not exist in %s' % (field, table))
+            types = [schema[f] for f in fields]
+        return fields, types
+
+    def _servertimezone(self):
+        """
+        Private method. Return the timezone of the server, which is needed to encode DateTime values in binary
+        formats. It is requested from the server once per Cursor, unless the server_timezone attribute is set.
+        """
+        if self.server_timezone is None:
+            self.server_timezone = self._selectdicts('select timezone() as tz')[0]['tz']
+        return self.server_timezone
 
-    def _callroundrobin(self, query, payload):
+    def _callroundrobin(self, query, payload, stream=False):
+        if self.balancer is not None:
+            return self.balancer.call(query, payload, stream)
         if len(self.connections) == 1 and len(self.failed_connections) == 0:
-            return self.connections[0]._call(query, payload)
+            return self.connections[0]._call(query, payload, stream)
 
-        for tries in range(10):
+        # a streamed payload can be sent only once
+        maxtries = 10 if payload is None or isinstance(payload, (str, bytes)) else 1
+        for tries in range(maxtries):
+            # the connection is chosen under a lock, because the batches of bulkinsert may be sent concurrently
+            with self.connectionlock:
+                if self.connection_index >= len(self.connections):
+                    self.connection_index = 0
+                connection = self.connections[self.connection_index]
+                self.connection_index += 1
             try:
-                r = self.connections[self.connection_index]._call(query, payload)
-                return r
+                return connection._call(query, payload, stream)
             except:
-                self.failed_connections.append(self.connections[self.connection_index])
-                self.connections.remove(self.connections[self.connection_index])
-                if len(self.connections) == 0:
-                    self.connections = self.failed_connections
-                    self.failed_connections = []
-                if tries == 9:
+                with self.connectionlock:
+                    if connection in self.connections:
+                        self.failed_connections.append(connection)
+                        self.connections.remove(connection)
+                        if len(self.connections) == 0:
+                            self.connections = self.failed_connections
+                            self.failed_connections = []
+                if tries == maxtries - 1:
                     raise
-            finally:
-                self.connection_index += 1
-                if self.connection_index >= len(self.connections):
-                    self.connection_index = 0
 
     def executewithpayload(self, query, payload, parseresult, *args):
         """
@@ -167,29 +511,106 @@ class Cursor(object):
         """
         if args is not None and len(args) > 0:
             query = query % tuple([Cursor._escapeparameter(x) for x in args])
-        self.lastresult = self._callroundrobin(query, payload)
+        self._setresult(self._callroundrobin(query, payload), parseresult)
+
+    def _setresult(self, result, parseresult):
+        """
+        Private method. Store the response of a query, which is parsed (lazily) if it is the result of a select.
+        """
+        self.lastresult = result
         if parseresult and self.lastresult is not None:
-            self.lastparsedresult = self.formatter.unformat(self.lastresult.content)
+            content = self.lastresult.content
+            row_format = self.row_format
+            if self.select_format == 'RowBinaryWithNamesAndTypes':
+                timezone = self.lastresult.headers.get('X-ClickHouse-Timezone')
+                fields, types, rows = self.rowbinaryformatter.iter_unformat(content, timezone, row_format)
+                reparse = lambda columns: self.rowbinaryformatter.iter_unformat(content, timezone, row_format,
+                                                                                columns)[2]
+            else:
+                fields, types, rows = self.formatter.iter_unformat(content, row_format)
+                reparse = lambda columns: self.formatter.iter_unformat(content, row_format, columns)[2]
+            # the rows are parsed only when they are fetched
+            self.lastparsedresult = LazyResult(fields, types, rows, reparse)
+            self.description = [(f, t, None, None, None, None, t.replace('LowCardinality(', '').startswith(
+                'Nullable(')) for f, t in zip(fields, types)]
             self.lastresult = None  # hint GC to free memory
         else:
             self.lastparsedresult = None
+            self.description = None
         self.rowindex = -1
 
+    def _selectdicts(self, query, *args):
+        """
+        Private method. Select rows as dictionaries, regardless of the row_format of the Cursor.
+        """
+        row_format = self.row_format
+        self.row_format = 'dict'
+        try:
+            self.select(query, *args)
+        finally:
+            self.row_format = row_format
+        return self.fetchall()
+
     def fetchone(self):
         """
-        Fetch one next result row after a select query and return it as a dictionary, or None if there is no more rows.
+        Fetch one next result row after a select query and return it as a dictionary (or a tuple or a record,
+        depending on the row_format attribute), or None if there is no more rows. Only the fetched rows are parsed
+        from the received result.
         """
         if self.lastparsedresult is None:
             return self.lastresult.content
-        if self.rowindex >= len(self.lastparsedresult) - 1:
+        row = self.lastparsedresult.get(self.rowindex + 1)
+        if row is None:
             return None
         self.rowindex += 1
-        return self.lastparsedresult[self.rowindex]
+        return row
 
-    def fetchall(self):
+    def fetchmany(self, size=None):
         """
-        Fetch all resulting rows of a select query as a list of dictionaries.
+        Fetch the next size result rows after a select query (arraysize rows, if size is omitted) as a list. The list
+        is shorter than size or empty, if there are not enough rows left. Only the fetched rows are parsed from the
+        received result.
         """
+        if size is None:
+            size = self.arraysize
+        rows = self._parsedresult().slice(self.rowindex + 1, self.rowindex + 1 + size)
+        self.rowindex += len(rows)
+        return rows
+
+    def fetchall(self, columns=None):
+        """
+        Fetch all resulting rows of a select query as a list of dictionaries (or tuples or records, depending on the
+        row_format attribute). Note that unlike fetchone and fetchmany, this method always returns all the rows of the
+        result, including already fetched ones.
+
+        :param columns: optional list of fields to return. If the rows are not parsed yet, only these fields are
+        decoded, which is much faster for wide results if only a few fields are needed. The unparsed rows stay
+        available for further fetches.
+        """
+        if self.lastparsedresult is None:
+            return None
+        if columns is not None:
+            return self.lastparsedresult.projection(columns)
+        return self.lastparsedresult.all()
+
+    def __iter__(self):
+        """
+        Iterate over the rows of the last select, which are not fetched yet.
+        """
+        self._parsedresult()
+        while True:
+            row = self.fetchone()
+            if row is None:
+                return
+            yield row
+
+    def _parsedresult(self):
+        """
+        Private method. Return the parsed result of the last select, or raise an exception if there is none.
+        """
+        if self.lastparsedresult is None:
+            raise Exception('No rows to fetch: the last query was not a select, or its result was not parsed because '
+                            'of an explicit FORMAT')
         return self.lastparsedresult
 
     def cached_select(self, query, filter):
@@ -210,8 +631,7 @@ class Cursor(object):
         tag = query + ''.join(keys)
 
         if not self.cache.has_dataset(tag):
-            self.select(query)
-            self.cache.add_dataset(tag, keys, self.fetchall())
+            self.cache.add_dataset(tag, keys, self._selectdicts(query))
 
         return self.cache.select(tag, filter)
 
@@ -226,8 +646,8 @@ class Cursor(object):
             database = 'default'
             tablename = table[0]
 
-        self.select('select name, type from system.columns where database=%s and table=%s', database, tablename)
-        result = self.fetchall()
+        result = self._selectdicts('select name, type from system.columns where database=%s and table=%s', database,
+                                   tablename)
         return ([x['name'] for x in result], [x['type'] for x in result])
 
     def _flatten_array(self, arr, separator, prefix='', path=[], nesting_level=0):
@@ -329,6 +749,8 @@ class Cursor(object):
         or the value of an incompatible type will be omitted.
         The previous versions of this method supported automatic creation of a buffer table. The
         support is deprecated, because it could crash clickhouse server.
+        If the insert fails because the table is being altered concurrently, all documents are inserted again, so the
+        documents may be duplicated if the Cursor splits them into several inserts (see bulkinsert).
         """
         fields, types = self.prepare_document_table(table, documents, nullablelambda, extendtable)
 
@@ -364,7 +786,7 @@ class Cursor(object):
         ignore_fields.append(datetimefield)
         ignore_fields.extend(primary_keys)
 
-        self.select("""
+        rows = self._selectdicts("""
         select %s, %s
         from %s
         where %s
@@ -379,7 +801,7 @@ class Cursor(object):
         ))
 
         existing = dict()
-        for row in self.fetchall():
+        for row in rows:
             pk = tuple([row[x] for x in primary_keys])
             existing[pk] = row
 
@@ -1,2 +1,9 @@
 from .Connection import Connection
-from .Cursor import Cursor
\ No newline at end of file
+from .Cursor import Cursor
+from .encodingpool import EncodingPool
+from .bufferedinserter import BufferedInserter
+from .adaptive import AdaptiveBatching
+from .aio import AsyncConnection, AsyncCursor
+from .balancer import Balancer
+from .hedging import Hedging
+from .connectionpool import ConnectionPool
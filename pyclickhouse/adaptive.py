@@ -0,0 +1,105 @@
+import re
+import http.client
+import socket
+import logging
+
+import requests
+
+
+MEMORY_LIMIT_EXCEEDED = 241
+TOO_MANY_PARTS = 252
+TOO_MANY_SIMULTANEOUS_QUERIES = 202
+
+_ERROR_CODE_RE = re.compile(r'Code: (\d+)')
+
+
+def error_code(exception):
+    """
+    :return: the Clickhouse error code contained in the message of the exception, or None
+    """
+    match = _ERROR_CODE_RE.search(str(exception))
+    return int(match.group(1)) if match is not None else None
+
+
+def transient(exception):
+    """
+    :return: whether the exception is a transient error, after which the same request may succeed later: a connection
+    error, a timeout, or a push back of the server (MEMORY_LIMIT_EXCEEDED, TOO_MANY_PARTS or
+    TOO_MANY_SIMULTANEOUS_QUERIES)
+    """
+    if isinstance(exception, (requests.exceptions.ConnectionError, requests.exceptions.Timeout, OSError,
+                              http.client.HTTPException)):
+        return True
+    return error_code(exception) in (MEMORY_LIMIT_EXCEEDED, TOO_MANY_PARTS, TOO_MANY_SIMULTANEOUS_QUERIES)
+
+
+class AdaptiveBatching(object):
+    """
+    Chooses the number of rows per insert of bulkinsert, when set as the adaptive_batching attribute of a Cursor.
+    The batch size grows while inserts take less than target_seconds and shrinks when they take longer, so that each
+    insert takes about target_seconds. When the server pushes back, the insert is retried after a delay growing
+    exponentially with each consecutive push back:
+
+    - MEMORY_LIMIT_EXCEEDED and timeouts: the batch size is halved before the retry.
+    - TOO_MANY_PARTS and TOO_MANY_SIMULTANEOUS_QUERIES: only the delay, because smaller batches would create even more
+      parts. The batch size doesn't grow until an insert succeeds.
+
+    Other errors are raised immediately, and push backs are raised after max_retries consecutive ones. The current
+    batch size is available in the batch_rows attribute, and can be shared by several Cursors inserting into the
+    same table.
+    """
+
+    def __init__(self, batch_rows=10000, min_rows=1000, max_rows=1000000, target_seconds=1.0, growth=2.0,
+                 min_delay=1.0, max_delay=60.0, max_retries=10):
+        """
+        :param batch_rows: initial number of rows per insert
+        :param min_rows: the batch size never gets smaller
+        :param max_rows: the batch size never gets larger
+        :param target_seconds: the desired duration of an insert
+        :param growth: maximal factor of growth of the batch size after a successful insert
+        :param min_delay: seconds to wait after the first push back
+        :param max_delay: maximal number of seconds to wait after a push back
+        :param max_retries: number of consecutive push backs after which the error is raised
+        """
+        self.batch_rows = batch_rows
+        self.min_rows = min_rows
+        self.max_rows = max_rows
+        self.target_seconds = target_seconds
+        self.growth = growth
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.max_retries = max_retries
+        self.pushbacks = 0
+        self.last_error = None
+
+    def success(self, rows, seconds):
+        """
+        Adapt the batch size after rows have been inserted in seconds.
+        """
+        self.pushbacks = 0
+        if rows < self.batch_rows:
+            return  # the last, incomplete batch tells nothing about the batch size
+        factor = self.target_seconds / seconds if seconds > 0 else self.growth
+        factor = max(0.5, min(self.growth, factor))
+        self.batch_rows = int(max(self.min_rows, min(self.max_rows, self.batch_rows * factor)))
+
+    def pushback(self, exception):
+        """
+        Adapt the batch size after an insert has failed with the exception.
+        :return: the number of seconds to wait before retrying the insert. If the exception is not a push back of
+        the server, or there were too many consecutive push backs, it is raised instead.
+        """
+        code = error_code(exception)
+        timeout = isinstance(exception, (requests.exceptions.Timeout, socket.timeout))
+        if not timeout and code not in (MEMORY_LIMIT_EXCEEDED, TOO_MANY_PARTS, TOO_MANY_SIMULTANEOUS_QUERIES):
+            raise exception
+        self.pushbacks += 1
+        self.last_error = exception
+        if self.pushbacks > self.max_retries:
+            raise exception
+        if timeout or code == MEMORY_LIMIT_EXCEEDED:
+            self.batch_rows = max(self.min_rows, self.batch_rows // 2)
+        delay = min(self.max_delay, self.min_delay * 2 ** (self.pushbacks - 1))
+        logging.warning('Clickhouse pushed back an insert (%s), retrying in %.1f seconds with %d rows per insert' %
+                        ('timeout' if timeout else 'code %s' % code, delay, self.batch_rows))
+        return delay
@@ -0,0 +1,528 @@
+import asyncio
+import base64
+import itertools
+import os
+import re
+import ssl
+import zlib
+
+from requests.structures import CaseInsensitiveDict
+
+from pyclickhouse.Cursor import Cursor
+from pyclickhouse.formatter import TabSeparatedWithNamesAndTypesFormatter
+from pyclickhouse.rowbinary import RowBinaryWithNamesAndTypesFormatter
+from pyclickhouse.compression import compress_chunks, make_compressor
+
+
+_DECOMPRESSION_WBITS = {'gzip': 16 + zlib.MAX_WBITS, 'deflate': zlib.MAX_WBITS}
+
+
+class AsyncResponse(object):
+    """
+    A response of Clickhouse to a call of an AsyncConnection, with status_code, ok and headers like a response of
+    requests. The body has to be received with read (after which it is available as content) or iter_content, and the
+    TCP connection is returned to the pool of the AsyncConnection as soon as the body has been received completely, or
+    closed if close is called before.
+    """
+
+    def __init__(self, connection, reader, writer, status_code, headers):
+        self.connection = connection
+        self.reader = reader
+        self.writer = writer
+        self.status_code = status_code
+        self.ok = 200 <= status_code < 400
+        self.headers = headers
+        self.content = None
+        self._chunked = 'chunked' in headers.get('Transfer-Encoding', '').lower()
+        length = headers.get('Content-Length')
+        self._left = 0 if self._chunked or length is None else int(length)
+        self._sized = not self._chunked and length is not None
+        self._inchunk = False
+        encoding = headers.get('Content-Encoding', '').lower()
+        self._decompressor = zlib.decompressobj(_DECOMPRESSION_WBITS[encoding]) \
+            if encoding in _DECOMPRESSION_WBITS else None
+        self._keepalive = headers.get('Connection', '').lower() != 'close'
+        self._done = False
+        self._released = False
+
+    async def read(self):
+        """
+        Receive the whole body.
+        :return: the body as bytes
+        """
+        if self.content is None:
+            self.content = b''.join([chunk async for chunk in self.iter_content()])
+        return self.content
+
+    async def iter_content(self, chunk_size=65536):
+        """
+        Yield the body in chunks of at most about chunk_size bytes while it is being received.
+        """
+        try:
+            while True:
+                chunk = await self._readraw(chunk_size)
+                if chunk is None:
+                    break
+                if self._decompressor is not None:
+                    chunk = self._decompressor.decompress(chunk)
+                if len(chunk) > 0:
+                    yield chunk
+            if self._decompressor is not None:
+                chunk = self._decompressor.flush()
+                if len(chunk) > 0:
+                    yield chunk
+        finally:
+            self.close()
+
+    async def _readraw(self, size):
+        """
+        :return: the next bytes of the body as sent (at most size), or None at its end
+        """
+        if self._done:
+            return None
+        wait = self.connection._wait
+        if self._chunked and self._left == 0:
+            if self._inchunk:
+                await wait(self.reader.readexactly(2))  # the line break after the data of the chunk
+            line = await wait(self.reader.readline())
+            if len(line) == 0:
+                raise ConnectionError('Connection closed by Clickhouse')
+            self._left = int(line.split(b';')[0].strip(), 16)
+            self._inchunk = True
+            if self._left == 0:
+                while (await wait(self.reader.readline())) not in (b'\r\n', b'\n', b''):
+                    pass  # trailers
+                self._done = True
+                return None
+        elif self._sized and self._left == 0:
+            self._done = True
+            return None
+        data = await wait(self.reader.read(size if not (self._chunked or self._sized) else min(size, self._left)))
+        if len(data) == 0:
+            if self._chunked or self._sized:
+                raise ConnectionError('Connection closed by Clickhouse')
+            # without length, the body ends with the connection
+            self._done = True
+            self._keepalive = False
+            return None
+        self._left -= len(data)
+        return data
+
+    def close(self):
+        """
+        Return the TCP connection to the pool, if the body has been received completely, otherwise close it.
+        """
+        if not self._released:
+            self._released = True
+            self.connection._release(self.reader, self.writer, self._done and self._keepalive)
+
+
+class AsyncConnection(object):
+    """
+    Like Connection, but for asyncio applications: the HTTP requests are made on asyncio streams, so that many queries
+    can be executed concurrently in one event loop without threads. Each AsyncConnection keeps a pool of up to
+    pool_maxsize keep-alive TCP connections; calls exceeding it wait for a free connection.
+
+    conn = AsyncConnection('localhost:8123')
+    cursor = conn.cursor()
+    await cursor.select('SELECT 1 AS one')
+    cursor.fetchone()
+    await conn.close()
+    """
+
+    def __init__(self, host, port=None, username='default', password='', pool_maxsize=10, timeout=5,
+                 clickhouse_settings='', auth_method=None, secure=None, server_cert=True, compression=None,
+                 compression_level=None, compress_response=False):
+        """
+        :param pool_maxsize: maximum number of TCP connections this AsyncConnection may open to the Clickhouse host
+        :param timeout: seconds to wait for connecting and for each read from the server
+
+        For the other parameters, see Connection.
+        """
+        tmp = host.split(':')
+        self.host = tmp[0]
+        self.port = port
+        if self.port is None:
+            self.port = int(tmp[-1]) if len(tmp) > 1 else 8123
+        if secure is None:
+            secure = self.port == 8443
+        self.ssl = None
+        if secure:
+            if isinstance(server_cert, str):
+                self.ssl = ssl.create_default_context(cafile=os.path.expanduser(server_cert))
+            else:
+                self.ssl = ssl.create_default_context()
+                if not server_cert:
+                    self.ssl.check_hostname = False
+                    self.ssl.verify_mode = ssl.CERT_NONE
+        self.username = username
+        self.password = password
+        self.timeout = timeout
+        if auth_method is None and (username != 'default' or password != ''):
+            auth_method = 'x'
+        self.auth_method = auth_method
+
+        if compression is not None:
+            make_compressor(compression, compression_level) # fail early, if the compression is not available
+        self.compression = compression
+        self.compression_level = compression_level
+        settings = ''
+        if len(clickhouse_settings) > 0:
+            settings = '&'.join(['%s=%s' % pair for pair in list(clickhouse_settings.items())])
+        if compress_response:
+            settings += '&enable_http_compression=1'
+
+        # the parts of the requests which are the same for all calls
+        header = 'Host: %s:%s\r\n' % (self.host, self.port)
+        if auth_method == 'legacy':
+            credentials = base64.b64encode((username + ':' + password).encode('ISO-8859-1')).decode('ascii')
+            header += 'Authorization: Basic %s\r\n' % credentials
+        elif auth_method == 'x':
+            header += 'X-ClickHouse-User: %s\r\nX-ClickHouse-Key: %s\r\n' % (username, password)
+        if compress_response:
+            header += 'Accept-Encoding: gzip, deflate\r\n'
+        if compression is not None:
+            header += 'Content-Encoding: %s\r\n' % compression
+        self._get = ('GET / HTTP/1.1\r\n%s\r\n' % header).encode('latin-1')
+        self._post = ('POST /?%s HTTP/1.1\r\n%s' % (settings, header)).encode('latin-1')
+
+        self.idle = []
+        self.semaphore = asyncio.Semaphore(pool_maxsize)
+
+    def cursor(self):
+        """
+        :return: an AsyncCursor
+        """
+        return AsyncCursor(self)
+
+    async def open(self):
+        """
+        Check whether Clickhouse is responding and raise an Exception if it isn't.
+        """
+        r = await self._call()
+        if r.content != b'Ok.\n':
+            raise Exception('Clickhouse not responding')
+
+    async def close(self):
+        """
+        Close the idle TCP connections of the pool.
+        """
+        idle = self.idle
+        self.idle = []
+        for reader, writer in idle:
+            writer.close()
+        for reader, writer in idle:
+            try:
+                await writer.wait_closed()
+            except Exception:
+                pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    def _wait(self, awaitable):
+        return asyncio.wait_for(awaitable, self.timeout)
+
+    async def _call(self, query=None, payload=None, stream=False):
+        """
+        Private method, use AsyncCursor to make calls to Clickhouse.
+
+        The payload can be a string, bytes or an iterable of byte chunks, which is sent with chunked transfer
+        encoding, see Connection._call. If stream is True, the body of the response has to be received by the caller
+        with iter_content, otherwise it is available as the content of the response.
+        """
+        if query is None:
+            head, body, chunks = self._get, None, None
+        else:
+            if isinstance(query, str):
+                query = query.encode('utf8')
+            if payload is None:
+                body = query
+                chunks = None
+            elif isinstance(payload, (str, bytes)):
+                if isinstance(payload, str):
+                    if not payload.endswith('\n'):
+                        payload = payload + '\n'
+                    payload = payload.encode('utf8')
+                body = query + b'\n' + payload
+                chunks = None
+            else:
+                body = None
+                chunks = itertools.chain([query + b'\n'], payload)
+            if self.compression is not None:
+                compressed = compress_chunks([body] if body is not None else chunks, self.compression,
+                                             self.compression_level)
+                if body is not None:
+                    body = b''.join(compressed)
+                else:
+                    chunks = compressed
+            if body is not None:
+                head = self._post + b'Content-Length: %d\r\n\r\n' % len(body)
+            else:
+                head = self._post + b'Transfer-Encoding: chunked\r\n\r\n'
+
+        await self.semaphore.acquire()
+        try:
+            r = await self._request(head, body, chunks)
+        except BaseException:
+            self.semaphore.release()
+            raise
+        if not stream or not r.ok:
+            await r.read()
+        if not r.ok:
+            raise Exception('Query %s raised error %s' % (query.decode('utf8', 'replace'), r.content))
+        return r
+
+    async def _request(self, head, body, chunks):
+        """
+        Send the request and receive the status and headers of the response. A request which can be repeated is sent
+        again on a new TCP connection, if the pooled one has been closed by the server in the meantime.
+        """
+        while True:
+            reader, writer, reused = await self._connect()
+            try:
+                writer.write(head)
+                if chunks is None:
+                    if body is not None:
+                        writer.write(body)
+                else:
+                    for chunk in chunks:
+                        if len(chunk) > 0:
+                            writer.write(b'%x\r\n' % len(chunk))
+                            writer.write(chunk)
+                            writer.write(b'\r\n')
+                            await self._wait(writer.drain())
+                    writer.write(b'0\r\n\r\n')
+                await self._wait(writer.drain())
+                status_code, headers = await self._readhead(reader)
+                return AsyncResponse(self, reader, writer, status_code, headers)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                writer.close()
+                if not reused or chunks is not None:
+                    raise
+            except BaseException:
+                writer.close()
+                raise
+
+    async def _readhead(self, reader):
+        line = await self._wait(reader.readline())
+        if len(line) == 0:
+            raise ConnectionError('Connection closed by Clickhouse')
+        status_code = int(line.split(None, 2)[1])
+        headers = CaseInsensitiveDict()
+        while True:
+            line = await self._wait(reader.readline())
+            if line in (b'\r\n', b'\n', b''):
+                return status_code, headers
+            name, value = line.decode('latin-1').split(':', 1)
+            headers[name.strip()] = value.strip()
+
+    async def _connect(self):
+        """
+        :return: tuple of the streams of an idle pooled TCP connection, or a new one, and whether it was pooled
+        """
+        while len(self.idle) > 0:
+            reader, writer = self.idle.pop()
+            if not writer.is_closing() and not reader.at_eof():
+                return reader, writer, True
+            writer.close()
+        reader, writer = await self._wait(asyncio.open_connection(self.host, self.port, ssl=self.ssl))
+        return reader, writer, False
+
+    def _release(self, reader, writer, reusable):
+        if reusable:
+            self.idle.append((reader, writer))
+        else:
+            writer.close()
+        self.semaphore.release()
+
+
+class AsyncCursor(object):
+    """
+    Like Cursor, but the methods executing queries are coroutines, to be awaited in an asyncio event loop. The same
+    formatters are used, and the attributes select_format, insert_format, row_format, max_batch_bytes,
+    max_batch_rows and stream_chunk_size have the same meaning. The rows of a select are fetched with fetchone,
+    fetchmany, fetchall or by iterating over the cursor, as with Cursor, or streamed with iter_select.
+
+    cursor = AsyncConnection('localhost:8123').cursor()
+    await cursor.select('SELECT number FROM system.numbers LIMIT %s', 10)
+    rows = cursor.fetchall()
+    async for row in cursor.iter_select('SELECT number FROM system.numbers LIMIT 10'):
+        ...
+    """
+
+    fetchone = Cursor.fetchone
+    fetchmany = Cursor.fetchmany
+    fetchall = Cursor.fetchall
+    __iter__ = Cursor.__iter__
+    _setresult = Cursor._setresult
+    _parsedresult = Cursor._parsedresult
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.lastresult = None
+        self.lastparsedresult = None
+        self.formatter = TabSeparatedWithNamesAndTypesFormatter()
+        self.rowbinaryformatter = RowBinaryWithNamesAndTypesFormatter()
+        self.select_format = 'TabSeparatedWithNamesAndTypes'
+        self.insert_format = 'TabSeparatedWithNamesAndTypes'
+        self.server_timezone = None
+        self.row_format = 'dict'
+        self.description = None
+        self.arraysize = 1
+        self.rowindex = -1
+        self.stream_chunk_size = 65536
+        self.max_batch_bytes = 2000000000
+        self.max_batch_rows = None
+
+    async def executewithpayload(self, query, payload, parseresult, *args):
+        """
+        Private method.
+        """
+        if args is not None and len(args) > 0:
+            query = query % tuple([Cursor._escapeparameter(x) for x in args])
+        self._setresult(await self.connection._call(query, payload), parseresult)
+
+    async def select(self, query, *args):
+        """
+        Execute a select query, see Cursor.select.
+        """
+        if re.match(r'^.+?\s+format\s+\w+$', query.lower()) is None:
+            if self.select_format not in ['TabSeparatedWithNamesAndTypes', 'RowBinaryWithNamesAndTypes']:
+                raise Exception('Format %s is not supported by select' % self.select_format)
+            await self.executewithpayload(query + ' FORMAT ' + self.select_format, None, True, *args)
+        else:
+            await self.executewithpayload(query, None, False, *args)
+
+    async def iter_select(self, query, *args):
+        """
+        Execute a select query and asynchronously iterate over its resulting rows while the response is still being
+        received, see Cursor.iter_select. If you stop the iteration early, close the iterator (e.g. using
+        contextlib.aclosing), so that the TCP connection is freed immediately.
+        """
+        if re.match(r'^.+?\s+format\s+\w+$', query.lower()) is None:
+            query += ' FORMAT TabSeparatedWithNamesAndTypes'
+        elif re.match(r'^.+?\s+format\s+tabseparatedwithnamesandtypes$', query.lower()) is None:
+            raise Exception('Only FORMAT TabSeparatedWithNamesAndTypes is supported by iter_select')
+        if args is not None and len(args) > 0:
+            query = query % tuple([Cursor._escapeparameter(x) for x in args])
+        r = await self.connection._call(query, None, stream=True)
+        try:
+            fields = None
+            parse = None
+            pending = b''
+            async for chunk in r.iter_content(self.stream_chunk_size):
+                lines = (pending + chunk).split(b'\n')
+                pending = lines.pop()
+                for line in lines:
+                    if parse is not None:
+                        yield parse(line)
+                    elif fields is None:
+                        fields = line.decode('utf8').split('\t')
+                    else:
+                        parse = self.formatter.make_line_parser(fields, line.decode('utf8').split('\t'),
+                                                                self.row_format)
+            if parse is None:
+                raise Exception('Unexpected error, no result')
+            if len(pending) > 0:
+                yield parse(pending)
+        finally:
+            r.close()
+
+    async def insert(self, query, *args):
+        """
+        Execute an insert query with data packed inside of the query parameter.
+        """
+        await self.executewithpayload(query, None, False, *args)
+
+    async def ddl(self, query, *args):
+        """
+        Execute a DDL statement or other query, which doesn't return a result.
+        """
+        await self.executewithpayload(query, None, False, *args)
+
+    async def bulkinsert(self, table, values, fields=None, types=None):
+        """
+        Insert a list of dictionaries or python objects, see Cursor.bulkinsert. Note that the values are encoded in the
+        event loop. If values is not a list or tuple, it is passed to bulkinsert_stream.
+        """
+        if not isinstance(values, (list, tuple)):
+            return await self.bulkinsert_stream(table, values, fields, types)
+        if len(values) == 0:
+            raise Exception('No data in rows')
+        if self.insert_format == 'RowBinaryWithNamesAndTypes':
+            fields, types = await self._binaryschema(table, values[0], fields, types)
+            payloads = self.rowbinaryformatter.iter_batches(values, fields, types, self.max_batch_bytes,
+                                                            self.max_batch_rows, await self._servertimezone())
+        elif self.insert_format == 'TabSeparatedWithNamesAndTypes':
+            fields, types = self.formatter.infer_schema(values, fields, types)
+            payloads = self.formatter.iter_batches(values, fields, types, self.max_batch_bytes, self.max_batch_rows)
+        else:
+            raise Exception('Format %s is not supported by bulkinsert' % self.insert_format)
+        query = 'INSERT INTO %s (%s) FORMAT %s' % (table, ','.join(fields), self.insert_format)
+        for payload in payloads:
+            await self.executewithpayload(query, payload, False)
+
+    async def bulkinsert_stream(self, table, values, fields=None, types=None):
+        """
+        Insert the rows of any iterable, which are encoded and sent while the iterable is consumed, see
+        Cursor.bulkinsert_stream.
+        """
+        if self.insert_format == 'RowBinaryWithNamesAndTypes':
+            if fields is None or types is None:
+                values = iter(values)
+                try:
+                    first = next(values)
+                except StopIteration:
+                    raise Exception('No data in rows')
+                values = itertools.chain([first], values)
+                fields, types = await self._binaryschema(table, first, fields, types)
+            chunks = self.rowbinaryformatter.iter_format(values, fields, types, await self._servertimezone(),
+                                                         self.stream_chunk_size)
+        elif self.insert_format == 'TabSeparatedWithNamesAndTypes':
+            fields, types, chunks = self.formatter.iter_format(values, fields, types, self.stream_chunk_size)
+        else:
+            raise Exception('Format %s is not supported by bulkinsert' % self.insert_format)
+        await self.executewithpayload('INSERT INTO %s (%s) FORMAT %s' %
+                                      (table, ','.join(fields), self.insert_format), chunks, False)
+
+    async def get_schema(self, table):
+        """
+        :return: tuple of the list of the column names and the list of their types, see Cursor.get_schema
+        """
+        table = table.split('.')
+        if len(table) > 2:
+            raise Exception('%s is an invalid table name' % table)
+        database, tablename = table if len(table) == 2 else ('default', table[0])
+        result = await self._selectdicts('select name, type from system.columns where database=%s and table=%s',
+                                         database, tablename)
+        return [x['name'] for x in result], [x['type'] for x in result]
+
+    async def _selectdicts(self, query, *args):
+        row_format = self.row_format
+        self.row_format = 'dict'
+        try:
+            await self.select(query, *args)
+        finally:
+            self.row_format = row_format
+        return self.fetchall()
+
+    async def _binaryschema(self, table, first, fields, types):
+        if fields is None:
+            fields = list(self.formatter.adapter.getfields(first))
+        if types is None:
+            table_fields, table_types = await self.get_schema(table)
+            schema = dict(zip(table_fields, table_types))
+            for field in fields:
+                if field not in schema:
+                    raise Exception('Column %s does not exist in %s' % (field, table))
+            types = [schema[f] for f in fields]
+        return fields, types
+
+    async def _servertimezone(self):
+        if self.server_timezone is None:
+            self.server_timezone = (await self._selectdicts('select timezone() as tz'))[0]['tz']
+        return self.server_timezone
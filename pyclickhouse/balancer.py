@@ -0,0 +1,208 @@
+import http.client
+import logging
+import threading
+import time
+
+import requests
+
+from pyclickhouse.Cursor import Cursor
+from pyclickhouse.adaptive import error_code, TOO_MANY_SIMULTANEOUS_QUERIES
+
+
+# errors meaning that the node, not the query, has a problem
+_NODE_ERRORS = (requests.exceptions.RequestException, OSError, http.client.HTTPException)
+
+POLICIES = ['round_robin', 'least_outstanding', 'ewma']
+
+
+class _Node(object):
+    def __init__(self, connection):
+        self.connection = connection
+        self.outstanding = 0
+        self.latency = None
+        self.failures = 0
+        self.ejected_until = None
+        self.ejection_time = None
+
+
+class Balancer(object):
+    """
+    Distributes the calls of Cursors over several Connections to replicas of the same data, set it as the balancer
+    attribute of a Cursor (or create the Cursor with the cursor method). One Balancer should be shared by all Cursors
+    using the same replicas, so that the state of the nodes is shared too. The policy chooses the node for each call:
+
+    - 'round_robin': the nodes in turn, like a Cursor without Balancer
+    - 'least_outstanding': the node with the fewest calls in progress
+    - 'ewma': the node with the lowest exponentially weighted moving average of the latency of its calls, multiplied
+      by its calls in progress plus one, so that a slow replica gets less of the load
+
+    After max_failures consecutive connection errors or timeouts (or refusals because of too many simultaneous
+    queries), a node is ejected for ejection_time seconds and the call is retried on another node, if its payload
+    can be sent again. A background thread pings the ejected nodes when their time is over, and readmits them if they
+    respond; otherwise the ejection time is doubled, up to max_ejection_time. Errors of the queries themselves are
+    raised immediately. If all nodes are ejected, the one which will be readmitted first is used anyway.
+
+    balancer = Balancer([Connection('replica1:8123'), Connection('replica2:8123')], policy='ewma')
+    cursor = balancer.cursor()
+    """
+
+    def __init__(self, connections, policy='least_outstanding', max_failures=1, ejection_time=5.0,
+                 max_ejection_time=300.0, max_tries=3, decay=0.3):
+        """
+        :param connections: list of the Connections to the replicas
+        :param policy: 'round_robin', 'least_outstanding' or 'ewma'
+        :param max_failures: number of consecutive failures of a node after which it is ejected
+        :param ejection_time: seconds a node is ejected for at first
+        :param max_ejection_time: maximal number of seconds a node is ejected for
+        :param max_tries: maximal number of nodes a call is sent to
+        :param decay: weight of the latest latency in the moving average of the latency of a node
+        """
+        if policy not in POLICIES:
+            raise Exception('Policy %s is not supported by Balancer' % policy)
+        if len(connections) == 0:
+            raise Exception('No connections to balance')
+        self.connections = list(connections)
+        self.nodes = [_Node(c) for c in self.connections]
+        self.policy = policy
+        self.max_failures = max_failures
+        self.ejection_time = ejection_time
+        self.max_ejection_time = max_ejection_time
+        self.max_tries = max_tries
+        self.decay = decay
+        self.index = 0
+        self.lock = threading.Lock()
+        self.prober = None
+        self.stopped = threading.Event()
+
+    def cursor(self):
+        """
+        :return: a Cursor using this Balancer
+        """
+        cursor = Cursor(list(self.connections))
+        cursor.balancer = self
+        return cursor
+
+    def call(self, query, payload, stream=False):
+        """
+        Call Connection._call of the chosen node, see the class description.
+        """
+        replayable = payload is None or isinstance(payload, (str, bytes))
+        tries = min(self.max_tries, len(self.nodes)) if replayable else 1
+        tried = []
+        while True:
+            node = self._choose(tried)
+            tried.append(node)
+            start = time.time()
+            try:
+                r = node.connection._call(query, payload, stream)
+            except Exception as e:
+                if not isinstance(e, _NODE_ERRORS) and error_code(e) != TOO_MANY_SIMULTANEOUS_QUERIES:
+                    self._done(node, None)
+                    raise
+                self._done(node, e)
+                if len(tried) >= tries:
+                    raise
+                logging.warning('Retrying query on another node after %s' % e)
+            else:
+                self._done(node, time.time() - start)
+                return r
+
+    def close(self):
+        """
+        Stop the background thread probing the ejected nodes. If the Balancer is used afterwards and a node is
+        ejected, the thread is started again.
+        """
+        self.stopped.set()
+        prober = self.prober
+        if prober is not None:
+            prober.join()
+
+    def _choose(self, tried):
+        with self.lock:
+            now = time.time()
+            candidates = [n for n in self.nodes if n not in tried and n.ejected_until is None]
+            if len(candidates) == 0:
+                candidates = [n for n in self.nodes if n not in tried] or self.nodes
+                candidates = [min(candidates, key=lambda n: n.ejected_until or now)]
+            self.index += 1
+            offset = self.index % len(candidates)
+            # the rotation breaks ties between equally good nodes
+            candidates = candidates[offset:] + candidates[:offset]
+            if self.policy == 'least_outstanding':
+                node = min(candidates, key=lambda n: n.outstanding)
+            elif self.policy == 'ewma':
+                # a node without latency yet (e.g. just readmitted) is assumed to be as fast as the average node,
+                # instead of getting all calls until its first one has finished
+                known = [n.latency for n in self.nodes if n.latency is not None]
+                default = sum(known) / len(known) if len(known) > 0 else 1.0
+                node = min(candidates,
+                           key=lambda n: (default if n.latency is None else n.latency) * (n.outstanding + 1))
+            else:
+                node = candidates[0]
+            node.outstanding += 1
+            return node
+
+    def _done(self, node, result):
+        """
+        :param result: the latency of a successful call, the exception of a failed one, or None for an error of the
+        query
+        """
+        with self.lock:
+            node.outstanding -= 1
+            if isinstance(result, Exception):
+                node.failures += 1
+                if node.ejected_until is None and node.failures >= self.max_failures:
+                    node.ejection_time = self.ejection_time
+                    node.ejected_until = time.time() + node.ejection_time
+                    logging.warning('Ejecting %s:%s for %.1f seconds after %s' %
+                                    (node.connection.host, node.connection.port, node.ejection_time, result))
+                    self._startprober()
+                return
+            node.failures = 0
+            if result is not None:
+                node.latency = result if node.latency is None else \
+                    self.decay * result + (1 - self.decay) * node.latency
+            if node.ejected_until is not None:
+                # the node has been used because all nodes were ejected
+                self._readmit(node)
+
+    def _readmit(self, node):
+        node.ejected_until = None
+        node.ejection_time = None
+        node.failures = 0
+        # its latency before the ejection is outdated
+        node.latency = None
+
+    def _startprober(self):
+        if self.prober is None or not self.prober.is_alive():
+            self.stopped.clear()
+            self.prober = threading.Thread(target=self._probe, name='pyclickhouse-balancer')
+            self.prober.daemon = True
+            self.prober.start()
+
+    def _probe(self):
+        while not self.stopped.is_set():
+            with self.lock:
+                ejected = [n for n in self.nodes if n.ejected_until is not None]
+                if len(ejected) == 0:
+                    self.prober = None
+                    return
+                now = time.time()
+                due = [n for n in ejected if n.ejected_until <= now]
+                wait = min(n.ejected_until for n in ejected) - now
+            for node in due:
+                try:
+                    alive = node.connection.ping()
+                except Exception:
+                    alive = False
+                with self.lock:
+                    if node.ejected_until is None:
+                        continue
+                    if alive:
+                        logging.info('Readmitting %s:%s' % (node.connection.host, node.connection.port))
+                        self._readmit(node)
+                    else:
+                        node.ejection_time = min(self.max_ejection_time, node.ejection_time * 2)
+                        node.ejected_until = time.time() + node.ejection_time
+            if len(due) == 0:
+                self.stopped.wait(wait)
@@ -0,0 +1,187 @@
+import atexit
+import logging
+import threading
+import time
+
+from pyclickhouse.adaptive import transient
+
+
+class BufferedInserter(object):
+    """
+    Collects rows to insert into one table in memory and inserts them with bulkinsert from a background thread,
+    so that services producing single rows (e.g. one per event) cause neither a round-trip nor a new part on the server
+    per row. The buffered rows are flushed when there are max_rows of them, when their estimated size reaches
+    max_bytes, or when the oldest of them has waited for max_age seconds.
+
+    The inserter can be used from many threads at once. Call close (or use it as a context manager) to flush the
+    remaining rows and stop the thread; this also happens automatically when the interpreter exits.
+
+    If an insert fails because of a transient error (see pyclickhouse.adaptive.transient), the error is logged and the
+    rows are kept in the buffer to be retried max_age seconds later, at most max_retries times in a row. Rows which
+    cannot be inserted otherwise are passed to on_failure, or logged and dropped, so that a bad row doesn't block the
+    rows buffered after it. close and flush raise the error too.
+
+    inserter = BufferedInserter(pyclickhouse.Connection('localhost:8123'), 'events')
+    inserter.insert({'id': 1, 'name': 'click'})
+    """
+
+    def __init__(self, connection, table, fields=None, types=None, max_rows=100000, max_bytes=50000000,
+                 max_age=1.0, max_retries=10, on_failure=None):
+        """
+        :param connection: the Connection to insert with. A Cursor of its own is used by the inserter.
+        :param table: Target table for inserting data, which can be optionally prepended with a database name.
+        :param fields: optional list of fields to insert, see Cursor.bulkinsert
+        :param types: optional list of Clickhouse types of the fields, see Cursor.bulkinsert
+        :param max_rows: number of buffered rows triggering a flush
+        :param max_bytes: estimated size of the buffered rows triggering a flush
+        :param max_age: number of seconds after which a buffered row is flushed at the latest
+        :param max_retries: number of consecutive failed inserts after which the rows are given up
+        :param on_failure: optional callable receiving the rows which are given up and the exception, e.g. to write
+        them to a dead letter queue
+        """
+        self.cursor = connection.cursor()
+        self.table = table
+        self.fields = fields
+        self.types = types
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.max_retries = max_retries
+        self.on_failure = on_failure
+        self.failures = 0
+        self.rows = []
+        self.size = 0
+        self.oldest = None
+        self.closed = False
+        self.last_error = None
+        self.condition = threading.Condition()
+        self.stopped = threading.Event()
+        self.flushlock = threading.Lock()
+        self.thread = threading.Thread(target=self._run, name='pyclickhouse-bufferedinserter')
+        self.thread.daemon = True
+        self.thread.start()
+        atexit.register(self.close)
+
+    def insert(self, row):
+        """
+        Add a dictionary or python object to the buffer.
+        """
+        self.insert_many([row])
+
+    def insert_many(self, rows):
+        """
+        Add a list of dictionaries or python objects to the buffer.
+        """
+        size = sum(self._estimate_size(r) for r in rows)
+        with self.condition:
+            if self.closed:
+                raise Exception('BufferedInserter of %s is closed' % self.table)
+            first = self.oldest is None
+            if first:
+                self.oldest = time.time()
+            self.rows.extend(rows)
+            self.size += size
+            # the background thread has to start waiting for max_age with the first row
+            if first or self._due():
+                self.condition.notify()
+
+    def flush(self):
+        """
+        Insert the buffered rows now, in the calling thread.
+        """
+        with self.flushlock:
+            rows = self._take()
+            self._insert(rows, True)
+
+    def close(self):
+        """
+        Flush the remaining rows and stop the background thread. Further inserts raise an exception.
+        """
+        with self.condition:
+            if self.closed:
+                return
+            self.closed = True
+            self.condition.notify()
+        self.stopped.set()
+        self.thread.join()
+        atexit.unregister(self.close)
+        self.flush()
+
+    def _due(self):
+        return len(self.rows) >= self.max_rows or self.size >= self.max_bytes or (
+                self.oldest is not None and time.time() - self.oldest >= self.max_age)
+
+    def _take(self):
+        with self.condition:
+            rows = self.rows
+            self.rows = []
+            self.size = 0
+            self.oldest = None
+            return rows
+
+    def _insert(self, rows, raise_error):
+        """
+        :return: False if the insert failed and the rows have been put back into the buffer
+        """
+        if len(rows) == 0:
+            return True
+        try:
+            self.cursor.bulkinsert(self.table, rows, self.fields, self.types)
+            self.last_error = None
+            self.failures = 0
+            return True
+        except Exception as e:
+            self.last_error = e
+            self.failures += 1
+            if transient(e) and self.failures <= self.max_retries:
+                # keep the rows in front of the ones buffered meanwhile, to retry them with the next flush
+                with self.condition:
+                    self.rows[:0] = rows
+                    self.size += sum(self._estimate_size(r) for r in rows)
+                    self.oldest = time.time()
+                if raise_error:
+                    raise
+                logging.exception('Cannot insert %d buffered rows into %s, retrying later' % (len(rows), self.table))
+                return False
+            self.failures = 0
+            self._giveup(rows, e)
+            if raise_error:
+                raise
+            return True
+
+    def _giveup(self, rows, exception):
+        if self.on_failure is None:
+            logging.error('Dropping %d buffered rows which cannot be inserted into %s: %s' %
+                          (len(rows), self.table, exception))
+            return
+        try:
+            self.on_failure(rows, exception)
+        except Exception:
+            logging.exception('on_failure of BufferedInserter of %s failed' % self.table)
+
+    def _estimate_size(self, row):
+        """
+        Roughly estimate the number of bytes the row takes in the payload of an insert.
+        """
+        adapter = self.cursor.formatter.adapter
+        fields = self.fields if self.fields is not None else adapter.getfields(row)
+        return sum(len(str(adapter.getval(row, f))) + 1 for f in fields)
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self.closed and not self._due():
+                    timeout = None if self.oldest is None else self.oldest + self.max_age - time.time()
+                    self.condition.wait(timeout)
+                if self.closed:
+                    return
+            with self.flushlock:
+                inserted = self._insert(self._take(), False)
+            if not inserted:
+                self.stopped.wait(self.max_age)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
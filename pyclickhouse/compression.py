@@ -0,0 +1,83 @@
+import zlib
+import logging
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+    logging.info('zstandard is not installed, zstd compression is not available.')
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+    logging.info('lz4 is not installed, lz4 compression is not available.')
+
+
+COMPRESSION_METHODS = ['gzip', 'deflate', 'zstd', 'lz4']
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class _LZ4Compressor(object):
+    def __init__(self, level):
+        self.compressor = lz4.frame.LZ4FrameCompressor(compression_level=level or 0)
+        self.started = False
+
+    def compress(self, data):
+        if not self.started:
+            self.started = True
+            return self.compressor.begin() + self.compressor.compress(data)
+        return self.compressor.compress(data)
+
+    def flush(self):
+        if not self.started:
+            self.started = True
+            return self.compressor.begin() + self.compressor.flush()
+        return self.compressor.flush()
+
+
+def make_compressor(method, level=None):
+    """
+    Return a compressor object with the methods compress(data) and flush(), producing the data for the passed
+    Content-Encoding.
+    :param level: optional compression level, the default of the compression library is used if omitted
+    """
+    if method == 'gzip':
+        return zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION if level is None else level, zlib.DEFLATED,
+                                16 + zlib.MAX_WBITS)
+    if method == 'deflate':
+        return zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION if level is None else level)
+    if method == 'zstd':
+        if zstandard is None:
+            raise Exception('Please install zstandard to use zstd compression')
+        return zstandard.ZstdCompressor(level=3 if level is None else level).compressobj()
+    if method == 'lz4':
+        if lz4 is None:
+            raise Exception('Please install lz4 to use lz4 compression')
+        return _LZ4Compressor(level)
+    raise Exception('Compression %s is not supported, use one of %s' % (method, ', '.join(COMPRESSION_METHODS)))
+
+
+def iter_slices(data, size=CHUNK_SIZE):
+    """
+    Yield the passed bytes in slices of the passed size, without copying them.
+    """
+    view = memoryview(data)
+    for start in range(0, len(view), size):
+        yield view[start:start + size]
+
+
+def compress_chunks(chunks, method, level=None):
+    """
+    Compress an iterable of byte chunks and yield the compressed chunks as soon as the compressor produces them, so
+    that the compressed data never has to be held in memory as a whole.
+    """
+    compressor = make_compressor(method, level)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    data = compressor.flush()
+    if data:
+        yield data
@@ -0,0 +1,194 @@
+import contextlib
+import threading
+import time
+
+from pyclickhouse.Connection import Connection
+from pyclickhouse.Cursor import Cursor
+from pyclickhouse.balancer import Balancer
+
+
+# attributes of a Cursor holding the state of its queries and connections rather than settings
+_CURSOR_STATE = frozenset(['lastresult', 'lastparsedresult', 'description', 'rowindex', 'connections',
+                           'failed_connections', 'connection_index', 'connectionlock', 'server_timezone'])
+
+class ConnectionPool(object):
+    """
+    Hands out Cursors to the threads of a multi-threaded service. A Cursor keeps the state of its last query and
+    must not be used by several threads at once, and creating Connections and Cursors per request is wasteful. The
+    pool creates one Connection with its own requests Session (or transport) per host, which is not affected by
+    Connection.reopensession, and lends at most maxsize Cursors at a time. Returned Cursors are reused.
+
+    pool = ConnectionPool(['replica1:8123', 'replica2:8123'], maxsize=20)
+    with pool.cursor() as cursor:
+        cursor.select('SELECT 1')
+        cursor.fetchall()
+
+    If all Cursors are lent, cursor and acquire wait until one is returned, at most timeout seconds, after which an
+    exception is raised. stats returns the current and cumulated utilisation of the pool.
+    """
+
+    def __init__(self, hosts, maxsize=10, timeout=None, cursor_attributes=None, balancer=None, **connection_args):
+        """
+        :param hosts: 'host:port' of Clickhouse, or a list of them for replicas, which the Cursors use in turn
+        :param maxsize: maximal number of Cursors lent at once. It is also the size of the pool of TCP connections
+        of each host.
+        :param timeout: default number of seconds to wait for a Cursor, or None to wait as long as necessary
+        :param cursor_attributes: optional dictionary of attributes to set on each Cursor (e.g. {'row_format':
+        'tuple'}). When a Cursor is returned, all its settings (e.g. row_format, select_format, insert_format,
+        max_batch_bytes, hedging) are restored to these values or the defaults, so that changes made by a borrower
+        don't leak to the next one.
+        :param balancer: optional policy of a Balancer shared by the Cursors (see Balancer), e.g. 'ewma'
+        :param connection_args: further arguments of the Connections, e.g. username, password or transport
+        """
+        if isinstance(hosts, str):
+            hosts = [hosts]
+        self.connections = [Connection(host, pool_maxsize=maxsize, use_own_session=True, **connection_args)
+                            for host in hosts]
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.cursor_attributes = cursor_attributes or {}
+        self.balancer = Balancer(self.connections, policy=balancer) if balancer is not None else None
+        self.idle = []
+        self.settings = dict()
+        self.lent = set()
+        self.in_use = 0
+        self.waiting = 0
+        self.condition = threading.Condition()
+        self.closed = False
+        # cumulated statistics
+        self.acquired = 0
+        self.timeouts = 0
+        self.wait_time = 0.0
+        self.max_in_use = 0
+        self.created = 0
+
+    def acquire(self, block=True, timeout=-1):
+        """
+        Borrow a Cursor, which has to be returned with release.
+        :param block: False to raise an exception immediately if all Cursors are lent
+        :param timeout: seconds to wait for a Cursor; by default, the timeout of the pool
+        :return: a Cursor
+        """
+        if timeout == -1:
+            timeout = self.timeout
+        start = time.time()
+        with self.condition:
+            if self.closed:
+                raise Exception('ConnectionPool is closed')
+            if self.in_use >= self.maxsize:
+                if not block:
+                    self.timeouts += 1
+                    raise Exception('All %d cursors of the ConnectionPool are in use' % self.maxsize)
+                self.waiting += 1
+                try:
+                    available = self.condition.wait_for(lambda: self.in_use < self.maxsize or self.closed, timeout)
+                finally:
+                    self.waiting -= 1
+                    self.wait_time += time.time() - start
+                if self.closed:
+                    raise Exception('ConnectionPool is closed')
+                if not available:
+                    self.timeouts += 1
+                    raise Exception('No cursor of the ConnectionPool became available within %s seconds' % timeout)
+            self.in_use += 1
+            self.acquired += 1
+            self.max_in_use = max(self.max_in_use, self.in_use)
+            if len(self.idle) > 0:
+                cursor = self.idle.pop()
+                self.lent.add(id(cursor))
+                return cursor
+            self.created += 1
+        try:
+            cursor = self._newcursor()
+            with self.condition:
+                self.lent.add(id(cursor))
+            return cursor
+        except Exception:
+            with self.condition:
+                self.in_use -= 1
+                self.condition.notify()
+            raise
+
+    def release(self, cursor):
+        """
+        Return a Cursor borrowed with acquire. Returning it twice, or a Cursor not borrowed from this pool, raises an
+        exception.
+        """
+        with self.condition:
+            if id(cursor) not in self.lent:
+                raise Exception('The Cursor has not been borrowed from the ConnectionPool or is already returned')
+            self.lent.remove(id(cursor))
+        self._reset(cursor)
+        with self.condition:
+            self.in_use -= 1
+            if not self.closed:
+                self.idle.append(cursor)
+            self.condition.notify()
+
+    @contextlib.contextmanager
+    def cursor(self, block=True, timeout=-1):
+        """
+        Borrow a Cursor for the duration of a with statement, see acquire.
+        """
+        cursor = self.acquire(block, timeout)
+        try:
+            yield cursor
+        finally:
+            self.release(cursor)
+
+    def stats(self):
+        """
+        :return: dictionary of the utilisation of the pool: the number of Cursors in_use, idle and of threads waiting
+        for one, the utilisation (in_use / maxsize), and since the creation of the pool: the max_in_use, the number
+        of Cursors acquired and created, the number of timeouts and the total wait_time in seconds
+        """
+        with self.condition:
+            return {'maxsize': self.maxsize, 'in_use': self.in_use, 'idle': len(self.idle), 'waiting': self.waiting,
+                    'utilisation': float(self.in_use) / self.maxsize, 'max_in_use': self.max_in_use,
+                    'acquired': self.acquired, 'created': self.created, 'timeouts': self.timeouts,
+                    'wait_time': self.wait_time}
+
+    def close(self):
+        """
+        Close the Connections of the pool. Waiting threads and further acquisitions raise an exception.
+        """
+        with self.condition:
+            self.closed = True
+            self.idle = []
+            self.settings = dict()
+            self.condition.notify_all()
+        if self.balancer is not None:
+            self.balancer.close()
+        for connection in self.connections:
+            connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _newcursor(self):
+        cursor = Cursor(list(self.connections))
+        cursor.balancer = self.balancer
+        for name, value in self.cursor_attributes.items():
+            setattr(cursor, name, value)
+        settings = dict((k, v) for k, v in vars(cursor).items() if k not in _CURSOR_STATE)
+        with self.condition:
+            self.settings[id(cursor)] = settings
+        return cursor
+
+    def _reset(self, cursor):
+        cursor.lastresult = None
+        cursor.lastparsedresult = None
+        cursor.description = None
+        cursor.rowindex = -1
+        with self.condition:
+            settings = self.settings.get(id(cursor))
+        if settings is None:
+            return  # the pool has been closed
+        for name in list(vars(cursor)):
+            if name not in _CURSOR_STATE and name not in settings:
+                delattr(cursor, name)
+        for name, value in settings.items():
+            setattr(cursor, name, value)
@@ -0,0 +1,150 @@
+import collections
+import multiprocessing
+import multiprocessing.pool
+
+from pyclickhouse.formatter import TabSeparatedWithNamesAndTypesFormatter
+from pyclickhouse.rowbinary import RowBinaryWithNamesAndTypesFormatter
+
+
+_FORMATTERS = {
+    'TabSeparatedWithNamesAndTypes': TabSeparatedWithNamesAndTypesFormatter,
+    'RowBinaryWithNamesAndTypes': RowBinaryWithNamesAndTypesFormatter,
+}
+
+# formatters of the worker process, one per insert format
+_worker_formatters = dict()
+
+
+def _make_formatter(insert_format):
+    if insert_format not in _FORMATTERS:
+        raise Exception('Format %s is not supported by EncodingPool' % insert_format)
+    return _FORMATTERS[insert_format]()
+
+
+def _encode_shard(insert_format, rows, fields, types, timezone, adapter):
+    """
+    Runs in a worker process. Encode the rows without the header.
+    :return: tuple of the encoded rows and their number
+    """
+    formatter = _worker_formatters.get(insert_format)
+    if formatter is None:
+        formatter = _worker_formatters[insert_format] = _make_formatter(insert_format)
+    if adapter is not None:
+        formatter.adapter = adapter
+    if insert_format == 'RowBinaryWithNamesAndTypes':
+        return formatter.format_rows(rows, fields, types, timezone), len(rows)
+    return formatter.format_rows(rows, fields, types), len(rows)
+
+
+class EncodingPool(object):
+    """
+    A pool of processes encoding the rows of bulkinsert in parallel, for when formatting in python, not Clickhouse,
+    is the bottleneck of inserts. Set it as the encoding_pool attribute of a Cursor to use it for bulkinsert and
+    store_documents. The rows are split into shards of shard_rows rows, which are encoded in the worker processes and
+    joined into batches (see Cursor.max_batch_bytes) in the order of the rows. The pool is started on first use and
+    can (and should) be reused across calls and Cursors, so that the startup of the processes is amortised. Call
+    close when it is not needed anymore, or use it as a context manager.
+
+    Note that the rows have to be picklable to be sent to the worker processes, and that a custom adapter of the
+    formatter of the Cursor has to be picklable too.
+    """
+
+    def __init__(self, processes=None, shard_rows=10000, senders=1):
+        """
+        :param processes: number of worker processes, by default the number of CPUs
+        :param shard_rows: number of rows encoded at once by a worker process
+        :param senders: number of batches sent to Clickhouse concurrently by bulkinsert. With 1, the batches are
+        sent sequentially, while the workers encode the next ones.
+        """
+        self.processes = processes or multiprocessing.cpu_count()
+        self.shard_rows = shard_rows
+        self.senders = senders
+        self.pool = None
+        self.sendpool = None
+
+    def _start(self):
+        if self.pool is None:
+            self.pool = multiprocessing.Pool(self.processes)
+        return self.pool
+
+    def iter_batches(self, insert_format, rows, fields, types, max_batch_bytes, max_batch_rows=None, timezone=None,
+                     adapter=None):
+        """
+        Encode the rows in the worker processes and yield complete payloads (each including the header) of at most
+        about max_batch_bytes and max_batch_rows each. At most two shards per process are queued at a time, so that
+        the rows are not all copied to the workers at once.
+
+        :param insert_format: 'TabSeparatedWithNamesAndTypes' or 'RowBinaryWithNamesAndTypes'
+        :param rows: list of the rows to encode
+        :param timezone: timezone of the server, see RowBinaryWithNamesAndTypesFormatter.format
+        :param adapter: the adapter to read the fields of the rows with, or None for dictionaries
+        """
+        fields = list(fields)
+        types = list(types)
+        header = _make_formatter(insert_format).format_header(fields, types)
+        shard_rows = self.shard_rows if max_batch_rows is None else max(1, min(self.shard_rows, max_batch_rows))
+        pool = self._start()
+        pending = collections.deque()
+        batch = [header]
+        size = len(header)
+        count = 0
+        start = 0
+        while start < len(rows) or len(pending) > 0:
+            while start < len(rows) and len(pending) < 2 * self.processes:
+                pending.append(pool.apply_async(_encode_shard, (insert_format, rows[start:start + shard_rows], fields,
+                                                                types, timezone, adapter)))
+                start += shard_rows
+            body, numrows = pending.popleft().get()
+            if count > 0 and ((max_batch_bytes is not None and size + len(body) > max_batch_bytes) or
+                              (max_batch_rows is not None and count + numrows > max_batch_rows)):
+                yield b''.join(batch)
+                batch = [header]
+                size = len(header)
+                count = 0
+            batch.append(body)
+            size += len(body)
+            count += numrows
+        if count > 0:
+            yield b''.join(batch)
+
+    def send(self, call, batches):
+        """
+        Pass each batch to call, using senders threads if senders is larger than 1. If a call fails, no further
+        batches are sent, and the error is raised after the calls in progress have finished.
+        """
+        if self.senders <= 1:
+            for batch in batches:
+                call(batch)
+            return
+        if self.sendpool is None:
+            self.sendpool = multiprocessing.pool.ThreadPool(self.senders)
+        pending = collections.deque()
+        try:
+            for batch in batches:
+                if len(pending) >= self.senders:
+                    pending.popleft().get()
+                pending.append(self.sendpool.apply_async(call, (batch,)))
+            while len(pending) > 0:
+                pending.popleft().get()
+        except BaseException:
+            # no batch may still be in flight when the error is raised
+            for result in pending:
+                result.wait()
+            raise
+
+    def close(self):
+        """
+        Stop the worker processes and threads.
+        """
+        for pool in (self.pool, self.sendpool):
+            if pool is not None:
+                pool.close()
+                pool.join()
+        self.pool = None
+        self.sendpool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -3,21 +3,29 @@ import re
 import logging
 import numpy as np
 from dateutil import tz
-import ast
 
 import ujson
 
+from pyclickhouse.records import make_row_factory, project
+
 import sys
 import datetime as dt
 from decimal import Decimal
 
 import io
+import itertools
 
 try:
     import pandas as pd
 except:
     logging.info('Pandas is not installed, Cursor.select_as_dataframe is not available.')
 
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except:
+    logging.info('Pyarrow is not installed, the pyarrow engine of Cursor.select_as_dataframe is not available.')
+
 class NestingLevelTooHigh(Exception):
     pass
 
@@ -45,6 +53,252 @@ def parse_variant_types(s):
     return result
 
 
+def type_arguments(type):
+    """
+    Return the arguments of a parametrized type, without quotes, e.g. ['3', 'UTC'] for DateTime64(3, 'UTC')
+    """
+    return [x.replace("'", '').replace('\\', '').strip() for x in parse_variant_types(type[type.index('(') + 1:-1])]
+
+
+def tuple_element_types(type):
+    """
+    Return the types of the elements of a Tuple type, without the names of the elements, if any
+    """
+    result = []
+    for element in parse_variant_types(type[len('Tuple('):-1]):
+        named = re.match(r'^`?\w+`?\s+(\S.*)$', element)
+        result.append(named.group(1) if named is not None else element)
+    return result
+
+
+def _unescape(value):
+    return value.replace('\\n','\n').replace('\\t','\t').replace("\\'", "'").replace('\\\\','\\')
+
+
+def _identity(value):
+    return value
+
+
+_INT_TYPES = frozenset(['UInt8','UInt16', 'UInt32', 'UInt64','Int8','Int16','Int32','Int64'])
+
+_SCALAR_CLASSES = frozenset([str, bytes, int, float, bool, Decimal, dt.date])
+
+_VALIDATION_RES = {
+    'IPv4': re.compile(r'^[0-9]{1,3}\.[0-9]{1,3}\.[0-9]{1,3}\.[0-9]{1,3}$'),
+    'IPv6': re.compile(r'(([0-9a-fA-F]{1,4}:){7,7}[0-9a-fA-F]{1,4}|([0-9a-fA-F]{1,4}:){1,7}:|([0-9a-fA-F]{1,'
+                       r'4}:){1,6}:[0-9a-fA-F]{1,4}|([0-9a-fA-F]{1,4}:){1,5}(:[0-9a-fA-F]{1,4}){1,'
+                       r'2}|([0-9a-fA-F]{1,4}:){1,4}(:[0-9a-fA-F]{1,4}){1,3}|([0-9a-fA-F]{1,4}:){1,'
+                       r'3}(:[0-9a-fA-F]{1,4}){1,4}|([0-9a-fA-F]{1,4}:){1,2}(:[0-9a-fA-F]{1,4}){1,'
+                       r'5}|[0-9a-fA-F]{1,4}:((:[0-9a-fA-F]{1,4}){1,6})|:((:[0-9a-fA-F]{1,4}){1,7}|:)|fe80:(:['
+                       r'0-9a-fA-F]{0,4}){0,4}%[0-9a-zA-Z]{1,}|::(ffff(:0{1,4}){0,1}:){0,1}((25[0-5]|(2[0-4]|1{'
+                       r'0,1}[0-9]){0,1}[0-9])\.){3,3}(25[0-5]|(2[0-4]|1{0,1}[0-9]){0,1}[0-9])|([0-9a-fA-F]{1,'
+                       r'4}:){1,4}:((25[0-5]|(2[0-4]|1{0,1}[0-9]){0,1}[0-9])\.){3,3}(25[0-5]|(2[0-4]|1{0,'
+                       r'1}[0-9]){0,1}[0-9]))'),
+    'UUID': re.compile(r'[0-9a-fA-F\-]{32}'),
+}
+
+
+_LITERAL_ESCAPES = {'n': '\n', 't': '\t', 'r': '\r', 'b': '\b', 'f': '\f', '0': '\0', 'a': '\a', 'v': '\v',
+                    'e': '\x1b', '\\': '\\', "'": "'", '"': '"'}
+
+_TOKEN_RE = re.compile(r'[^,\]\)\}:\s]*')
+
+_NUMBER_TYPES = frozenset(['UInt8','UInt16', 'UInt32', 'UInt64','Int8','Int16','Int32','Int64', 'Float32',
+                           'Float64'])
+
+
+def _parse_quoted(text, pos):
+    """
+    Parse a quoted string literal starting at pos, as Clickhouse writes it inside of Arrays, Maps and Tuples.
+    """
+    quote = text[pos]
+    start = pos + 1
+    end = text.find(quote, start)
+    if end == -1:
+        raise Exception('Unterminated string at position %d of %s' % (pos, text))
+    if text.find('\\', start, end) == -1:
+        return text[start:end], end + 1
+    chars = []
+    pos = start
+    while True:
+        c = text[pos]
+        if c == '\\':
+            escaped = text[pos + 1]
+            if escaped == 'x':
+                chars.append(chr(int(text[pos + 2:pos + 4], 16)))
+                pos += 4
+            else:
+                chars.append(_LITERAL_ESCAPES.get(escaped, '\\' + escaped))
+                pos += 2
+        elif c == quote:
+            return ''.join(chars), pos + 1
+        else:
+            chars.append(c)
+            pos += 1
+
+
+def _parse_token(text, pos):
+    end = _TOKEN_RE.match(text, pos).end()
+    return text[pos:end], end
+
+
+def _parse_elements(text, pos, close, parse_element):
+    """
+    Parse the comma separated elements of a literal, starting at its opening bracket at pos and ending with the
+    close bracket.
+    """
+    result = []
+    pos += 1
+    while text[pos] == ' ':
+        pos += 1
+    if text[pos] == close:
+        return result, pos + 1
+    while True:
+        value, pos = parse_element(text, pos)
+        result.append(value)
+        while text[pos] == ' ':
+            pos += 1
+        c = text[pos]
+        pos += 1
+        if c == close:
+            return result, pos
+        if c != ',':
+            raise Exception('Unexpected %s at position %d of %s' % (c, pos - 1, text))
+        while text[pos] == ' ':
+            pos += 1
+
+
+def _parse_map_entry(parse_key, parse_value):
+    def parse_entry(text, pos):
+        key, pos = parse_key(text, pos)
+        while text[pos] == ' ':
+            pos += 1
+        if text[pos] != ':':
+            raise Exception('Unexpected %s at position %d of %s' % (text[pos], pos, text))
+        pos += 1
+        while text[pos] == ' ':
+            pos += 1
+        value, pos = parse_value(text, pos)
+        return (key, value), pos
+    return parse_entry
+
+
+def parse_literal(text, pos=0):
+    """
+    Parse an Array, Map, Tuple, string, number or NULL literal starting at pos without knowing its type.
+    :return: tuple of the python value and the position after the literal
+    """
+    c = text[pos]
+    if c == '[':
+        return _parse_elements(text, pos, ']', parse_literal)
+    if c == '{':
+        entries, pos = _parse_elements(text, pos, '}', _parse_untyped_map_entry)
+        return dict(entries), pos
+    if c == '(':
+        elements, pos = _parse_elements(text, pos, ')', parse_literal)
+        return tuple(elements), pos
+    if c == "'" or c == '"':
+        return _parse_quoted(text, pos)
+    token, pos = _parse_token(text, pos)
+    if token == '':
+        return '', pos # workaround empty string clickhouse bug
+    if token == 'NULL':
+        return None, pos
+    if token == 'true' or token == 'false':
+        return token == 'true', pos
+    try:
+        return int(token), pos
+    except ValueError:
+        return float(token), pos # raises if it is not a number either
+
+
+_parse_untyped_map_entry = _parse_map_entry(parse_literal, parse_literal)
+
+
+_DATE_CACHE_SIZE = 10000
+
+
+def _memoized(decode, maxsize=_DATE_CACHE_SIZE):
+    """
+    Wrap a decoder with a cache of the recently decoded values. Columns of time series usually repeat a limited
+    number of distinct dates and timestamps, so most of the values are decoded only once. The cache is emptied
+    when it grows over maxsize.
+    """
+    cache = dict()
+
+    def decode_memoized(value):
+        try:
+            return cache[value]
+        except KeyError:
+            pass
+        result = decode(value)
+        if len(cache) >= maxsize:
+            cache.clear()
+        cache[value] = result
+        return result
+    return decode_memoized
+
+
+def _parse_date(value):
+    if len(value) != 10 or value[4] != '-' or value[7] != '-':
+        return dt.datetime.strptime(value, '%Y-%m-%d').date() #raises
+    return dt.date(int(value[0:4]), int(value[5:7]), int(value[8:10]))
+
+
+def _parse_datetime(value):
+    if len(value) != 19 or value[4] != '-' or value[7] != '-' or value[10] != ' ' or value[13] != ':' or \
+            value[16] != ':':
+        return dt.datetime.strptime(value, '%Y-%m-%d %H:%M:%S') #raises
+    return dt.datetime(int(value[0:4]), int(value[5:7]), int(value[8:10]), int(value[11:13]), int(value[14:16]),
+                       int(value[17:19]))
+
+
+def _parse_datetime64(value):
+    if len(value) < 21 or value[19] != '.':
+        return dt.datetime.strptime(value, '%Y-%m-%d %H:%M:%S.%f') #raises
+    fraction = value[20:26] # python doesn't support nanoseconds yet
+    if not fraction.isdigit():
+        raise ValueError('Invalid DateTime64 %s' % value)
+    return _parse_datetime(value[:19]).replace(microsecond=int(fraction.ljust(6, '0')))
+
+
+def _iter_payload_lines(payload_b, pos):
+    """
+    Yield the decoded lines of the payload starting at pos. An incomplete last line is ignored.
+    """
+    end = payload_b.find(b'\n', pos)
+    while end != -1:
+        yield payload_b[pos:end].decode('utf8')
+        pos = end + 1
+        end = payload_b.find(b'\n', pos)
+
+
+def iter_lines(chunks):
+    """
+    Split an iterable of byte chunks (e.g. a streamed HTTP response) into lines separated by a newline,
+    without the trailing newline character.
+    """
+    # the pieces of an incomplete line are joined only once its end arrives, so long lines stay linear
+    pending = []
+    for chunk in chunks:
+        if b'\n' not in chunk:
+            if chunk:
+                pending.append(chunk)
+            continue
+        lines = chunk.split(b'\n')
+        if pending:
+            pending.append(lines[0])
+            lines[0] = b''.join(pending)
+            pending = []
+        last = lines.pop()
+        if last:
+            pending.append(last)
+        for line in lines:
+            yield line
+    if pending:
+        yield b''.join(pending)
+
+
 class DictionaryAdapter(object):
     def getfields(self, dict):
         return dict.keys()
@@ -288,7 +542,12 @@ class TabSeparatedWithNamesAndTypesFormatter(object):
 
         return fields, types
 
-    def format(self, rows, fields=None, types=None):
+    def infer_schema(self, rows, fields=None, types=None):
+        """
+        Return the fields and the Clickhouse types to insert the rows with. If they are not passed, they are inferred
+        from the first row (and generalized over all rows, if use_variant_for_generalization is set).
+        :return: tuple of the list of fields and the list of types
+        """
         if len(rows) == 0:
             raise Exception('No data in rows')
 
@@ -300,44 +559,182 @@ class TabSeparatedWithNamesAndTypesFormatter(object):
                     for i in range(len(types)):
                         if types[i] != t[i]:
                             types[i] = self.generalize_type(types[i], t[i])
+        elif types is None:
+            types = [self.clickhousetypefrompython(self.adapter.getval(rows[0], f), f) for f in fields]
 
         if sys.version_info[0] == 2:
             fields = [x.encode('utf8') for x in fields]
 
+        return fields, types
+
+    def peek_schema(self, rows, fields=None, types=None):
+        """
+        Like infer_schema, but for any iterable of rows, also a generator. The types are inferred from the first row
+        only.
+        :return: tuple of the list of fields, the list of types and an iterator over all the rows
+        """
+        rows = iter(rows)
+        if fields is not None and types is not None:
+            return fields, types, rows
+        try:
+            first = next(rows)
+        except StopIteration:
+            raise Exception('No data in rows')
+        fields, types = self.infer_schema([first], fields, types)
+        return fields, types, itertools.chain([first], rows)
+
+    def format(self, rows, fields=None, types=None):
+        fields, types = self.infer_schema(rows, fields, types)
+
+        getval = self.adapter.getval
+        plan = [(f, self.make_encoder(t, f)) for f, t in zip(fields, types)]
         return fields, types, '%s\n%s\n%s' % (
             '\t'.join(fields),
             '\t'.join(types),
-            '\n'.join(['\t'.join([self.formatfield(self.adapter.getval(r, f), t, f) for f, t in zip(fields,
-                                                                                                    types)]) for r in rows])
+            '\n'.join(['\t'.join([encode(getval(r, f)) for f, encode in plan]) for r in rows])
         )
 
+    def iter_format(self, rows, fields=None, types=None, chunk_size=65536):
+        """
+        Like format, but accept any iterable of rows (also a generator) and yield the encoded payload (including the
+        header with the fields and types) as chunks of bytes of about chunk_size, while consuming the rows. If fields
+        or types are omitted, they are inferred from the first row only.
+        :return: tuple of the fields, the types and the iterator over the chunks
+        """
+        fields, types, rows = self.peek_schema(rows, fields, types)
+        return fields, types, self._iter_format_chunks(rows, fields, types, chunk_size)
+
+    def _iter_format_chunks(self, rows, fields, types, chunk_size):
+        getval = self.adapter.getval
+        plan = [(f, self.make_encoder(t, f)) for f, t in zip(fields, types)]
+        buffer = ['\t'.join(fields) + '\n' + '\t'.join(types) + '\n']
+        size = 0
+        for r in rows:
+            line = '\t'.join([encode(getval(r, f)) for f, encode in plan]) + '\n'
+            buffer.append(line)
+            size += len(line)
+            if size >= chunk_size:
+                yield ''.join(buffer).encode('utf8')
+                buffer = []
+                size = 0
+        if len(buffer) > 0:
+            yield ''.join(buffer).encode('utf8')
+
+    def format_header(self, fields, types):
+        """
+        :return: the header of a payload with the fields and types, as bytes
+        """
+        return ('\t'.join(fields) + '\n' + '\t'.join(types) + '\n').encode('utf8')
+
+    def format_rows(self, rows, fields, types):
+        """
+        :return: the encoded rows without the header, as bytes, so that the results of several calls can be
+        concatenated after one header
+        """
+        getval = self.adapter.getval
+        plan = [(f, self.make_encoder(t, f)) for f, t in zip(fields, types)]
+        return ''.join(['\t'.join([encode(getval(r, f)) for f, encode in plan]) + '\n' for r in rows]).encode('utf8')
+
+    def iter_batches(self, rows, fields, types, max_batch_bytes, max_batch_rows=None):
+        """
+        Encode the rows into complete payloads (each including the header with the fields and types) of at most about
+        max_batch_bytes and max_batch_rows each, yielded as soon as they are filled. Each row is formatted exactly
+        once, and only one batch is held in memory at a time. A single row larger than max_batch_bytes is sent as a
+        batch of its own.
+        :param max_batch_bytes: maximal number of encoded bytes per batch, or None for no limit
+        :param max_batch_rows: maximal number of rows per batch, or None for no limit
+        """
+        getval = self.adapter.getval
+        plan = [(f, self.make_encoder(t, f)) for f, t in zip(fields, types)]
+        header = ('\t'.join(fields) + '\n' + '\t'.join(types) + '\n').encode('utf8')
+        buffer = [header]
+        size = len(header)
+        for r in rows:
+            line = ('\t'.join([encode(getval(r, f)) for f, encode in plan]) + '\n').encode('utf8')
+            if len(buffer) > 1 and max_batch_bytes is not None and size + len(line) > max_batch_bytes:
+                yield b''.join(buffer)
+                buffer = [header]
+                size = len(header)
+            buffer.append(line)
+            size += len(line)
+            if max_batch_rows is not None and len(buffer) > max_batch_rows:
+                yield b''.join(buffer)
+                buffer = [header]
+                size = len(header)
+        if len(buffer) > 1:
+            yield b''.join(buffer)
+
     def formatfield(self, value, type, name, inarray = False):
-        try:
-            if type.startswith('Variant(') and type.endswith(')'):
-                spec = [x.strip() for x in parse_variant_types(type[8:-1])]
-                real_type = self.clickhousetypefrompython(value, name)
+        return self.make_encoder(type, name, inarray)(value)
+
+    def make_encoder(self, type, name, inarray=False):
+        """
+        Return a callable formatting a single value of the passed Clickhouse type, see formatfield. All the
+        decisions depending on the type are made once here, so that the callable can be reused for all rows.
+        """
+        encode = self._make_encoder(type, name, inarray)
+        if encode is None:
+            def encode_unsupported(value):
+                raise Exception('Unexpected error, field %s cannot be formatted, %s, %s' % (name, str(value), type))
+            return encode_unsupported
+
+        def encode_field(value):
+            try:
+                return encode(value)
+            except Exception as e:
+                raise Exception('Cannot format field %s, %r' % (name, e))
+        return encode_field
+
+    def _make_nested_encoder(self, type, name):
+        # inside of arrays and maps, a failing encoder only raises when it is called, like an unsupported type
+        return self.make_encoder(type, name, True)
+
+    def _make_encoder(self, type, name, inarray):
+        if type.startswith('Variant(') and type.endswith(')'):
+            spec = [x.strip() for x in parse_variant_types(type[8:-1])]
+            encoders = dict()
+            classtypes = dict()
+
+            def encode_variant(value):
+                # the inferred type only depends on the class for scalar values
+                real_type = classtypes.get(value.__class__)
+                if real_type is None:
+                    real_type = self.clickhousetypefrompython(value, name)
+                    if value.__class__ in _SCALAR_CLASSES:
+                        classtypes[value.__class__] = real_type
                 if real_type not in spec:
                     raise Exception('%s with type %s is not covered by %s' % (name, real_type, type))
-                return self.formatfield(value, real_type, name, inarray)
+                encode = encoders.get(real_type)
+                if encode is None:
+                    encode = encoders[real_type] = self.make_encoder(real_type, name, inarray)
+                return encode(value)
+            return encode_variant
 
-            if type.startswith('LowCardinality(') and type.endswith(')'):
-                type = type[len('LowCardinality('):-1]
+        if type.startswith('LowCardinality(') and type.endswith(')'):
+            type = type[len('LowCardinality('):-1]
 
-            if type.startswith('Nullable(') and type.endswith(')'):
-                type = type[len('Nullable('):-1]
+        if type.startswith('Nullable(') and type.endswith(')'):
+            inner = self._make_encoder(type[len('Nullable('):-1], name, inarray)
+            if inner is None:
+                return None
+            null = 'NULL' if inarray else '\\N'
+
+            def encode_nullable(value):
                 if value is None:
-                    if inarray:
-                        return 'NULL'
-                    else:
-                        return '\\N'
+                    return null
+                return inner(value)
+            return encode_nullable
 
-            if type in ['UInt8','UInt16', 'UInt32', 'UInt64','Int8','Int16','Int32','Int64']:
+        if type in _INT_TYPES:
+            def encode_int(value):
                 if value is None:
                     return '0'
                 if isinstance(value, bool):
                     return '1' if value else '0'
                 return str(value)
-            if type in ['String', 'IPv6', 'IPv4']:
+            return encode_int
+        if type in ['String', 'IPv6', 'IPv4']:
+            def encode_string(value):
                 if value is None:
                     escaped = ''
                 else:
@@ -356,189 +753,360 @@ class TabSeparatedWithNamesAndTypesFormatter(object):
                             value = value.strftime('%Y-%m-%d %H:%M:%S')
                         else:
                             value = ujson.dumps(value)
-                    escaped =  value.replace('\\','\\\\').replace('\n','\\n').replace('\t','\\t')
+                    escaped = value.replace('\\','\\\\').replace('\n','\\n').replace('\t','\\t')
                 if inarray:
                     return "'%s'" % escaped.replace("'", "\\'")
                 else:
-                    return  escaped
-            if type in ['Float32', 'Float64']:
+                    return escaped
+            return encode_string
+        if type in ['Float32', 'Float64']:
+            def encode_float(value):
                 if value is None:
                     return '0.0'
                 return str(value).replace(',','.') # replacing comma to dot to ensure US format
-            if type == 'Date':
-                if value is None or value <= dt.date(1970,1,2):
-                    escaped = '0000-00-00'
-                else:
-                    escaped = '%04d-%02d-%02d' % (value.year, value.month, value.day)
-                if inarray:
-                    return "'%s'" % escaped
-                else:
-                    return escaped
-            if type == 'DateTime' or type.startswith('DateTime('):
-                if value is None or value.replace(tzinfo=None) <= dt.datetime(1970,1,2,0,0,0):
-                    escaped = '0000-00-00 00:00:00'
-                else:
-                    escaped = '%04d-%02d-%02d %02d:%02d:%02d' % (value.year, value.month, value.day, value.hour, value.minute, value.second)
-                if inarray:
-                    return "'%s'" % escaped
-                else:
-                    return escaped
-            if type == 'DateTime64' or type.startswith('DateTime64('):
-                if value is None or value.replace(tzinfo=None) <= dt.datetime(1970,1,2,0,0,0):
-                    escaped = '0000-00-00 00:00:00,000'
-                else:
-                    escaped = '%04d-%02d-%02d %02d:%02d:%02d.%03d' % (value.year, value.month, value.day, value.hour,
-                                                                  value.minute, value.second,
-                                                                      int(value.microsecond/1000))
-                if inarray:
-                    return "'%s'" % escaped
-                else:
-                    return escaped
-            if 'Array' in type:
+            return encode_float
+        quote = "'" if inarray else ''
+        if type == 'Date':
+            mindate = dt.date(1970,1,2)
+            empty = quote + '0000-00-00' + quote
+            pattern = quote + '%04d-%02d-%02d' + quote
+
+            def encode_date(value):
+                if value is None or value <= mindate:
+                    return empty
+                return pattern % (value.year, value.month, value.day)
+            return encode_date
+        if type == 'DateTime' or type.startswith('DateTime('):
+            mindatetime = dt.datetime(1970,1,2,0,0,0)
+            empty = quote + '0000-00-00 00:00:00' + quote
+            pattern = quote + '%04d-%02d-%02d %02d:%02d:%02d' + quote
+
+            def encode_datetime(value):
+                if value is None or value.replace(tzinfo=None) <= mindatetime:
+                    return empty
+                return pattern % (value.year, value.month, value.day, value.hour, value.minute, value.second)
+            return encode_datetime
+        if type == 'DateTime64' or type.startswith('DateTime64('):
+            mindatetime = dt.datetime(1970,1,2,0,0,0)
+            empty = quote + '0000-00-00 00:00:00,000' + quote
+            pattern = quote + '%04d-%02d-%02d %02d:%02d:%02d.%03d' + quote
+
+            def encode_datetime64(value):
+                if value is None or value.replace(tzinfo=None) <= mindatetime:
+                    return empty
+                return pattern % (value.year, value.month, value.day, value.hour, value.minute, value.second,
+                                  int(value.microsecond/1000))
+            return encode_datetime64
+        if type.startswith('Array(') and type.endswith(')'):
+            element = self._make_nested_encoder(type[6:-1], name)
+
+            def encode_array(value):
                 if value is None:
                     return '[]'
-                return '[%s]' % ','.join([self.formatfield(x, type[6:-1], name, True) for x in value])
-            if type.startswith('Map(') and type.endswith(')'):
+                return '[%s]' % ','.join([element(x) for x in value])
+            return encode_array
+        if type.startswith('Map(') and type.endswith(')'):
+            spec = [x.strip() for x in parse_variant_types(type[4:-1])]
+            if len(spec) != 2:
+                def encode_malformed(value):
+                    raise Exception('Cannot format type %s, it is malformed' % (type))
+                return encode_malformed
+            key = self._make_nested_encoder(spec[0], name)
+            val = self._make_nested_encoder(spec[1], name)
+
+            def encode_map(value):
                 if value is None:
                     return '{}'
-                spec=type[4:-1].split(',')
-                if len(spec) != 2:
-                    raise Exception('Cannot format type %s, it is either malformed or too nested for this simple '
-                                    'driver' % (type))
-                return '{%s}' % ','.join(['%s:%s' % (
-                    self.formatfield(k, spec[0].strip(), name+str(k), True),
-                    self.formatfield(v, spec[1].strip(), name+str(v), True)) for k, v in value.items()])
-        except Exception as e:
-            raise Exception('Cannot format field %s, %r' % (name, e))
-
-        raise Exception('Unexpected error, field %s cannot be formatted, %s, %s' % (name, str(value), type))
-
+                return '{%s}' % ','.join(['%s:%s' % (key(k), val(v)) for k, v in value.items()])
+            return encode_map
+        return None
 
     def unformatfield(self, value, type):
         """
         1. Raise exception if value is not of the type
         2. Otherwise unformat the value
+
+        To unformat many values of the same type, prefer make_decoder, which inspects the type only once.
+        """
+        return self.make_decoder(type)(value)
+
+    def compile_decoders(self, types):
+        """
+        Parse the types line of a result once into a list of decoders, one per column.
+        """
+        return [self.make_decoder(t) for t in types]
+
+    def make_decoder(self, type):
+        """
+        Return a callable unformatting a single value of the passed Clickhouse type, see unformatfield. All
+        inspection of the type string happens here, so that the returned callable does only the conversion.
         """
         if type.startswith('LowCardinality(') and type.endswith(')'):
             type = type[len('LowCardinality('):-1]
 
         if type.startswith('Nullable(') and type.endswith(')'):
-            type = type[len('Nullable('):-1]
-            if value == 'NULL' or value == '\\N':
-                return None
-
-        if type in ['UInt8','UInt16', 'UInt32', 'UInt64','Int8','Int16','Int32','Int64']:
-            return int(value) # raises if can't unformat
-        if type in ['String', 'IPv4', 'IPv6', 'UUID']:
-            if type == 'IPv4':
-                if re.match(r'^[0-9]{1,3}\.[0-9]{1,3}\.[0-9]{1,3}\.[0-9]{1,3}$', value) is None:
-                    raise Exception('Invalid IPv4 %s' % value)
-            elif type == 'IPv6':
-                if re.match(r'(([0-9a-fA-F]{1,4}:){7,7}[0-9a-fA-F]{1,4}|([0-9a-fA-F]{1,4}:){1,7}:|([0-9a-fA-F]{1,'
-                            r'4}:){1,6}:[0-9a-fA-F]{1,4}|([0-9a-fA-F]{1,4}:){1,5}(:[0-9a-fA-F]{1,4}){1,'
-                            r'2}|([0-9a-fA-F]{1,4}:){1,4}(:[0-9a-fA-F]{1,4}){1,3}|([0-9a-fA-F]{1,4}:){1,'
-                            r'3}(:[0-9a-fA-F]{1,4}){1,4}|([0-9a-fA-F]{1,4}:){1,2}(:[0-9a-fA-F]{1,4}){1,'
-                            r'5}|[0-9a-fA-F]{1,4}:((:[0-9a-fA-F]{1,4}){1,6})|:((:[0-9a-fA-F]{1,4}){1,7}|:)|fe80:(:['
-                            r'0-9a-fA-F]{0,4}){0,4}%[0-9a-zA-Z]{1,}|::(ffff(:0{1,4}){0,1}:){0,1}((25[0-5]|(2[0-4]|1{'
-                            r'0,1}[0-9]){0,1}[0-9])\.){3,3}(25[0-5]|(2[0-4]|1{0,1}[0-9]){0,1}[0-9])|([0-9a-fA-F]{1,'
-                            r'4}:){1,4}:((25[0-5]|(2[0-4]|1{0,1}[0-9]){0,1}[0-9])\.){3,3}(25[0-5]|(2[0-4]|1{0,'
-                            r'1}[0-9]){0,1}[0-9]))', value) is None:
-                    raise Exception('Invalid IPv6 %s' % value)
-            elif type == 'UUID':
-                if re.match(r'[0-9a-fA-F\-]{32}', value) is None:
-                    raise Exception('Invalid UUID %s' % value)
-            elif type == 'String':
-                pass #anything can be string
-            return value.replace('\\n','\n').replace('\\t','\t').replace("\\'", "'").replace('\\\\','\\')
+            inner = self.make_decoder(type[len('Nullable('):-1])
+
+            def decode_nullable(value):
+                if value == 'NULL' or value == '\\N':
+                    return None
+                return inner(value)
+            return decode_nullable
+
+        if type in _INT_TYPES:
+            return int # raises if can't unformat
+        if type == 'String':
+            return _unescape # anything can be string
+        if type in ['IPv4', 'IPv6', 'UUID']:
+            regex = _VALIDATION_RES[type]
+
+            def decode_validated(value):
+                if regex.match(value) is None:
+                    raise Exception('Invalid %s %s' % (type, value))
+                return _unescape(value)
+            return decode_validated
         if type in ['Float32', 'Float64']:
-            return float(value) # raises if it is not float
+            return float # raises if it is not float
         if type == 'Date':
-            if value.startswith("'"):
-                value = value[1:]
-            if value.endswith("'"):
-                value = value[:-1]
-            if value == '0000-00-00' or value == '1970-01-01':
-                return None
-            return dt.datetime.strptime(value, '%Y-%m-%d').date() #raises
+            def decode_date(value):
+                if value.startswith("'"):
+                    value = value[1:]
+                if value.endswith("'"):
+                    value = value[:-1]
+                if value == '0000-00-00' or value == '1970-01-01':
+                    return None
+                return _parse_date(value)
+            return _memoized(decode_date)
         if type == 'DateTime' or type.startswith('DateTime('):
-            if value.startswith("'"):
-                value = value[1:]
-            if value.endswith("'"):
-                value = value[:-1]
-            if value == '0000-00-00 00:00:00' or value == '1970-01-01 86:28:16':
-                return None
-            tmp = dt.datetime.strptime(value, '%Y-%m-%d %H:%M:%S')
+            tzinfo = None
             if type.startswith('DateTime('):
-                zone = type.split('(')[1].replace(')','').replace("'", '').replace('\\','').strip()
-                tmp = tmp.replace(tzinfo=tz.gettz(zone))
-            return tmp
+                tzinfo = tz.gettz(type.split('(')[1].replace(')','').replace("'", '').replace('\\','').strip())
+
+            def decode_datetime(value):
+                if value.startswith("'"):
+                    value = value[1:]
+                if value.endswith("'"):
+                    value = value[:-1]
+                if value == '0000-00-00 00:00:00' or value == '1970-01-01 86:28:16':
+                    return None
+                tmp = _parse_datetime(value)
+                if tzinfo is not None:
+                    tmp = tmp.replace(tzinfo=tzinfo)
+                return tmp
+            return _memoized(decode_datetime)
         if type == 'DateTime64' or type.startswith('DateTime64('):
-            if value.startswith("'"):
-                value = value[1:]
-            if value.endswith("'"):
-                value = value[:-1]
-            if value.startswith('0000-00-00 00:00:00') or value.startswith('1970-01-01 86:28:16'):
-                return None
-            ttt = value.split('.')
-            if len(ttt[-1]) > 6: # python doesn't support nanoseconds yet
-                ttt[-1] = ttt[-1][:6]
-                value = '.'.join(ttt)
-            tmp = dt.datetime.strptime(value, '%Y-%m-%d %H:%M:%S.%f') #raises
+            tzinfo = None
             if type.startswith('DateTime64('):
-                tmp = tmp.replace(tzinfo=tz.gettz(type.split('(')[1][2:-3]))
-            return tmp
+                args = type_arguments(type)
+                if len(args) > 1:
+                    tzinfo = tz.gettz(args[1])
+
+            def decode_datetime64(value):
+                if value.startswith("'"):
+                    value = value[1:]
+                if value.endswith("'"):
+                    value = value[:-1]
+                if value.startswith('0000-00-00 00:00:00') or value.startswith('1970-01-01 86:28:16'):
+                    return None
+                tmp = _parse_datetime64(value)
+                if tzinfo is not None:
+                    tmp = tmp.replace(tzinfo=tzinfo)
+                return tmp
+            return _memoized(decode_datetime64)
         if type.startswith('Array('):
-            if not value.startswith('[') or not value.endswith(']'):
-                raise Exception('%s does not look like an array' % value)
-            value = value.replace(',,', ",'',") # workaround empty string clickhouse bug
-            parts = eval(value, None, {'NULL': None}) # cannot use literal_eval to support NULL literal from Clickhouse
-
-            def handle_dates(val, typ): # can raise
-                if typ.startswith('Date'):
-                    return [self.unformatfield(x, typ) for x in val] # can raise
-                else:
-                    if typ.startswith('Array('):
-                        return [handle_dates(x, typ[6:-1].strip()) for x in val]
-                    else:
-                        return val
+            parse = self._make_literal_decoder(type)
 
-            return handle_dates(parts, type[6:-1].strip()) # can raise
+            def decode_array(value):
+                if not value.startswith('[') or not value.endswith(']'):
+                    raise Exception('%s does not look like an array' % value)
+                result, pos = parse(value, 0)
+                if pos != len(value):
+                    raise Exception('%s does not look like an array' % value)
+                return result
+            return decode_array
 
         if type.startswith('Map(') and type.endswith(')'):
-            if not value.startswith('{') or not value.endswith('}'):
-                raise Exception('%s does not look like a Map' % value)
-            spec=[x.strip() for x in parse_variant_types(type[4:-1])]
-            if len(spec) != 2:
-                raise Exception('Cannot unformat type %s, it is either malformed or too nested for this simple '
-                                'driver' % (type))
-            x = ast.literal_eval(value)
-            spec[0] = spec[0].strip()
-            spec[1] = spec[1].strip()
-            result = dict()
-            for k, v in x.items():
-                if spec[0].startswith('Date'):
-                    k = self.unformatfield(k, spec[0])
-                if spec[1].startswith('Date'):
-                    v = self.unformatfield(v, spec[1])
-                elif spec[1].startswith('Array(') and spec[1].endswith(')'):
-                    v = self.unformatfield(v, spec[1][6:-1])
-                result[k] = v
-            return result
+            parse = self._make_literal_decoder(type)
+
+            def decode_map(value):
+                if not value.startswith('{') or not value.endswith('}'):
+                    raise Exception('%s does not look like a Map' % value)
+                result, pos = parse(value, 0)
+                if pos != len(value):
+                    raise Exception('%s does not look like a Map' % value)
+                return result
+            return decode_map
 
         if type.startswith('Variant(') and type.endswith(')'):
             spec=[x.strip() for x in parse_variant_types(type[8:-1])]
             has_string = 'String' in spec
             if has_string:
                 spec.remove('String')
-            for s in spec:
-                try:
-                    return self.unformatfield(value, s)
-                except:
-                    pass
-            if has_string:
-                return self.unformatfield(value, 'String')
+            decoders = [self._make_variant_member_decoder(s) for s in spec]
+
+            def decode_variant(value):
+                for decoder in decoders:
+                    try:
+                        return decoder(value)
+                    except:
+                        pass
+                if has_string:
+                    return _unescape(value)
+                raise Exception('Unexpected error, field cannot be unformatted, %s, %s' % (str(value), type))
+            return decode_variant
+
+        def decode_unsupported(value):
+            raise Exception('Unexpected error, field cannot be unformatted, %s, %s' % (str(value), type))
+        return decode_unsupported
+
+    def _make_literal_decoder(self, type):
+        """
+        Return a callable parsing a literal of the passed type, as it is written by Clickhouse inside of Arrays, Maps
+        and Tuples, from a text at a position, and returning a tuple of the value and the position after it.
+        """
+        if type.startswith('LowCardinality(') and type.endswith(')'):
+            type = type[len('LowCardinality('):-1]
+
+        if type.startswith('Nullable(') and type.endswith(')'):
+            inner = self._make_literal_decoder(type[len('Nullable('):-1])
+
+            def parse_nullable(text, pos):
+                if text.startswith('NULL', pos):
+                    return None, pos + 4
+                return inner(text, pos)
+            return parse_nullable
+
+        if type in _INT_TYPES or type in ['Float32', 'Float64']:
+            convert = int if type in _INT_TYPES else float
+
+            def parse_number(text, pos):
+                token, pos = _parse_token(text, pos)
+                return convert(token), pos
+            return parse_number
+        if type == 'Bool':
+            def parse_bool(text, pos):
+                token, pos = _parse_token(text, pos)
+                return token == 'true', pos
+            return parse_bool
+        if type in ['String', 'UUID', 'IPv4', 'IPv6'] or type.startswith('FixedString(') or \
+                type.startswith('Enum8(') or type.startswith('Enum16('):
+            def parse_string(text, pos):
+                if text[pos] == "'":
+                    return _parse_quoted(text, pos)
+                return _parse_token(text, pos) # empty strings are not quoted by some clickhouse versions
+            return parse_string
+        if type.startswith('Date'):
+            convert = self.make_decoder(type)
+
+            def parse_date(text, pos):
+                value, pos = _parse_quoted(text, pos)
+                return convert(value), pos
+            return parse_date
+        if type.startswith('Array('):
+            elementtype = type[6:-1].strip()
+            if elementtype in _NUMBER_TYPES or elementtype.startswith('Nullable(') and \
+                    elementtype[len('Nullable('):-1] in _NUMBER_TYPES:
+                # numbers cannot contain commas and brackets, so they can be simply split
+                convert = self.make_decoder(elementtype)
+
+                def parse_numbers(text, pos):
+                    end = text.index(']', pos)
+                    elements = text[pos + 1:end]
+                    if elements.strip() == '':
+                        return [], end + 1
+                    return [convert(x.strip()) for x in elements.split(',')], end + 1
+                return parse_numbers
+
+            parse_element = self._make_literal_decoder(elementtype)
+
+            def parse_array(text, pos):
+                if text[pos] != '[':
+                    raise Exception('%s does not look like an array' % text[pos:])
+                return _parse_elements(text, pos, ']', parse_element)
+            return parse_array
+        if type.startswith('Map(') and type.endswith(')'):
+            spec=[x.strip() for x in parse_variant_types(type[4:-1])]
+            if len(spec) != 2:
+                raise Exception('Cannot unformat type %s, it is malformed' % (type))
+            parse_entry = _parse_map_entry(self._make_literal_decoder(spec[0]), self._make_literal_decoder(spec[1]))
+
+            def parse_map(text, pos):
+                if text[pos] != '{':
+                    raise Exception('%s does not look like a Map' % text[pos:])
+                entries, pos = _parse_elements(text, pos, '}', parse_entry)
+                return dict(entries), pos
+            return parse_map
+        if type.startswith('Tuple(') and type.endswith(')'):
+            elements = [self._make_literal_decoder(x) for x in tuple_element_types(type)]
+
+            def parse_tuple(text, pos):
+                if text[pos] != '(':
+                    raise Exception('%s does not look like a Tuple' % text[pos:])
+                result = []
+                for i, element in enumerate(elements):
+                    pos += 1
+                    while text[pos] == ' ':
+                        pos += 1
+                    value, pos = element(text, pos)
+                    result.append(value)
+                    while text[pos] == ' ':
+                        pos += 1
+                    if text[pos] != (',' if i < len(elements) - 1 else ')'):
+                        raise Exception('%s does not look like a %s' % (text[pos:], type))
+                return tuple(result), pos + 1
+            return parse_tuple
+
+        return parse_literal
+
+    def _make_variant_member_decoder(self, type):
+        """
+        Inside of Variants, arrays and maps are parsed without checking the types of their elements, because
+        their text representation doesn't tell which of the variant types it is.
+        """
+        if (type.startswith('Array(') or type.startswith('Map(')) and type.endswith(')'):
+            convert = self._make_literal_converter(type)
+            opening, closing = ('[', ']') if type.startswith('Array(') else ('{', '}')
+
+            def decode_member(value):
+                if not value.startswith(opening) or not value.endswith(closing):
+                    raise Exception('%s does not look like %s' % (value, type))
+                result, pos = parse_literal(value)
+                if pos != len(value):
+                    raise Exception('%s does not look like %s' % (value, type))
+                return convert(result)
+            return decode_member
+        return self.make_decoder(type)
+
+    def _make_literal_converter(self, type):
+        """
+        Return a callable converting the python structure parsed from an Array or Map literal of the passed type,
+        by unformatting the Date and DateTime values inside of it.
+        """
+        if type.startswith('Array('):
+            elementtype = type[6:-1].strip()
+            if elementtype.startswith('Date'):
+                decoder = self.make_decoder(elementtype)
+                return lambda val: [decoder(x) for x in val] # can raise
+            if elementtype.startswith('Array('):
+                convert = self._make_literal_converter(elementtype)
+                return lambda val: [convert(x) for x in val]
+            return _identity
+
+        if type.startswith('Map(') and type.endswith(')'):
+            spec=[x.strip() for x in parse_variant_types(type[4:-1])]
+            if len(spec) != 2:
+                raise Exception('Cannot unformat type %s, it is either malformed or too nested for this simple '
+                                'driver' % (type))
+            convert_key = self.make_decoder(spec[0]) if spec[0].startswith('Date') else _identity
+            if spec[1].startswith('Date'):
+                convert_value = self.make_decoder(spec[1])
+            elif spec[1].startswith('Array(') and spec[1].endswith(')'):
+                convert_value = self._make_literal_converter(spec[1])
+            else:
+                convert_value = _identity
+            return lambda val: dict((convert_key(k), convert_value(v)) for k, v in val.items())
 
-        raise Exception('Unexpected error, field cannot be unformatted, %s, %s' % (str(value), type))
+        return _identity
 
     def unformat_as_dataframe(self, payload_b):
         if sys.version_info[0] == 3:
@@ -555,37 +1123,6 @@ class TabSeparatedWithNamesAndTypesFormatter(object):
         dtypes = dict()
         converters = dict()
 
-        def make_to_datetime(type):
-            if type.startswith('('):
-                tzinfo = tz.gettz(type.split('(')[1][2:-3])
-                def to_datetime(value):
-                    if value.startswith("'"):
-                        value = value[1:]
-                    if value.endswith("'"):
-                        value = value[:-1]
-                    if value == '0000-00-00 00:00:00' or value == '1970-01-01 86:28:16':
-                        return None
-                    return dt.datetime.strptime(value, '%Y-%m-%d %H:%M:%S').replace(tzinfo=tzinfo)
-            else:
-                def to_datetime(value):
-                    if value.startswith("'"):
-                        value = value[1:]
-                    if value.endswith("'"):
-                        value = value[:-1]
-                    if value == '0000-00-00 00:00:00' or value == '1970-01-01 86:28:16':
-                        return None
-                    return dt.datetime.strptime(value, '%Y-%m-%d %H:%M:%S')
-            return to_datetime
-
-        def to_date(value):
-            if value.startswith("'"):
-                value = value[1:]
-            if value.endswith("'"):
-                value = value[:-1]
-            if value == '0000-00-00' or value == '1970-01-01':
-                return None
-            return dt.datetime.strptime(value, '%Y-%m-%d').date()
-
         for field, type in zip(fields, types):
             if type.startswith('LowCardinality(') and type.endswith(')'):
                 type = type[len('LowCardinality('):-1]
@@ -601,10 +1138,8 @@ class TabSeparatedWithNamesAndTypesFormatter(object):
                 dtypes[field] = str
             elif type in ['Float32', 'Float64']:
                 dtypes[field] = float
-            elif type == 'Date':
-                converters[field] = to_date
-            elif type == 'DateTime' or type.startswith('DateTime('):
-                converters[field] = make_to_datetime(type)
+            elif type == 'Date' or type == 'DateTime' or type.startswith('DateTime('):
+                converters[field] = self.make_decoder(type)
             else:
                 raise Exception('type %s is not supported' % type)
 
@@ -620,27 +1155,98 @@ class TabSeparatedWithNamesAndTypesFormatter(object):
 
         return df
 
-    def unformat(self, payload_b):
-        if sys.version_info[0] == 3:
-            payload = payload_b.decode('utf8')
-        else:
-            payload = payload_b
-        payload = payload.split('\n')
-        if len(payload) < 3:
+    def unformat_parquet_as_dataframe(self, payload_b):
+        """
+        Read a result in the Parquet format into a pandas dataframe using pyarrow, without converting the values to
+        text or python objects in between. Integer columns keep their type, and nullable integer columns are returned
+        with the pandas nullable integer types (e.g. Int64) instead of float. DateTime columns are returned as
+        timezone-aware timestamps in UTC.
+        """
+        table = pq.read_table(pa.BufferReader(payload_b))
+        df = table.to_pandas()
+        nullable_dtypes = {
+            pa.int8(): pd.Int8Dtype(), pa.int16(): pd.Int16Dtype(), pa.int32(): pd.Int32Dtype(),
+            pa.int64(): pd.Int64Dtype(), pa.uint8(): pd.UInt8Dtype(), pa.uint16(): pd.UInt16Dtype(),
+            pa.uint32(): pd.UInt32Dtype(), pa.uint64(): pd.UInt64Dtype(), pa.bool_(): pd.BooleanDtype(),
+        }
+        for i, field in enumerate(table.schema):
+            if field.nullable and field.type in nullable_dtypes:
+                df[field.name] = table.column(i).to_pandas(types_mapper=nullable_dtypes.get)
+        return df
+
+    def unformat(self, payload_b, row_format='dict'):
+        return self.unformat_with_header(payload_b, row_format)[2]
+
+    def unformat_with_header(self, payload_b, row_format='dict'):
+        """
+        Like unformat, but also return the field names and the Clickhouse types of the result.
+        :param row_format: 'dict', 'tuple' or 'record', see pyclickhouse.records
+        :return: tuple of the list of fields, the list of types and the list of rows
+        """
+        fields, types, rows = self.iter_unformat(payload_b, row_format)
+        return fields, types, list(rows)
+
+    def iter_unformat(self, payload_b, row_format='dict', columns=None):
+        """
+        Parse the header of the result and return an iterator, which parses the rows only when they are requested.
+        :param columns: optional list of fields to return. Only these fields are decoded, the others are skipped.
+        :return: tuple of the list of fields, the list of types and the iterator over the rows
+        """
+        first = payload_b.find(b'\n')
+        second = payload_b.find(b'\n', first + 1) if first != -1 else -1
+        if second == -1:
             raise Exception('Unexpected error, no result')
 
-        fields = payload[0].split('\t')
-        types = payload[1].split('\t')
-        result = []
-        for line in payload[2:-1]:
-            line = line.split('\t')
-            d = dict()
-            for l, t, f in zip(line, types, fields):
-                d[f] = self.unformatfield(l,t)
-            result.append(d)
+        fields = payload_b[:first].decode('utf8').split('\t')
+        types = payload_b[first + 1:second].decode('utf8').split('\t')
+        if columns is not None:
+            indexes = project(fields, columns)
+            fields = [fields[i] for i in indexes]
+            types = [types[i] for i in indexes]
+            plan = list(zip(indexes, self.compile_decoders(types)))
+            make_row = make_row_factory(row_format, fields)
+            rows = (make_row([decoder(cells[i]) for i, decoder in plan])
+                    for cells in (line.split('\t') for line in _iter_payload_lines(payload_b, second + 1)))
+            return fields, types, rows
+
+        decoders = self.compile_decoders(types)
+        if row_format == 'dict':
+            rows = (self._unformatline(line, fields, decoders) for line in _iter_payload_lines(payload_b, second + 1))
+        else:
+            make_row = make_row_factory(row_format, fields)
+            rows = (make_row([decoder(l) for l, decoder in zip(line.split('\t'), decoders)])
+                    for line in _iter_payload_lines(payload_b, second + 1))
+        return fields, types, rows
 
-        return result
+    def unformat_stream(self, chunks, row_format='dict'):
+        """
+        Like unformat, but consumes an iterable of byte chunks and yields the rows one by one as soon as each
+        line is complete, so that the whole payload never has to be held in memory.
+        """
+        lines = iter_lines(chunks)
+        try:
+            fields = next(lines).decode('utf8').split('\t')
+            parse = self.make_line_parser(fields, next(lines).decode('utf8').split('\t'), row_format)
+        except StopIteration:
+            raise Exception('Unexpected error, no result')
+        for line in lines:
+            yield parse(line)
 
+    def make_line_parser(self, fields, types, row_format='dict'):
+        """
+        Return a callable parsing a line of a result (bytes without the newline) into a row of the row_format.
+        """
+        decoders = self.compile_decoders(types)
+        if row_format == 'dict':
+            return lambda line: self._unformatline(line.decode('utf8'), fields, decoders)
+        make_row = make_row_factory(row_format, fields)
+        return lambda line: make_row([decoder(l) for l, decoder in zip(line.decode('utf8').split('\t'), decoders)])
+
+    def _unformatline(self, line, fields, decoders):
+        d = dict()
+        for l, decoder, f in zip(line.split('\t'), decoders, fields):
+            d[f] = decoder(l)
+        return d
 
 # Testing
 if __name__ == '__main__':
@@ -0,0 +1,141 @@
+import collections
+import concurrent.futures
+import logging
+import multiprocessing.pool
+import threading
+import time
+import uuid
+
+from pyclickhouse.adaptive import error_code
+
+
+QUERY_WAS_CANCELLED = 394
+
+
+class Hedging(object):
+    """
+    Hedges the selects of a Cursor with several Connections to replicas, when set as its hedging attribute: if the
+    replica a select has been sent to hasn't answered after a delay, the same select is sent to the next replica, and
+    the first answer is used. The other query is cancelled with KILL QUERY on its replica. If the first replica fails
+    before the delay, the select is sent to the next one immediately.
+
+    The delay is the percentile of the latencies of the recent selects, so that only the slowest selects (by default,
+    5%) are sent twice, or a fixed delay. One Hedging can be shared by the Cursors selecting from the same replicas.
+    Call close when it is not needed anymore, or use it as a context manager. Its threads are daemon threads, so that
+    a stalled request doesn't prevent the interpreter from exiting.
+
+    Only Cursor.select is hedged. The replicas are taken in turn from the connections of the Cursor, which exclude the
+    ones it has set aside after failures; a balancer of the Cursor is not used for hedged selects.
+    """
+
+    def __init__(self, delay=None, percentile=95, initial_delay=0.1, min_delay=0.01, window=1000, min_samples=20,
+                 workers=20, kill_workers=4):
+        """
+        :param delay: fixed number of seconds to wait before hedging, instead of the percentile
+        :param percentile: the percentile of the recent latencies to wait for before hedging
+        :param initial_delay: seconds to wait before hedging, until min_samples latencies are known
+        :param min_delay: the delay never gets shorter, so that fast selects are not all sent twice
+        :param window: number of recent latencies the percentile is computed from
+        :param min_samples: number of latencies needed to use the percentile
+        :param workers: maximal number of selects in progress at once
+        :param kill_workers: maximal number of KILL QUERY requests in progress at once. They have their own threads,
+        so that they are not queued behind the selects.
+        """
+        self.delay = delay
+        self.percentile = percentile
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self.latencies = collections.deque(maxlen=window)
+        self.lock = threading.Lock()
+        self.pool = multiprocessing.pool.ThreadPool(workers)
+        self.killpool = multiprocessing.pool.ThreadPool(kill_workers)
+        self.hedged = 0
+
+    def current_delay(self):
+        """
+        :return: the number of seconds after which the next select will be hedged
+        """
+        if self.delay is not None:
+            return self.delay
+        with self.lock:
+            if len(self.latencies) < self.min_samples:
+                return self.initial_delay
+            latencies = sorted(self.latencies)
+        index = min(len(latencies) - 1, int(len(latencies) * self.percentile / 100.0))
+        return max(self.min_delay, latencies[index])
+
+    def call(self, primary, secondary, query):
+        """
+        Send the select query to the primary Connection and, if necessary, to the secondary one.
+        :return: the first successful response
+        """
+        start = time.time()
+        futures = {self._submit(primary, query, start): primary}
+        done, pending = concurrent.futures.wait(futures, self.current_delay())
+        if len(pending) > 0 or next(iter(done)).exception() is not None:
+            self.hedged += 1
+            futures[self._submit(secondary, query, start)] = secondary
+        error = None
+        while len(futures) > 0:
+            done, pending = concurrent.futures.wait(futures, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                del futures[future]
+                if future.exception() is not None:
+                    error = error or future.exception()
+                    continue
+                # the latency of the select, from its start, also if the second replica answered
+                r, query_id, latency = future.result()
+                with self.lock:
+                    self.latencies.append(latency)
+                for loser, connection in futures.items():
+                    self._cancel(loser, connection)
+                return r
+        raise error
+
+    def close(self):
+        """
+        Stop the threads of the Hedging, after the requests in progress have finished.
+        """
+        for pool in (self.pool, self.killpool):
+            pool.close()
+            pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _submit(self, connection, query, start):
+        future = concurrent.futures.Future()
+        future.query_id = str(uuid.uuid4())
+        self.pool.apply_async(self._run, (future, connection, query, start))
+        return future
+
+    @staticmethod
+    def _run(future, connection, query, start):
+        if not future.set_running_or_notify_cancel():
+            return  # cancelled while waiting for a thread
+        # not Connection._call, which would log the cancellation of the loser and close the pooled connections
+        try:
+            r = connection._request(query, None, False, {'query_id': future.query_id})
+        except Exception as e:
+            if error_code(e) != QUERY_WAS_CANCELLED:
+                logging.warning('Hedged query %s failed on %s:%s: %s' %
+                                (future.query_id, connection.host, connection.port, e))
+            future.set_exception(e)
+            return
+        future.set_result((r, future.query_id, time.time() - start))
+
+    def _cancel(self, future, connection):
+        if future.cancel():
+            return
+        self.killpool.apply_async(self._kill, (connection, future.query_id))
+
+    @staticmethod
+    def _kill(connection, query_id):
+        try:
+            connection._request("KILL QUERY WHERE query_id = '%s' ASYNC" % query_id)
+        except Exception as e:
+            logging.warning('Cannot kill query %s: %s' % (query_id, e))
@@ -0,0 +1,586 @@
+import datetime as dt
+import struct
+import uuid
+import ipaddress
+import itertools
+from decimal import Decimal
+
+import numpy as np
+from dateutil import tz
+
+from pyclickhouse.formatter import parse_variant_types, type_arguments
+from pyclickhouse.rowbinary import read_varint, write_varint, _UUID, _UTC_NAMES
+
+
+_NUMERIC_DTYPES = {
+    'Int8': np.dtype('<i1'),
+    'Int16': np.dtype('<i2'),
+    'Int32': np.dtype('<i4'),
+    'Int64': np.dtype('<i8'),
+    'UInt8': np.dtype('<u1'),
+    'UInt16': np.dtype('<u2'),
+    'UInt32': np.dtype('<u4'),
+    'UInt64': np.dtype('<u8'),
+    'Float32': np.dtype('<f4'),
+    'Float64': np.dtype('<f8'),
+}
+
+_DATETIME64_UNITS = {0: 's', 3: 'ms', 6: 'us', 9: 'ns'}
+
+_UINT64 = struct.Struct('<Q')
+
+# bits of the serialization type of LowCardinality indexes
+_LC_INDEX_TYPE_MASK = 0xff
+_LC_HAS_ADDITIONAL_KEYS = 0x200
+
+_LC_NEED_UPDATE_DICTIONARY = 0x400
+_LC_SHARED_DICTIONARIES_WITH_ADDITIONAL_KEYS = 1
+
+_LC_INDEX_DTYPES = [np.dtype('<u1'), np.dtype('<u2'), np.dtype('<u4'), np.dtype('<u8')]
+
+
+def _frombuffer(buf, dtype, rows, pos):
+    end = pos + dtype.itemsize * rows
+    return np.frombuffer(buf, dtype=dtype, count=rows, offset=pos), end
+
+
+def _column_array(values):
+    """
+    Return the values of a column as a numpy array, lists and other sequences become arrays of objects.
+    """
+    if isinstance(values, np.ndarray):
+        return values
+    return np.fromiter(values, dtype=object, count=len(values))
+
+
+def _fill_none(values, fill):
+    """
+    Replace None values in arrays of objects by fill, so that they can be converted to a numpy type.
+    """
+    if values.dtype.kind != 'O':
+        return values
+    return np.array([fill if v is None else v for v in values.tolist()], dtype=object)
+
+
+def _null_mask(values):
+    """
+    :return: tuple of the boolean array marking NULLs and the values, in which the NULLs are replaced by a default
+    value of the numpy type, or by None for arrays of objects. Masked values, NaN, NaT and None are NULLs.
+    """
+    if isinstance(values, np.ma.MaskedArray):
+        mask = np.ma.getmaskarray(values)
+        values = values.data
+    elif values.dtype.kind == 'f':
+        mask = np.isnan(values)
+    elif values.dtype.kind in 'mM':
+        mask = np.isnat(values)
+    elif values.dtype.kind == 'O':
+        mask = np.fromiter((v is None or (isinstance(v, float) and v != v) for v in values.tolist()),
+                           dtype=bool, count=len(values))
+    else:
+        return np.zeros(len(values), dtype=bool), values
+    if not mask.any():
+        return mask, values
+    if values.dtype.kind == 'O':
+        values = values.copy()
+        values[mask] = None
+    else:
+        values = np.where(mask, np.zeros((), dtype=values.dtype), values)
+    return mask, values
+
+
+def _naive_utc(value, zone=None):
+    if value is None:
+        return 0
+    if getattr(value, 'tzinfo', None) is not None:
+        return value.astimezone(tz.UTC).replace(tzinfo=None)
+    if zone is not None and isinstance(value, dt.datetime):
+        return value.replace(tzinfo=zone).astimezone(tz.UTC).replace(tzinfo=None)
+    return value
+
+
+def _datetime64(values, unit, zone=None):
+    """
+    Convert the values to datetime64 with the passed unit. Python datetimes without timezone are taken as wall clock
+    time in zone (UTC if None), like by bulkinsert; datetime64 values are taken as UTC.
+    """
+    dtype = np.dtype('datetime64[%s]' % unit)
+    if values.dtype.kind == 'O':
+        return np.array([_naive_utc(v, zone) for v in values.tolist()], dtype=dtype)
+    return values.astype(dtype)
+
+
+def _encode_bytes(value):
+    if value is None:
+        return b''
+    if isinstance(value, bytes):
+        return value
+    if not isinstance(value, str):
+        value = str(value)
+    return value.encode('utf8')
+
+
+def _flatten(values, nested):
+    """
+    Concatenate the nested sequences of the values (None counts as empty) into one column.
+    :return: tuple of the offsets after each value, as Clickhouse expects them, and the concatenated column
+    """
+    items = [() if v is None else nested(v) for v in values.tolist()]
+    offsets = np.cumsum(np.fromiter((len(v) for v in items), dtype=np.int64, count=len(items)), dtype='<u8')
+    if len(items) > 0 and all(isinstance(v, np.ndarray) for v in items):
+        return offsets, np.concatenate(items)
+    total = int(offsets[-1]) if len(items) > 0 else 0
+    return offsets, np.fromiter(itertools.chain.from_iterable(items), dtype=object, count=total)
+
+
+def _lowcardinality_index(keys):
+    """
+    :return: the position of the serialization type of the indexes, which depends on the number of keys
+    """
+    return 0 if keys <= 0xff else 1 if keys <= 0xffff else 2 if keys <= 0xffffffff else 3
+
+
+class NativeFormatter(object):
+    """
+    Decodes results of selects in the columnar Native format into numpy arrays, and encodes columns of data into the
+    Native format to insert them. Columns of fixed width types are read as views on the received payload
+    (np.frombuffer) and written from the memory of the numpy arrays (tobytes), so no python object is created per
+    value.
+    """
+
+    def format(self, columns, fields, types, timezone=None):
+        """
+        Encode columns of data as one block of the Native format.
+        :param columns: dictionary with field names as keys and numpy arrays, masked arrays or lists as values. All
+        columns must have the same length.
+        :param fields: list of the fields to encode
+        :param types: list of the Clickhouse types of the fields
+        :param timezone: timezone of the server, the python datetimes without timezone of DateTime columns without
+        explicit timezone are interpreted in it. If omitted, UTC is assumed.
+        :return: bytes
+        """
+        return b''.join(self.iter_format(columns, fields, types, None, timezone))
+
+    def iter_format(self, columns, fields, types, block_size=1048576, timezone=None):
+        """
+        Like format, but return a generator of Native blocks of at most block_size rows each, so that only one block is
+        encoded in memory at a time. None as block_size means one block with all rows.
+        """
+        arrays = [_column_array(columns[field]) for field in fields]
+        rows = len(arrays[0]) if len(arrays) > 0 else 0
+        for array in arrays:
+            if len(array) != rows:
+                raise Exception('All columns must have the same length')
+        servertz = tz.gettz(timezone) if timezone and timezone not in _UTC_NAMES else None
+        encoders = [self.make_column_encoder(type, servertz) for type in types]
+        prefixes = [self.make_state_prefix(type) for type in types]
+        header = []
+        for field, type in zip(fields, types):
+            for name in (field, type):
+                name = name.encode('utf8')
+                out = bytearray()
+                write_varint(out, len(name))
+                header.append(bytes(out) + name)
+        return self._iter_blocks(arrays, header, encoders, prefixes, rows, block_size or max(rows, 1))
+
+    def _iter_blocks(self, arrays, header, encoders, prefixes, rows, block_size):
+        for start in range(0, rows, block_size):
+            stop = min(start + block_size, rows)
+            out = bytearray()
+            write_varint(out, len(arrays))
+            write_varint(out, stop - start)
+            block = [bytes(out)]
+            for i, array in enumerate(arrays):
+                block.append(header[2 * i])
+                block.append(header[2 * i + 1])
+                block.append(prefixes[i])
+                encoders[i](block, array[start:stop])
+            yield b''.join(block)
+
+    def columns_from_dataframe(self, df, fields=None):
+        """
+        Return the columns of a pandas dataframe as a dictionary of numpy arrays, as expected by format. Missing values
+        of columns with pandas extension types (e.g. Int64 or string) become masked values, timestamps with a timezone
+        are converted to UTC.
+        :param fields: optional list of the columns to return, by default all
+        """
+        columns = dict()
+        for field in (df.columns if fields is None else fields):
+            series = df[field]
+            dtype = series.dtype
+            if getattr(dtype, 'tz', None) is not None:
+                values = series.dt.tz_convert('UTC').dt.tz_localize(None).to_numpy()
+            elif isinstance(dtype, np.dtype) and dtype.kind != 'O':
+                values = series.to_numpy()
+            else:
+                mask = series.isna().to_numpy()
+                numpy_dtype = getattr(dtype, 'numpy_dtype', None)
+                if numpy_dtype is not None and numpy_dtype.kind in 'biuf':
+                    values = series.to_numpy(dtype=numpy_dtype, na_value=0)
+                else:
+                    values = series.to_numpy(dtype=object)
+                    if mask.any():
+                        values[mask] = None
+                if mask.any():
+                    values = np.ma.masked_array(values, mask=mask)
+            columns[field] = values
+        return columns
+
+    def make_state_prefix(self, type):
+        """
+        Return the bytes Clickhouse expects before the data of a column of the passed type in each block. Only
+        LowCardinality columns (also nested in Array or Map) have such a prefix, the version of the serialization of
+        their keys.
+        """
+        if type.startswith('LowCardinality(') and type.endswith(')'):
+            return _UINT64.pack(_LC_SHARED_DICTIONARIES_WITH_ADDITIONAL_KEYS)
+        if type.startswith('Nullable(') and type.endswith(')'):
+            return self.make_state_prefix(type[len('Nullable('):-1])
+        if type.startswith('Array(') and type.endswith(')'):
+            return self.make_state_prefix(type[6:-1].strip())
+        if type.startswith('Map(') and type.endswith(')'):
+            return b''.join(self.make_state_prefix(x) for x in parse_variant_types(type[4:-1]))
+        return b''
+
+    def make_column_encoder(self, type, servertz=None):
+        """
+        Return a callable appending the Native encoding of a column of the passed Clickhouse type, given as a numpy
+        array, to a list of bytes. Values are converted to the type of the column with numpy (e.g. int64 arrays to
+        Int32 or datetime64 arrays to DateTime). datetime64 values are taken as UTC, python datetimes without timezone
+        as wall clock time in the timezone of the column, or servertz if it has none (UTC if None), like by
+        bulkinsert.
+        """
+        if type.startswith('LowCardinality(') and type.endswith(')'):
+            return self._make_lowcardinality_encoder(type[len('LowCardinality('):-1], servertz)
+
+        if type.startswith('Nullable(') and type.endswith(')'):
+            inner = self.make_column_encoder(type[len('Nullable('):-1], servertz)
+
+            def encode_nullable(out, values):
+                mask, values = _null_mask(values)
+                out.append(mask.astype('<u1').tobytes())
+                inner(out, values)
+            return encode_nullable
+
+        if type in _NUMERIC_DTYPES or type == 'Bool':
+            dtype = _NUMERIC_DTYPES.get(type, _NUMERIC_DTYPES['UInt8'])
+
+            def encode_numeric(out, values):
+                values = np.ma.getdata(_fill_none(values, 0))
+                if type == 'Bool':
+                    values = values.astype(bool)
+                out.append(values.astype(dtype).tobytes())
+            return encode_numeric
+        if type == 'Date' or type == 'Date32':
+            dtype = _NUMERIC_DTYPES['UInt16' if type == 'Date' else 'Int32']
+
+            def encode_date(out, values):
+                out.append(_datetime64(np.ma.getdata(values), 'D').view('<i8').astype(dtype).tobytes())
+            return encode_date
+        if type == 'DateTime' or type.startswith('DateTime('):
+            zone = tz.gettz(type_arguments(type)[0]) if type.startswith('DateTime(') else servertz
+
+            def encode_datetime(out, values):
+                out.append(_datetime64(np.ma.getdata(values), 's', zone).view('<i8').astype('<u4').tobytes())
+            return encode_datetime
+        if type == 'DateTime64' or type.startswith('DateTime64('):
+            args = type_arguments(type) if type.startswith('DateTime64(') else ['3']
+            precision = int(args[0])
+            zone = tz.gettz(args[1]) if len(args) > 1 else servertz
+            target = min(p for p in _DATETIME64_UNITS if p >= precision)
+            factor = 10 ** (target - precision)
+
+            def encode_datetime64(out, values):
+                ticks = _datetime64(np.ma.getdata(values), _DATETIME64_UNITS[target], zone).view('<i8')
+                if factor > 1:
+                    ticks = ticks // factor
+                out.append(ticks.tobytes())
+            return encode_datetime64
+        if type.startswith('Decimal32(') or type.startswith('Decimal64(') or (
+                type.startswith('Decimal(') and int(type_arguments(type)[0]) <= 18):
+            args = type_arguments(type)
+            scale = int(args[-1])
+            storage = 'Int32' if type.startswith('Decimal32(') or (
+                type.startswith('Decimal(') and int(args[0]) <= 9) else 'Int64'
+            dtype = _NUMERIC_DTYPES[storage]
+
+            def encode_decimal(out, values):
+                values = np.ma.getdata(values)
+                if values.dtype.kind == 'O':
+                    values = np.array([int(Decimal(0 if v is None else str(v)).scaleb(scale).to_integral_value())
+                                       for v in values.tolist()], dtype=np.int64)
+                elif values.dtype.kind == 'f':
+                    values = np.round(values * 10.0 ** scale)
+                else:
+                    values = values.astype(np.int64) * 10 ** scale
+                out.append(values.astype(dtype).tobytes())
+            return encode_decimal
+        if type.startswith('Enum8(') or type.startswith('Enum16('):
+            numbers = dict()
+            for pair in parse_variant_types(type[type.index('(') + 1:-1]):
+                name, value = pair.rsplit('=', 1)
+                numbers[name.strip()[1:-1].replace("\\'", "'")] = int(value)
+            dtype = _NUMERIC_DTYPES['Int8' if type.startswith('Enum8(') else 'Int16']
+
+            def encode_enum(out, values):
+                values = np.ma.getdata(values)
+                if values.dtype.kind in 'iu':
+                    out.append(values.astype(dtype).tobytes())
+                else:
+                    out.append(np.array([numbers[v] for v in values.tolist()], dtype=dtype).tobytes())
+            return encode_enum
+        if type.startswith('FixedString('):
+            size = int(type_arguments(type)[0])
+            dtype = np.dtype('S%d' % size)
+
+            def encode_fixedstring(out, values):
+                values = np.ma.getdata(values)
+                if values.dtype.kind != 'S':
+                    values = np.array([_encode_bytes(v) for v in values.tolist()], dtype=object)
+                if len(values) > 0 and max(len(v) for v in values.tolist()) > size:
+                    raise Exception('Values are longer than %s' % type)
+                out.append(values.astype(dtype).tobytes())
+            return encode_fixedstring
+        if type == 'String':
+            def encode_string(out, values):
+                prefix = bytearray()
+                for value in np.ma.getdata(values).tolist():
+                    value = _encode_bytes(value)
+                    write_varint(prefix, len(value))
+                    out.append(bytes(prefix))
+                    out.append(value)
+                    del prefix[:]
+            return encode_string
+        if type == 'UUID':
+            def encode_uuid(out, values):
+                numbers = [0 if v is None else (v if isinstance(v, uuid.UUID) else uuid.UUID(str(v))).int
+                           for v in np.ma.getdata(values).tolist()]
+                out.append(b''.join(_UUID.pack(x >> 64, x & 0xffffffffffffffff) for x in numbers))
+            return encode_uuid
+        if type == 'IPv4':
+            def encode_ipv4(out, values):
+                out.append(np.array([0 if v is None else int(ipaddress.IPv4Address(v))
+                                     for v in np.ma.getdata(values).tolist()], dtype='<u4').tobytes())
+            return encode_ipv4
+        if type == 'IPv6':
+            def encode_ipv6(out, values):
+                out.append(b''.join(b'\0' * 16 if v is None else ipaddress.IPv6Address(v).packed
+                                    for v in np.ma.getdata(values).tolist()))
+            return encode_ipv6
+        if type.startswith('Array(') and type.endswith(')'):
+            inner = self.make_column_encoder(type[6:-1].strip(), servertz)
+
+            def encode_array(out, values):
+                offsets, flat = _flatten(np.ma.getdata(values), lambda v: v)
+                out.append(offsets.tobytes())
+                inner(out, flat)
+            return encode_array
+        if type.startswith('Map(') and type.endswith(')'):
+            keytype, valuetype = parse_variant_types(type[4:-1])
+            encode_keys = self.make_column_encoder(keytype, servertz)
+            encode_values = self.make_column_encoder(valuetype, servertz)
+
+            def encode_map(out, values):
+                values = np.ma.getdata(values)
+                offsets, keys = _flatten(values, lambda v: list(v.keys()))
+                out.append(offsets.tobytes())
+                encode_keys(out, keys)
+                encode_values(out, _flatten(values, lambda v: list(v.values()))[1])
+            return encode_map
+
+        raise Exception('Type %s is not supported by insert_columns' % type)
+
+    def _make_lowcardinality_encoder(self, type, servertz):
+        nullable = type.startswith('Nullable(') and type.endswith(')')
+        keys_encoder = self.make_column_encoder(type[len('Nullable('):-1] if nullable else type, servertz)
+
+        def encode_lowcardinality(out, values):
+            if len(values) == 0:
+                return
+            if nullable:
+                mask, values = _null_mask(values)
+            else:
+                mask, values = None, np.ma.getdata(values)
+            if values.dtype.kind == 'O':
+                # np.unique sorts, which is not possible with None, so the keys are collected in a dictionary instead
+                positions = dict()
+                indexes = np.fromiter((positions.setdefault(v, len(positions)) for v in values.tolist()),
+                                      dtype=np.int64, count=len(values))
+                keys = np.fromiter(positions, dtype=object, count=len(positions))
+            else:
+                keys, indexes = np.unique(values, return_inverse=True)
+            if nullable:
+                # the first key of a nullable dictionary stands for NULL
+                keys = np.concatenate([np.zeros(1, dtype=keys.dtype) if keys.dtype.kind != 'O' else
+                                       np.array([None], dtype=object), keys])
+                indexes = np.where(mask, 0, indexes + 1)
+            index_type = _lowcardinality_index(len(keys))
+            out.append(_UINT64.pack(index_type | _LC_HAS_ADDITIONAL_KEYS | _LC_NEED_UPDATE_DICTIONARY))
+            out.append(_UINT64.pack(len(keys)))
+            keys_encoder(out, keys)
+            out.append(_UINT64.pack(len(indexes)))
+            out.append(indexes.astype(_LC_INDEX_DTYPES[index_type]).tobytes())
+        return encode_lowcardinality
+
+    def unformat_as_numpy(self, payload_b):
+        """
+        :return: a dictionary with field names as keys and numpy arrays as values. Nullable columns are returned as
+        masked arrays, Date and DateTime columns as datetime64 arrays (DateTime values are in UTC), String and Array
+        columns as arrays of objects.
+        """
+        columns = dict()
+        fields = []
+        pos = 0
+        end = len(payload_b)
+        while pos < end:
+            numcolumns, pos = read_varint(payload_b, pos)
+            rows, pos = read_varint(payload_b, pos)
+            for i in range(numcolumns):
+                length, pos = read_varint(payload_b, pos)
+                field = payload_b[pos:pos + length].decode('utf8')
+                pos += length
+                length, pos = read_varint(payload_b, pos)
+                type = payload_b[pos:pos + length].decode('utf8')
+                pos += length
+                if rows > 0:
+                    # the state prefixes of all (also nested) LowCardinality columns come before the data
+                    pos += len(self.make_state_prefix(type))
+                array, pos = self.make_column_decoder(type)(payload_b, pos, rows)
+                if field not in columns:
+                    fields.append(field)
+                    columns[field] = []
+                columns[field].append(array)
+
+        result = dict()
+        for field in fields:
+            blocks = columns[field]
+            if len(blocks) == 1:
+                result[field] = blocks[0]
+            elif isinstance(blocks[0], np.ma.MaskedArray):
+                result[field] = np.ma.concatenate(blocks)
+            else:
+                result[field] = np.concatenate(blocks)
+        return result
+
+    def make_column_decoder(self, type):
+        """
+        Return a callable reading a column of the passed Clickhouse type with the passed number of rows from a buffer
+        at a position, and returning a tuple of the numpy array and the position after it. The state prefix of the
+        column (see make_state_prefix) has to be skipped before.
+        """
+        if type.startswith('LowCardinality(') and type.endswith(')'):
+            return self._make_lowcardinality_decoder(type[len('LowCardinality('):-1])
+
+        if type.startswith('Nullable(') and type.endswith(')'):
+            inner = self.make_column_decoder(type[len('Nullable('):-1])
+
+            def decode_nullable(buf, pos, rows):
+                mask, pos = _frombuffer(buf, _NUMERIC_DTYPES['UInt8'], rows, pos)
+                values, pos = inner(buf, pos, rows)
+                return np.ma.masked_array(values, mask=mask.astype(bool)), pos
+            return decode_nullable
+
+        if type in _NUMERIC_DTYPES:
+            dtype = _NUMERIC_DTYPES[type]
+            return lambda buf, pos, rows: _frombuffer(buf, dtype, rows, pos)
+        if type == 'Bool':
+            return self._make_converting_decoder('UInt8', lambda x: x.view(bool))
+        if type == 'Date':
+            return self._make_converting_decoder('UInt16', lambda x: x.astype('datetime64[D]'))
+        if type == 'Date32':
+            return self._make_converting_decoder('Int32', lambda x: x.astype('datetime64[D]'))
+        if type == 'DateTime' or type.startswith('DateTime('):
+            return self._make_converting_decoder('UInt32', lambda x: x.astype('datetime64[s]'))
+        if type == 'DateTime64' or type.startswith('DateTime64('):
+            precision = int(type_arguments(type)[0]) if type.startswith('DateTime64(') else 3
+            unit = _DATETIME64_UNITS.get(precision)
+            if unit is not None:
+                return self._make_converting_decoder('Int64', lambda x: x.view('datetime64[%s]' % unit))
+            # precisions without an own numpy unit are scaled up to the next one
+            target = min(p for p in _DATETIME64_UNITS if p > precision)
+            factor = 10 ** (target - precision)
+            return self._make_converting_decoder('Int64', lambda x: (x * factor).view(
+                'datetime64[%s]' % _DATETIME64_UNITS[target]))
+        if type.startswith('Decimal32(') or type.startswith('Decimal64(') or (
+                type.startswith('Decimal(') and int(type_arguments(type)[0]) <= 18):
+            args = type_arguments(type)
+            scale = 10.0 ** int(args[-1])
+            storage = 'Int32' if type.startswith('Decimal32(') or (
+                type.startswith('Decimal(') and int(args[0]) <= 9) else 'Int64'
+            return self._make_converting_decoder(storage, lambda x: x / scale)
+        if type.startswith('Enum8(') or type.startswith('Enum16('):
+            names = dict()
+            for pair in parse_variant_types(type[type.index('(') + 1:-1]):
+                name, value = pair.rsplit('=', 1)
+                names[int(value)] = name.strip()[1:-1].replace("\\'", "'")
+            storage = 'Int8' if type.startswith('Enum8(') else 'Int16'
+            return self._make_converting_decoder(storage, lambda x: np.array([names[v] for v in x.tolist()],
+                                                                               dtype=object))
+        if type.startswith('FixedString('):
+            dtype = np.dtype('S%d' % int(type_arguments(type)[0]))
+            return lambda buf, pos, rows: _frombuffer(buf, dtype, rows, pos)
+        if type == 'String':
+            def decode_string(buf, pos, rows):
+                result = np.empty(rows, dtype=object)
+                for i in range(rows):
+                    length, pos = read_varint(buf, pos)
+                    end = pos + length
+                    result[i] = buf[pos:end].decode('utf8')
+                    pos = end
+                return result, pos
+            return decode_string
+        if type == 'UUID':
+            def decode_uuid(buf, pos, rows):
+                halves, end = _frombuffer(buf, _NUMERIC_DTYPES['UInt64'], rows * 2, pos)
+                halves = halves.tolist()
+                result = np.empty(rows, dtype=object)
+                for i in range(rows):
+                    result[i] = str(uuid.UUID(int=(halves[2 * i] << 64) | halves[2 * i + 1]))
+                return result, end
+            return decode_uuid
+        if type.startswith('Array(') and type.endswith(')'):
+            inner = self.make_column_decoder(type[6:-1].strip())
+
+            def decode_array(buf, pos, rows):
+                offsets, pos = _frombuffer(buf, _NUMERIC_DTYPES['UInt64'], rows, pos)
+                total = int(offsets[-1]) if rows > 0 else 0
+                values, pos = inner(buf, pos, total)
+                result = np.empty(rows, dtype=object)
+                start = 0
+                for i, stop in enumerate(offsets.tolist()):
+                    result[i] = values[start:stop]
+                    start = stop
+                return result, pos
+            return decode_array
+
+        raise Exception('Type %s is not supported by select_as_numpy' % type)
+
+    def _make_converting_decoder(self, storage, convert):
+        dtype = _NUMERIC_DTYPES[storage]
+
+        def decode_converting(buf, pos, rows):
+            values, pos = _frombuffer(buf, dtype, rows, pos)
+            return convert(values), pos
+        return decode_converting
+
+    def _make_lowcardinality_decoder(self, type):
+        nullable = type.startswith('Nullable(') and type.endswith(')')
+        keys_decoder = self.make_column_decoder(type[len('Nullable('):-1] if nullable else type)
+
+        def decode_lowcardinality(buf, pos, rows):
+            if rows == 0:
+                return keys_decoder(buf, pos, 0)[0], pos
+            serialization = _UINT64.unpack_from(buf, pos)[0]
+            pos += 8
+            if not serialization & _LC_HAS_ADDITIONAL_KEYS:
+                raise Exception('LowCardinality columns with global dictionaries are not supported')
+            numkeys = _UINT64.unpack_from(buf, pos)[0]
+            keys, pos = keys_decoder(buf, pos + 8, numkeys)
+            numindexes = _UINT64.unpack_from(buf, pos)[0]
+            indexes, pos = _frombuffer(buf, _LC_INDEX_DTYPES[serialization & _LC_INDEX_TYPE_MASK], numindexes, pos + 8)
+            values = keys[indexes]
+            if nullable:
+                # the first key of a nullable dictionary stands for NULL
+                return np.ma.masked_array(values, mask=indexes == 0), pos
+            return values, pos
+        return decode_lowcardinality
@@ -0,0 +1,169 @@
+import re
+import keyword
+import operator
+
+
+ROW_FORMATS = ['dict', 'tuple', 'record']
+
+
+class Record(tuple):
+    """
+    Base class of the records returned by selects if the row_format of the Cursor is 'record'. A record is a tuple of
+    the values in the order of the selected fields, which also allows to access the values by field name, both as
+    attributes (record.field) and as items (record['field']). The field names are stored once per query in the
+    record class, and not in every row like with dictionaries.
+    """
+    __slots__ = ()
+    _fields = ()
+    _indexes = {}
+
+    def __new__(cls, values):
+        return tuple.__new__(cls, values)
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return tuple.__getitem__(self, self._indexes[key])
+        return tuple.__getitem__(self, key)
+
+    def __contains__(self, key):
+        return key in self._indexes
+
+    def get(self, key, default=None):
+        index = self._indexes.get(key)
+        if index is None:
+            return default
+        return tuple.__getitem__(self, index)
+
+    def keys(self):
+        return list(self._fields)
+
+    def values(self):
+        return list(self)
+
+    def items(self):
+        return list(zip(self._fields, self))
+
+    def _asdict(self):
+        return dict(zip(self._fields, self))
+
+    def __repr__(self):
+        return 'Record(%s)' % ', '.join('%s=%r' % (f, v) for f, v in zip(self._fields, self))
+
+
+def make_record_class(fields):
+    """
+    Create a subclass of Record for the passed list of field names. Fields which are valid python identifiers and
+    don't collide with the methods of Record (like keys, get or count) are also available as attributes.
+    """
+    namespace = {
+        '__slots__': (),
+        '_fields': tuple(fields),
+        '_indexes': dict((f, i) for i, f in enumerate(fields)),
+    }
+    for i, field in enumerate(fields):
+        if re.match(r'^[A-Za-z]\w*$', field) and not keyword.iskeyword(field) and not hasattr(Record, field):
+            namespace[field] = property(operator.itemgetter(i))
+    return type('Record', (Record,), namespace)
+
+
+def make_row_factory(row_format, fields):
+    """
+    Return a callable creating a row of the passed row format ('dict', 'tuple' or 'record') from a list of values of
+    the passed fields.
+    """
+    if row_format == 'dict':
+        return lambda values: dict(zip(fields, values))
+    if row_format == 'tuple':
+        return tuple
+    if row_format == 'record':
+        return make_record_class(fields)
+    raise Exception('Row format %s is not supported, use one of %s' % (row_format, ', '.join(ROW_FORMATS)))
+
+
+def project(fields, columns):
+    """
+    Return the indexes of the passed columns in the list of fields of a result.
+    """
+    indexes = dict((f, i) for i, f in enumerate(fields))
+    result = []
+    for column in columns:
+        if column not in indexes:
+            raise Exception('Field %s is not in the result, available fields are %s' % (column, ', '.join(fields)))
+        result.append(indexes[column])
+    return result
+
+
+class LazyResult(object):
+    """
+    Result of a select, which keeps the received payload and parses its rows only when they are requested. The rows
+    parsed so far are kept in the rows list, so that they can be returned again.
+    """
+
+    def __init__(self, fields, types, pending, reparse=None):
+        """
+        :param fields: list of field names
+        :param types: list of Clickhouse types of the fields
+        :param pending: iterator parsing the rows from the payload
+        :param reparse: optional callable returning a new iterator over all rows of the payload, with only the
+        passed list of columns decoded
+        """
+        self.fields = fields
+        self.types = types
+        self.rows = []
+        self._pending = pending
+        self._reparse = reparse
+
+    def _parse(self, count):
+        if self._pending is None:
+            return
+        for row in self._pending:
+            self.rows.append(row)
+            count -= 1
+            if count <= 0:
+                return
+        self._pending = None # the payload can be freed now
+        self._reparse = None
+
+    def get(self, index):
+        """
+        Return the row with the passed index, or None if the result has fewer rows.
+        """
+        if index >= len(self.rows):
+            self._parse(index + 1 - len(self.rows))
+        if index >= len(self.rows):
+            return None
+        return self.rows[index]
+
+    def slice(self, start, stop):
+        """
+        Return the rows from start to stop (exclusive), parsing them if necessary.
+        """
+        if stop > len(self.rows):
+            self._parse(stop - len(self.rows))
+        return self.rows[start:stop]
+
+    def all(self):
+        """
+        Parse all remaining rows and return the list of all rows.
+        """
+        if self._pending is not None:
+            self.rows.extend(self._pending)
+            self._pending = None
+            self._reparse = None
+        return self.rows
+
+    def projection(self, columns):
+        """
+        Return all rows with only the passed columns. The rows are parsed again from the payload, decoding only the
+        passed columns, unless all rows are already parsed.
+        """
+        indexes = project(self.fields, columns)
+        if self._pending is not None and self._reparse is not None:
+            return list(self._reparse(columns))
+        rows = self.all()
+        if len(rows) == 0:
+            return []
+        if isinstance(rows[0], dict):
+            return [dict((c, row[c]) for c in columns) for row in rows]
+        make_row = make_record_class(columns) if isinstance(rows[0], Record) else tuple
+        return [make_row([row[i] for i in indexes]) for row in rows]
@@ -0,0 +1,748 @@
+import struct
+import uuid
+import ujson
+import ipaddress
+import datetime as dt
+from decimal import Decimal, Context
+
+import numpy as np
+from dateutil import tz
+
+from pyclickhouse.formatter import parse_variant_types, type_arguments, tuple_element_types, DictionaryAdapter, \
+    TabSeparatedWithNamesAndTypesFormatter, _SCALAR_CLASSES
+from pyclickhouse.records import make_row_factory, project
+
+
+_EPOCH_ORDINAL = dt.date(1970, 1, 1).toordinal()
+# enough precision for Decimal256, the default context would round to 28 digits
+_DECIMAL_CONTEXT = Context(prec=100)
+_EPOCH = dt.datetime(1970, 1, 1)
+_MIN_DATE = dt.date(1970, 1, 2)
+_MIN_DATETIME = dt.datetime(1970, 1, 2)
+_UTC_NAMES = frozenset(['UTC', 'Etc/UTC', 'GMT', 'Etc/GMT', 'UCT', 'Etc/UCT', 'Zulu', 'Etc/Zulu', 'Universal'])
+
+_FIXED_TYPES = {
+    'Int8': struct.Struct('<b'),
+    'Int16': struct.Struct('<h'),
+    'Int32': struct.Struct('<i'),
+    'Int64': struct.Struct('<q'),
+    'UInt8': struct.Struct('<B'),
+    'UInt16': struct.Struct('<H'),
+    'UInt32': struct.Struct('<I'),
+    'UInt64': struct.Struct('<Q'),
+    'Float64': struct.Struct('<d'),
+}
+
+_BIG_INT_TYPES = {
+    'Int128': (16, True),
+    'Int256': (32, True),
+    'UInt128': (16, False),
+    'UInt256': (32, False),
+}
+
+_OTHER_FIXED_SIZES = {
+    'Float32': 4, 'Bool': 1, 'Date': 2, 'Date32': 4, 'DateTime': 4, 'UUID': 16, 'IPv4': 4, 'IPv6': 16,
+}
+
+_FLOAT32 = struct.Struct('<f')
+_DATE32 = struct.Struct('<i')
+_UUID = struct.Struct('<QQ')
+
+
+def read_varint(buf, pos):
+    """
+    Read an unsigned LEB128 integer, as used by Clickhouse for lengths, starting at pos.
+    :return: tuple of the value and the position after it
+    """
+    result = 0
+    shift = 0
+    while True:
+        b = buf[pos]
+        pos += 1
+        result |= (b & 0x7f) << shift
+        if b < 0x80:
+            return result, pos
+        shift += 7
+
+
+def _fixed_size(type):
+    """
+    Return the size of the values of the passed type in bytes, or None if their size is variable.
+    """
+    if type in _FIXED_TYPES:
+        return _FIXED_TYPES[type].size
+    if type in _BIG_INT_TYPES:
+        return _BIG_INT_TYPES[type][0]
+    if type in _OTHER_FIXED_SIZES:
+        return _OTHER_FIXED_SIZES[type]
+    if type.startswith('DateTime(') or type.startswith('Enum8('):
+        return 4 if type.startswith('DateTime(') else 1
+    if type.startswith('DateTime64') or type.startswith('Enum16('):
+        return 8 if type.startswith('DateTime64') else 2
+    if type.startswith('FixedString('):
+        return int(type_arguments(type)[0])
+    return None
+
+
+def write_varint(out, value):
+    """
+    Append an unsigned LEB128 integer to the passed bytearray.
+    """
+    while value >= 0x80:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _write_string(out, value):
+    write_varint(out, len(value))
+    out += value
+
+
+def _read_string(buf, pos):
+    length, pos = read_varint(buf, pos)
+    end = pos + length
+    return buf[pos:end].decode('utf8'), end
+
+
+def _seconds(value, zone):
+    """
+    Return the unix timestamp of the wall clock time of value in the passed timezone (UTC if None). Like in the text
+    format, a timezone of the value itself is ignored.
+    """
+    value = value.replace(tzinfo=None)
+    if zone is None:
+        delta = value - _EPOCH
+        return delta.days * 86400 + delta.seconds
+    return int(value.replace(tzinfo=zone).timestamp())
+
+
+class RowBinaryWithNamesAndTypesFormatter(object):
+    """
+    Decodes results of selects in the RowBinaryWithNamesAndTypes format into the same list of dictionaries as
+    TabSeparatedWithNamesAndTypesFormatter.unformat does. The values are read directly from the binary payload using
+    struct, so no text parsing is involved.
+
+    Also encodes rows to be inserted in the RowBinaryWithNamesAndTypes format, with the same handling of missing
+    values as TabSeparatedWithNamesAndTypesFormatter.format.
+    """
+
+    def __init__(self):
+        self.adapter = DictionaryAdapter()
+        self.textformatter = TabSeparatedWithNamesAndTypesFormatter() # used to infer the types of Variant values
+
+    def format(self, rows, fields, types, timezone=None):
+        """
+        Encode the rows for an insert.
+        :param rows: list of dictionaries (or other iterable of rows)
+        :param fields: list of the fields to insert
+        :param types: list of the Clickhouse types of the fields
+        :param timezone: timezone of the server, the naive DateTime values of columns without explicit timezone are
+        interpreted in it. If omitted, UTC is assumed.
+        :return: the payload as bytes
+        """
+        return b''.join(self.iter_format(rows, fields, types, timezone))
+
+    def iter_format(self, rows, fields, types, timezone=None, chunk_size=65536):
+        """
+        Like format, but yield the payload in chunks of about chunk_size bytes while consuming the rows.
+        """
+        getval = self.adapter.getval
+        plan = self._make_plan(fields, types, timezone)
+        out = bytearray(self.format_header(fields, types))
+        for r in rows:
+            for f, encode in plan:
+                encode(out, getval(r, f))
+            if len(out) >= chunk_size:
+                yield bytes(out)
+                out = bytearray()
+        if len(out) > 0:
+            yield bytes(out)
+
+    def format_rows(self, rows, fields, types, timezone=None):
+        """
+        :return: the encoded rows without the header, as bytes, so that the results of several calls can be
+        concatenated after one header
+        """
+        getval = self.adapter.getval
+        plan = self._make_plan(fields, types, timezone)
+        out = bytearray()
+        for r in rows:
+            for f, encode in plan:
+                encode(out, getval(r, f))
+        return bytes(out)
+
+    def iter_batches(self, rows, fields, types, max_batch_bytes, max_batch_rows=None, timezone=None):
+        """
+        Encode the rows into complete payloads (each including the header with the fields and types) of at most
+        max_batch_bytes and max_batch_rows each, yielded as soon as they are filled. Each row is encoded exactly once,
+        and only one batch is held in memory at a time. A single row larger than max_batch_bytes is sent as a batch of
+        its own.
+        :param max_batch_bytes: maximal number of bytes per batch, or None for no limit
+        :param max_batch_rows: maximal number of rows per batch, or None for no limit
+        """
+        getval = self.adapter.getval
+        plan = self._make_plan(fields, types, timezone)
+        header = self.format_header(fields, types)
+        out = bytearray(header)
+        count = 0
+        for r in rows:
+            end = len(out)
+            for f, encode in plan:
+                encode(out, getval(r, f))
+            if count > 0 and max_batch_bytes is not None and len(out) > max_batch_bytes:
+                yield bytes(out[:end])
+                out = bytearray(header) + out[end:]
+                count = 0
+            count += 1
+            if max_batch_rows is not None and count >= max_batch_rows:
+                yield bytes(out)
+                out = bytearray(header)
+                count = 0
+        if count > 0:
+            yield bytes(out)
+
+    def _make_plan(self, fields, types, timezone):
+        servertz = self._servertz(timezone)
+        servertz = None if servertz is tz.UTC else servertz
+        return [(f, self.make_encoder(t, f, servertz)) for f, t in zip(fields, types)]
+
+    def format_header(self, fields, types):
+        """
+        :return: the header of a payload with the fields and types, as bytes
+        """
+        out = bytearray()
+        write_varint(out, len(fields))
+        for f in fields:
+            _write_string(out, f.encode('utf8'))
+        for t in types:
+            _write_string(out, t.encode('utf8'))
+        return bytes(out)
+
+    def make_encoder(self, type, name, servertz=None):
+        """
+        Return a callable appending a value of the passed Clickhouse type to a bytearray. The struct formats and all
+        other decisions depending on the type are made once here.
+        :param servertz: timezone for DateTime columns without explicit timezone, None for UTC
+        """
+        encode = self._make_encoder(type, name, servertz)
+
+        def encode_field(out, value):
+            try:
+                encode(out, value)
+            except Exception as e:
+                raise Exception('Cannot format field %s, %r' % (name, e))
+        return encode_field
+
+    def _make_encoder(self, type, name, servertz):
+        if type.startswith('LowCardinality(') and type.endswith(')'):
+            type = type[len('LowCardinality('):-1]
+
+        if type.startswith('Nullable(') and type.endswith(')'):
+            inner = self._make_encoder(type[len('Nullable('):-1], name, servertz)
+
+            def encode_nullable(out, value):
+                if value is None:
+                    out.append(1)
+                else:
+                    out.append(0)
+                    inner(out, value)
+            return encode_nullable
+
+        if type in _FIXED_TYPES or type == 'Float32':
+            pack = (_FIXED_TYPES.get(type) or _FLOAT32).pack
+            zero = pack(0)
+
+            def encode_fixed(out, value):
+                if value is None:
+                    out += zero
+                else:
+                    out += pack(value)
+            return encode_fixed
+        if type in _BIG_INT_TYPES:
+            size, signed = _BIG_INT_TYPES[type]
+
+            def encode_bigint(out, value):
+                out += int(value or 0).to_bytes(size, 'little', signed=signed)
+            return encode_bigint
+        if type == 'Bool':
+            def encode_bool(out, value):
+                out.append(1 if value else 0)
+            return encode_bool
+        if type == 'String' or type.startswith('FixedString('):
+            size = int(type_arguments(type)[0]) if type.startswith('FixedString(') else None
+
+            def encode_string(out, value):
+                if value is None:
+                    value = b''
+                elif isinstance(value, str):
+                    value = value.encode('utf8')
+                elif not isinstance(value, bytes):
+                    # like in the text format, values of other types are converted to strings
+                    if isinstance(value, bool) or isinstance(value, int) or isinstance(value, float):
+                        value = str(value)
+                    elif isinstance(value, dt.date):
+                        value = value.strftime('%Y-%m-%d')
+                    else:
+                        value = ujson.dumps(value)
+                    value = value.encode('utf8')
+                if size is None:
+                    _write_string(out, value)
+                elif len(value) > size:
+                    raise Exception('%r is longer than %s' % (value, type))
+                else:
+                    out += value + b'\0' * (size - len(value))
+            return encode_string
+        if type == 'UUID':
+            pack = _UUID.pack
+
+            def encode_uuid(out, value):
+                number = 0 if value is None else (value if isinstance(value, uuid.UUID) else uuid.UUID(str(value))).int
+                out += pack(number >> 64, number & 0xffffffffffffffff)
+            return encode_uuid
+        if type == 'IPv4':
+            pack = _FIXED_TYPES['UInt32'].pack
+
+            def encode_ipv4(out, value):
+                out += pack(0 if value is None else int(ipaddress.IPv4Address(value)))
+            return encode_ipv4
+        if type == 'IPv6':
+            def encode_ipv6(out, value):
+                out += b'\0' * 16 if value is None else ipaddress.IPv6Address(value).packed
+            return encode_ipv6
+        if type == 'Date' or type == 'Date32':
+            pack = (_FIXED_TYPES['UInt16'] if type == 'Date' else _DATE32).pack
+
+            def encode_date(out, value):
+                if value is None or (type == 'Date' and value <= _MIN_DATE):
+                    out += pack(0)
+                else:
+                    out += pack(value.toordinal() - _EPOCH_ORDINAL)
+            return encode_date
+        if type == 'DateTime' or type.startswith('DateTime('):
+            pack = _FIXED_TYPES['UInt32'].pack
+            zone = tz.gettz(type_arguments(type)[0]) if type.startswith('DateTime(') else servertz
+
+            def encode_datetime(out, value):
+                if value is None or value.replace(tzinfo=None) <= _MIN_DATETIME:
+                    out += pack(0)
+                else:
+                    out += pack(_seconds(value, zone))
+            return encode_datetime
+        if type == 'DateTime64' or type.startswith('DateTime64('):
+            pack = _FIXED_TYPES['Int64'].pack
+            args = type_arguments(type) if type.startswith('DateTime64(') else ['3']
+            scale = 10 ** int(args[0])
+            zone = tz.gettz(args[1]) if len(args) > 1 else servertz
+
+            def encode_datetime64(out, value):
+                if value is None or value.replace(tzinfo=None) <= _MIN_DATETIME:
+                    out += pack(0)
+                else:
+                    out += pack((_seconds(value, zone) * 1000000 + value.microsecond) * scale // 1000000)
+            return encode_datetime64
+        if type.startswith('Decimal'):
+            args = type_arguments(type)
+            if type.startswith('Decimal('):
+                precision, scale = int(args[0]), int(args[1])
+            else:
+                precision, scale = {'Decimal32': 9, 'Decimal64': 18, 'Decimal128': 38, 'Decimal256': 76}[
+                    type[:type.index('(')]], int(args[0])
+            size = 4 if precision <= 9 else 8 if precision <= 18 else 16 if precision <= 38 else 32
+
+            def encode_decimal(out, value):
+                number = int(Decimal(0 if value is None else str(value)).scaleb(scale, _DECIMAL_CONTEXT)
+                             .to_integral_value(context=_DECIMAL_CONTEXT))
+                out += number.to_bytes(size, 'little', signed=True)
+            return encode_decimal
+        if type.startswith('Enum8(') or type.startswith('Enum16('):
+            pack = (_FIXED_TYPES['Int8'] if type.startswith('Enum8(') else _FIXED_TYPES['Int16']).pack
+            values = dict()
+            for pair in parse_variant_types(type[type.index('(') + 1:-1]):
+                enumname, value = pair.rsplit('=', 1)
+                values[enumname.strip()[1:-1].replace("\\'", "'")] = int(value)
+
+            def encode_enum(out, value):
+                out += pack(value if isinstance(value, int) else values[value])
+            return encode_enum
+        if type.startswith('Array(') and type.endswith(')'):
+            element = self._make_encoder(type[6:-1].strip(), name, servertz)
+
+            def encode_array(out, value):
+                if value is None:
+                    out.append(0)
+                    return
+                write_varint(out, len(value))
+                for x in value:
+                    element(out, x)
+            return encode_array
+        if type.startswith('Map(') and type.endswith(')'):
+            spec = [x.strip() for x in parse_variant_types(type[4:-1])]
+            if len(spec) != 2:
+                raise Exception('Cannot format type %s, it is malformed' % type)
+            key = self._make_encoder(spec[0], name, servertz)
+            val = self._make_encoder(spec[1], name, servertz)
+
+            def encode_map(out, value):
+                if value is None:
+                    out.append(0)
+                    return
+                write_varint(out, len(value))
+                for k, v in value.items():
+                    key(out, k)
+                    val(out, v)
+            return encode_map
+        if type.startswith('Tuple(') and type.endswith(')'):
+            elements = [self._make_encoder(x, name, servertz) for x in tuple_element_types(type)]
+
+            def encode_tuple(out, value):
+                for element, x in zip(elements, value):
+                    element(out, x)
+            return encode_tuple
+        if type.startswith('Variant(') and type.endswith(')'):
+            # the discriminator is the index of the type in the alphabetically sorted list of variant types
+            spec = sorted(parse_variant_types(type[8:-1]))
+            encoders = [self._make_encoder(x, name, servertz) for x in spec]
+            discriminators = dict((x, i) for i, x in enumerate(spec))
+            classtypes = dict()
+
+            def encode_variant(out, value):
+                if value is None:
+                    out.append(255)
+                    return
+                # the inferred type only depends on the class for scalar values
+                real_type = classtypes.get(value.__class__)
+                if real_type is None:
+                    real_type = self.textformatter.clickhousetypefrompython(value, name)
+                    if value.__class__ in _SCALAR_CLASSES:
+                        classtypes[value.__class__] = real_type
+                if real_type not in discriminators:
+                    raise Exception('%s with type %s is not covered by %s' % (name, real_type, type))
+                discriminator = discriminators[real_type]
+                out.append(discriminator)
+                encoders[discriminator](out, value)
+            return encode_variant
+
+        raise Exception('Type %s is not supported in the RowBinaryWithNamesAndTypes format' % type)
+
+    def unformat(self, payload_b, timezone=None, row_format='dict'):
+        """
+        :param payload_b: bytes of the response
+        :param timezone: timezone of the server (the X-ClickHouse-Timezone response header), used for DateTime columns
+        without explicit timezone. If omitted, UTC is assumed.
+        :param row_format: 'dict', 'tuple' or 'record', see pyclickhouse.records
+        """
+        return self.unformat_with_header(payload_b, timezone, row_format)[2]
+
+    def unformat_with_header(self, payload_b, timezone=None, row_format='dict'):
+        """
+        Like unformat, but also return the field names and the Clickhouse types of the result.
+        :return: tuple of the list of fields, the list of types and the list of rows
+        """
+        fields, types, rows = self.iter_unformat(payload_b, timezone, row_format)
+        return fields, types, list(rows)
+
+    def iter_unformat(self, payload_b, timezone=None, row_format='dict', columns=None):
+        """
+        Parse the header of the result and return an iterator, which parses the rows only when they are requested.
+        :param columns: optional list of fields to return. Only these fields are decoded, the others are skipped.
+        :return: tuple of the list of fields, the list of types and the iterator over the rows
+        """
+        if len(payload_b) == 0:
+            raise Exception('Unexpected error, no result')
+        columns_count, pos = read_varint(payload_b, 0)
+        fields = []
+        for i in range(columns_count):
+            field, pos = _read_string(payload_b, pos)
+            fields.append(field)
+        types = []
+        for i in range(columns_count):
+            type, pos = _read_string(payload_b, pos)
+            types.append(type)
+
+        if columns is not None:
+            indexes = project(fields, columns)
+            servertz = self._servertz(timezone)
+            readers = [self.make_skipper(t) for t in types]
+            for i in indexes:
+                readers[i] = self.make_decoder(types[i], servertz)
+            rows = self._iter_projected(payload_b, pos, readers, indexes, make_row_factory(row_format, columns))
+            return [fields[i] for i in indexes], [types[i] for i in indexes], rows
+
+        decoders = self.compile_decoders(types, timezone)
+        if row_format == 'dict':
+            rows = self._iter_dicts(payload_b, pos, list(zip(fields, decoders)))
+        else:
+            rows = self._iter_rows(payload_b, pos, decoders, make_row_factory(row_format, fields))
+        return fields, types, rows
+
+    def _iter_dicts(self, payload_b, pos, plan):
+        end = len(payload_b)
+        while pos < end:
+            row = dict()
+            for field, decoder in plan:
+                row[field], pos = decoder(payload_b, pos)
+            yield row
+
+    def _iter_rows(self, payload_b, pos, decoders, make_row):
+        end = len(payload_b)
+        while pos < end:
+            values = []
+            for decoder in decoders:
+                value, pos = decoder(payload_b, pos)
+                values.append(value)
+            yield make_row(values)
+
+    def _iter_projected(self, payload_b, pos, readers, indexes, make_row):
+        end = len(payload_b)
+        while pos < end:
+            values = []
+            for reader in readers:
+                value, pos = reader(payload_b, pos)
+                values.append(value)
+            yield make_row([values[i] for i in indexes])
+
+    def _servertz(self, timezone):
+        return tz.gettz(timezone) if timezone and timezone not in _UTC_NAMES else tz.UTC
+
+    def compile_decoders(self, types, timezone=None):
+        servertz = self._servertz(timezone)
+        return [self.make_decoder(t, servertz) for t in types]
+
+    def make_skipper(self, type):
+        """
+        Return a callable like the one of make_decoder, which only moves the position behind the value without
+        decoding it, where possible.
+        """
+        if type.startswith('LowCardinality(') and type.endswith(')'):
+            type = type[len('LowCardinality('):-1]
+
+        if type.startswith('Nullable(') and type.endswith(')'):
+            inner = self.make_skipper(type[len('Nullable('):-1])
+
+            def skip_nullable(buf, pos):
+                if buf[pos]:
+                    return None, pos + 1
+                return inner(buf, pos + 1)
+            return skip_nullable
+
+        size = _fixed_size(type)
+        if size is not None:
+            def skip_fixed(buf, pos):
+                return None, pos + size
+            return skip_fixed
+        if type == 'String':
+            def skip_string(buf, pos):
+                length, pos = read_varint(buf, pos)
+                return None, pos + length
+            return skip_string
+        if type.startswith('Array(') and type.endswith(')'):
+            element = self.make_skipper(type[6:-1].strip())
+            elementsize = _fixed_size(type[6:-1].strip())
+
+            def skip_array(buf, pos):
+                length, pos = read_varint(buf, pos)
+                if elementsize is not None:
+                    return None, pos + length * elementsize
+                for i in range(length):
+                    _, pos = element(buf, pos)
+                return None, pos
+            return skip_array
+        return self.make_decoder(type)
+
+    def make_decoder(self, type, servertz=tz.UTC):
+        """
+        Return a callable reading a value of the passed Clickhouse type from a buffer at a position, and returning
+        a tuple of the value and the position after it.
+        """
+        if type.startswith('LowCardinality(') and type.endswith(')'):
+            type = type[len('LowCardinality('):-1]
+
+        if type.startswith('Nullable(') and type.endswith(')'):
+            inner = self.make_decoder(type[len('Nullable('):-1], servertz)
+
+            def decode_nullable(buf, pos):
+                if buf[pos]:
+                    return None, pos + 1
+                return inner(buf, pos + 1)
+            return decode_nullable
+
+        if type in _FIXED_TYPES:
+            unpack = _FIXED_TYPES[type].unpack_from
+            size = _FIXED_TYPES[type].size
+
+            def decode_fixed(buf, pos):
+                return unpack(buf, pos)[0], pos + size
+            return decode_fixed
+        if type in _BIG_INT_TYPES:
+            size, signed = _BIG_INT_TYPES[type]
+
+            def decode_bigint(buf, pos):
+                end = pos + size
+                return int.from_bytes(buf[pos:end], 'little', signed=signed), end
+            return decode_bigint
+        if type == 'Float32':
+            unpack = _FLOAT32.unpack_from
+
+            def decode_float32(buf, pos):
+                # the shortest representation of the single precision value, as Clickhouse prints it in text formats
+                return float(str(np.float32(unpack(buf, pos)[0]))), pos + 4
+            return decode_float32
+        if type == 'Bool':
+            def decode_bool(buf, pos):
+                return buf[pos] != 0, pos + 1
+            return decode_bool
+        if type == 'String':
+            return _read_string
+        if type.startswith('FixedString('):
+            size = int(type_arguments(type)[0])
+
+            def decode_fixedstring(buf, pos):
+                end = pos + size
+                return buf[pos:end].decode('utf8'), end
+            return decode_fixedstring
+        if type == 'UUID':
+            unpack = _UUID.unpack_from
+
+            def decode_uuid(buf, pos):
+                high, low = unpack(buf, pos)
+                return str(uuid.UUID(int=(high << 64) | low)), pos + 16
+            return decode_uuid
+        if type == 'IPv4':
+            unpack = _FIXED_TYPES['UInt32'].unpack_from
+
+            def decode_ipv4(buf, pos):
+                v = unpack(buf, pos)[0]
+                return '%d.%d.%d.%d' % (v >> 24, (v >> 16) & 255, (v >> 8) & 255, v & 255), pos + 4
+            return decode_ipv4
+        if type == 'IPv6':
+            def decode_ipv6(buf, pos):
+                end = pos + 16
+                address = ipaddress.IPv6Address(bytes(buf[pos:end]))
+                if address.ipv4_mapped is not None:
+                    return '::ffff:%s' % address.ipv4_mapped, end
+                return str(address), end
+            return decode_ipv6
+        if type == 'Date':
+            unpack = _FIXED_TYPES['UInt16'].unpack_from
+
+            def decode_date(buf, pos):
+                days = unpack(buf, pos)[0]
+                if days == 0:
+                    return None, pos + 2
+                return dt.date.fromordinal(_EPOCH_ORDINAL + days), pos + 2
+            return decode_date
+        if type == 'Date32':
+            unpack = _DATE32.unpack_from
+
+            def decode_date32(buf, pos):
+                days = unpack(buf, pos)[0]
+                if days == 0:
+                    return None, pos + 4
+                return dt.date.fromordinal(_EPOCH_ORDINAL + days), pos + 4
+            return decode_date32
+        if type == 'DateTime' or type.startswith('DateTime('):
+            unpack = _FIXED_TYPES['UInt32'].unpack_from
+            if type.startswith('DateTime('):
+                tzinfo = tz.gettz(type_arguments(type)[0])
+
+                def decode_datetime(buf, pos):
+                    return dt.datetime.fromtimestamp(unpack(buf, pos)[0], tzinfo), pos + 4
+            elif servertz is tz.UTC:
+                def decode_datetime(buf, pos):
+                    return _EPOCH + dt.timedelta(seconds=unpack(buf, pos)[0]), pos + 4
+            else:
+                def decode_datetime(buf, pos):
+                    return dt.datetime.fromtimestamp(unpack(buf, pos)[0], servertz).replace(tzinfo=None), pos + 4
+            return decode_datetime
+        if type == 'DateTime64' or type.startswith('DateTime64('):
+            unpack = _FIXED_TYPES['Int64'].unpack_from
+            args = type_arguments(type) if type.startswith('DateTime64(') else ['3']
+            scale = 10 ** int(args[0])
+            tzinfo = tz.gettz(args[1]) if len(args) > 1 else None
+
+            def decode_datetime64(buf, pos):
+                seconds, fraction = divmod(unpack(buf, pos)[0], scale)
+                tmp = dt.datetime.fromtimestamp(seconds, tzinfo or servertz).replace(
+                    microsecond=fraction * 1000000 // scale)
+                if tzinfo is None:
+                    tmp = tmp.replace(tzinfo=None)
+                return tmp, pos + 8
+            return decode_datetime64
+        if type.startswith('Decimal'):
+            args = type_arguments(type)
+            if type.startswith('Decimal('):
+                precision, scale = int(args[0]), int(args[1])
+            else:
+                precision, scale = {'Decimal32': 9, 'Decimal64': 18, 'Decimal128': 38, 'Decimal256': 76}[
+                    type[:type.index('(')]], int(args[0])
+            size = 4 if precision <= 9 else 8 if precision <= 18 else 16 if precision <= 38 else 32
+
+            def decode_decimal(buf, pos):
+                end = pos + size
+                number = Decimal(int.from_bytes(buf[pos:end], 'little', signed=True))
+                return number.scaleb(-scale, _DECIMAL_CONTEXT), end
+            return decode_decimal
+        if type.startswith('Enum8(') or type.startswith('Enum16('):
+            unpack = (_FIXED_TYPES['Int8'] if type.startswith('Enum8(') else _FIXED_TYPES['Int16']).unpack_from
+            size = 1 if type.startswith('Enum8(') else 2
+            names = dict()
+            for pair in parse_variant_types(type[type.index('(') + 1:-1]):
+                name, value = pair.rsplit('=', 1)
+                names[int(value)] = name.strip()[1:-1].replace("\\'", "'")
+
+            def decode_enum(buf, pos):
+                return names[unpack(buf, pos)[0]], pos + size
+            return decode_enum
+        if type == 'Nothing':
+            def decode_nothing(buf, pos):
+                return None, pos
+            return decode_nothing
+        if type.startswith('Array(') and type.endswith(')'):
+            element = self.make_decoder(type[6:-1].strip(), servertz)
+
+            def decode_array(buf, pos):
+                length, pos = read_varint(buf, pos)
+                result = []
+                for i in range(length):
+                    value, pos = element(buf, pos)
+                    result.append(value)
+                return result, pos
+            return decode_array
+        if type.startswith('Map(') and type.endswith(')'):
+            spec = [x.strip() for x in parse_variant_types(type[4:-1])]
+            if len(spec) != 2:
+                raise Exception('Cannot unformat type %s, it is malformed' % type)
+            key = self.make_decoder(spec[0], servertz)
+            val = self.make_decoder(spec[1], servertz)
+
+            def decode_map(buf, pos):
+                length, pos = read_varint(buf, pos)
+                result = dict()
+                for i in range(length):
+                    k, pos = key(buf, pos)
+                    result[k], pos = val(buf, pos)
+                return result, pos
+            return decode_map
+        if type.startswith('Tuple(') and type.endswith(')'):
+            elements = [self.make_decoder(x, servertz) for x in tuple_element_types(type)]
+
+            def decode_tuple(buf, pos):
+                result = []
+                for element in elements:
+                    value, pos = element(buf, pos)
+                    result.append(value)
+                return tuple(result), pos
+            return decode_tuple
+        if type.startswith('Variant(') and type.endswith(')'):
+            # the discriminator is the index of the type in the alphabetically sorted list of variant types
+            variants = [self.make_decoder(x, servertz) for x in sorted(parse_variant_types(type[8:-1]))]
+
+            def decode_variant(buf, pos):
+                discriminator = buf[pos]
+                if discriminator == 255:
+                    return None, pos + 1
+                return variants[discriminator](buf, pos + 1)
+            return decode_variant
+
+        raise Exception('Type %s is not supported in the RowBinaryWithNamesAndTypes format' % type)
@@ -0,0 +1,171 @@
+import http.client
+import ssl
+import threading
+import zlib
+
+from requests.structures import CaseInsensitiveDict
+
+
+_DECOMPRESSION_WBITS = {'gzip': 16 + zlib.MAX_WBITS, 'deflate': zlib.MAX_WBITS}
+
+
+class HTTPClientResponse(object):
+    """
+    A response received by HTTPClientTransport, with the attributes and methods of a response of requests used by
+    pyclickhouse: status_code, ok, headers, content, iter_content and close. The body is decompressed, if the server
+    compressed it. The TCP connection is returned to the pool as soon as the body has been read completely.
+    """
+
+    def __init__(self, transport, connection, response):
+        self.transport = transport
+        self.connection = connection
+        self.response = response
+        self.status_code = response.status
+        self.reason = response.reason
+        self.ok = response.status < 400
+        self.headers = CaseInsensitiveDict(response.getheaders())
+        encoding = self.headers.get('Content-Encoding', '').lower()
+        self._decompressor = zlib.decompressobj(_DECOMPRESSION_WBITS[encoding]) \
+            if encoding in _DECOMPRESSION_WBITS else None
+        self._content = None
+        self._released = False
+
+    @property
+    def content(self):
+        if self._content is None:
+            try:
+                content = self.response.read()
+                if self._decompressor is not None:
+                    content = self._decompressor.decompress(content) + self._decompressor.flush()
+                self._content = content
+            finally:
+                self.close()
+        return self._content
+
+    def iter_content(self, chunk_size=1):
+        """
+        Yield the body in chunks of at most about chunk_size bytes while it is being received.
+        """
+        try:
+            while True:
+                data = self.response.read1(chunk_size)
+                if len(data) == 0:
+                    break
+                if self._decompressor is not None:
+                    data = self._decompressor.decompress(data)
+                if len(data) > 0:
+                    yield data
+            if self._decompressor is not None:
+                data = self._decompressor.flush()
+                if len(data) > 0:
+                    yield data
+        finally:
+            self.close()
+
+    def close(self):
+        """
+        Return the TCP connection to the pool, if the body has been read completely, otherwise close it.
+        """
+        if not self._released:
+            self._released = True
+            # read1 doesn't close the response after its last bytes, if the length of the body is known
+            complete = self.response.isclosed() or self.response.length == 0
+            if not complete:
+                self.response.close()
+            self.transport._release(self.connection, complete and not self.response.will_close)
+
+
+class HTTPClientTransport(object):
+    """
+    Sends the requests of a Connection with http.client over a pool of keep-alive TCP connections, avoiding the per
+    request overhead of requests (session and adapter machinery, hooks, cookies, URL parsing). Use it with
+    Connection(..., transport='http.client'), or pass an instance as transport to share the pool between Connections
+    to the same server.
+
+    Any object having the methods request and close like this class can be passed as transport to a Connection.
+    """
+
+    def __init__(self, host, port, secure=False, server_cert=True, timeout=5, pool_maxsize=10):
+        """
+        :param host: hostname or ip of clickhouse host
+        :param port: port of the Http interface
+        :param secure: whether to use TLS
+        :param server_cert: if using TLS, the file of the CA bundle or of the server certificate, or False to skip
+        the verification of the certificate
+        :param timeout: seconds to wait for connecting and for each read from the server
+        :param pool_maxsize: maximum number of idle TCP connections kept open
+        """
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.pool_maxsize = pool_maxsize
+        self.context = None
+        if secure:
+            if isinstance(server_cert, str):
+                self.context = ssl.create_default_context(cafile=server_cert)
+            else:
+                self.context = ssl.create_default_context()
+                if not server_cert:
+                    self.context.check_hostname = False
+                    self.context.verify_mode = ssl.CERT_NONE
+        self.idle = []
+        self.lock = threading.Lock()
+
+    def request(self, method, path, body, headers, stream=False):
+        """
+        Send a request and receive the status and headers of the response. If stream is False, the body is read too.
+
+        :param method: 'GET' or 'POST'
+        :param path: path and query string of the URL, e.g. '/?enable_http_compression=1'
+        :param body: None, bytes, or an iterable of byte chunks, which is sent with chunked transfer encoding
+        :param headers: dictionary of the headers to send
+        :return: an HTTPClientResponse
+        """
+        replayable = body is None or isinstance(body, bytes)
+        while True:
+            connection, reused = self._connect()
+            try:
+                connection.request(method, path, body, headers)
+                response = connection.getresponse()
+                break
+            except (http.client.HTTPException, ConnectionError):
+                connection.close()
+                # the server may have closed the idle connection in the meantime
+                if not reused or not replayable:
+                    raise
+            except BaseException:
+                connection.close()
+                raise
+        r = HTTPClientResponse(self, connection, response)
+        if not stream:
+            r.content
+        return r
+
+    def close(self):
+        """
+        Close the idle TCP connections of the pool.
+        """
+        with self.lock:
+            idle = self.idle
+            self.idle = []
+        for connection in idle:
+            connection.close()
+
+    def _connect(self):
+        """
+        :return: tuple of an idle pooled connection or a new one, and whether it was pooled
+        """
+        with self.lock:
+            if len(self.idle) > 0:
+                return self.idle.pop(), True
+        if self.context is not None:
+            return http.client.HTTPSConnection(self.host, self.port, timeout=self.timeout, context=self.context), False
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout), False
+
+    def _release(self, connection, reusable):
+        if reusable:
+            with self.lock:
+                if len(self.idle) < self.pool_maxsize:
+                    self.idle.append(connection)
+                    return
+        connection.close()
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""
+Measures the bytes on the wire of a typical bulkinsert payload and of a select result, with and without HTTP
+compression. Needs a running Clickhouse (or a local stand-in), run it with
+python -m test.compressionbenchmark [host:port]
+"""
+import sys
+import time
+
+import pyclickhouse
+from pyclickhouse.compression import COMPRESSION_METHODS, compress_chunks, iter_slices
+from pyclickhouse.formatter import TabSeparatedWithNamesAndTypesFormatter
+
+
+def make_rows(count):
+    return [{'id': i, 'category': 'category%d' % (i % 10), 'url': 'https://example.com/products/%d' % (i % 500),
+             'price': i % 1000 / 10.0} for i in range(count)]
+
+
+def measure_insert(rows):
+    _, _, payload = TabSeparatedWithNamesAndTypesFormatter().format(rows)
+    payload = payload.encode('utf8')
+    print('insert, uncompressed: %d bytes' % len(payload))
+    for method in COMPRESSION_METHODS:
+        try:
+            start = time.time()
+            size = sum(len(x) for x in compress_chunks(iter_slices(payload), method))
+            print('insert, %s: %d bytes (%.1f%%), %.3f sec' % (method, size, 100.0 * size / len(payload),
+                                                               time.time() - start))
+        except Exception as e:
+            print('insert, %s: %s' % (method, e))
+
+
+def measure_select(host):
+    for compress_response in [False, True]:
+        conn = pyclickhouse.Connection(host, compress_response=compress_response)
+        conn.open()
+        r = conn._call('select * from compressionbenchmark format TabSeparatedWithNamesAndTypes', stream=True)
+        try:
+            size = len(r.raw.read(decode_content=False))
+        finally:
+            r.close()
+        print('select, %s: %d bytes' % ('compressed' if compress_response else 'uncompressed', size))
+
+
+if __name__ == '__main__':
+    host = sys.argv[1] if len(sys.argv) > 1 else 'localhost:8123'
+    rows = make_rows(200000)
+    measure_insert(rows)
+    cursor = pyclickhouse.Connection(host, compression='gzip').cursor()
+    cursor.ddl('drop table if exists compressionbenchmark')
+    cursor.ddl('create table compressionbenchmark (id Int64, category String, url String, price Float64) '
+               'Engine=MergeTree order by id')
+    cursor.bulkinsert('compressionbenchmark', rows)
+    measure_select(host)
+    cursor.ddl('drop table compressionbenchmark')
@@ -0,0 +1,65 @@
+# coding=utf-8
+import unittest
+
+import pyclickhouse
+from pyclickhouse.adaptive import error_code
+
+
+class TestAdaptiveBatching(unittest.TestCase):
+    def setUp(self):
+        self.conn = pyclickhouse.Connection('localhost:8124')
+        self.cursor = self.conn.cursor()
+
+    def test_batch_size(self):
+        adaptive = pyclickhouse.AdaptiveBatching(batch_rows=1000, min_rows=100, max_rows=5000, target_seconds=1.0)
+        adaptive.success(1000, 0.1)
+        self.assertEqual(adaptive.batch_rows, 2000)
+        adaptive.success(2000, 0.1)
+        adaptive.success(4000, 0.1)
+        self.assertEqual(adaptive.batch_rows, 5000)
+        adaptive.success(5000, 2.0)
+        self.assertEqual(adaptive.batch_rows, 2500)
+        adaptive.success(10, 0.0001)
+        self.assertEqual(adaptive.batch_rows, 2500)
+
+    def test_pushback(self):
+        adaptive = pyclickhouse.AdaptiveBatching(batch_rows=1000, min_rows=300, min_delay=0.5, max_delay=1.5,
+                                                 max_retries=3)
+        parts = Exception("Query raised error b'Code: 252. DB::Exception: Too many parts (300).'")
+        memory = Exception("Query raised error b'Code: 241. DB::Exception: Memory limit (total) exceeded'")
+        self.assertEqual(error_code(parts), 252)
+        self.assertEqual(adaptive.pushback(parts), 0.5)
+        self.assertEqual(adaptive.batch_rows, 1000)
+        self.assertEqual(adaptive.pushback(memory), 1.0)
+        self.assertEqual(adaptive.batch_rows, 500)
+        self.assertEqual(adaptive.pushback(memory), 1.5)
+        self.assertEqual(adaptive.batch_rows, 300)
+        self.assertRaises(Exception, lambda: adaptive.pushback(memory))
+        adaptive.success(300, 0.5)
+        self.assertEqual(adaptive.pushback(memory), 0.5)
+        self.assertRaises(ValueError, lambda: adaptive.pushback(ValueError('Code: 60. Table does not exist')))
+
+    def test_bulkinsert(self):
+        self.cursor.ddl('drop table if exists adaptivetest')
+        self.cursor.ddl('create table adaptivetest (id Int64) Engine=MergeTree order by id')
+        adaptive = pyclickhouse.AdaptiveBatching(batch_rows=100, min_rows=10, target_seconds=10, min_delay=0.01)
+        self.cursor.adaptive_batching = adaptive
+        execute = self.cursor.executewithpayload
+        calls = []
+
+        def flaky(query, payload, parseresult, *args):
+            calls.append(query)
+            if len(calls) == 2:
+                raise Exception('Query %s raised error Code: 241. DB::Exception: Memory limit exceeded' % query)
+            return execute(query, payload, parseresult, *args)
+        self.cursor.executewithpayload = flaky
+        self.cursor.bulkinsert('adaptivetest', [{'id': i} for i in range(2000)])
+        self.cursor.executewithpayload = execute
+        self.assertEqual(len(calls), 7)  # 100, 200 (failed), 100, 200, 400, 800, 400
+        self.assertEqual(adaptive.batch_rows, 1600)
+        self.cursor.select('select count() as c, uniqExact(id) as u from adaptivetest')
+        self.assertEqual(self.cursor.fetchone(), {'c': 2000, 'u': 2000})
+
+
+if __name__ == '__main__':
+    unittest.main(__name__)
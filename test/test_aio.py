@@ -0,0 +1,134 @@
+import unittest
+import asyncio
+import datetime as dt
+
+import pyclickhouse
+from pyclickhouse.aio import AsyncConnection
+
+
+class StandInServer(object):
+    """
+    Minimal asyncio HTTP server answering every query with the same TabSeparatedWithNamesAndTypes body, sent with
+    chunked transfer encoding over keep-alive connections.
+    """
+
+    def __init__(self, body, chunk_size=7):
+        self.body = body
+        self.chunk_size = chunk_size
+        self.connections = 0
+        self.requests = []
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, '127.0.0.1', 0)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        try:
+            while True:
+                line = await reader.readline()
+                if len(line) == 0:
+                    break
+                headers = {}
+                while True:
+                    header = await reader.readline()
+                    if header == b'\r\n':
+                        break
+                    name, value = header.decode().split(':', 1)
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+                self.requests.append((line, body))
+                writer.write(b'HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n')
+                for i in range(0, len(self.body), self.chunk_size):
+                    chunk = self.body[i:i + self.chunk_size]
+                    writer.write(b'%x\r\n' % len(chunk) + chunk + b'\r\n')
+                writer.write(b'0\r\n\r\n')
+                await writer.drain()
+        finally:
+            writer.close()
+
+
+class TestAio(unittest.TestCase):
+    def setUp(self):
+        self.cursor = pyclickhouse.Connection('localhost:8124').cursor()
+
+    def test_select(self):
+        async def run():
+            async with AsyncConnection('localhost:8124') as conn:
+                await conn.open()
+                cursor = conn.cursor()
+                await cursor.select('select number, toString(number) as s, toDate(number + 1) as d '
+                                    'from system.numbers limit %s', 3)
+                self.assertEqual(cursor.description[0][:2], ('number', 'UInt64'))
+                self.assertEqual(cursor.fetchall(), [
+                    {'number': 0, 's': '0', 'd': dt.date(1970, 1, 2)},
+                    {'number': 1, 's': '1', 'd': dt.date(1970, 1, 3)},
+                    {'number': 2, 's': '2', 'd': dt.date(1970, 1, 4)}])
+                rows = [r async for r in cursor.iter_select('select number from system.numbers limit 50000')]
+                self.assertEqual(rows, [{'number': i} for i in range(50000)])
+                with self.assertRaises(Exception):
+                    await cursor.select('select * from nonexistingtable')
+                await cursor.select('select 1 as one')
+                self.assertEqual(cursor.fetchone(), {'one': 1})
+        asyncio.run(run())
+
+    def test_concurrency(self):
+        async def select(conn, i):
+            cursor = conn.cursor()
+            await cursor.select('select %s as i', i)
+            return cursor.fetchone()['i']
+
+        async def run():
+            async with AsyncConnection('localhost:8124', pool_maxsize=3) as conn:
+                r = await asyncio.gather(*[select(conn, i) for i in range(20)])
+                self.assertEqual(r, list(range(20)))
+                self.assertLessEqual(len(conn.idle), 3)
+        asyncio.run(run())
+
+    def test_bulkinsert(self):
+        self.cursor.ddl('drop table if exists aiotest')
+        self.cursor.ddl('create table aiotest (id Int64, name String, day Date) Engine=MergeTree order by id')
+        rows = [{'id': i, 'name': 'name\t%d' % i, 'day': dt.date(2020, 1, 1) + dt.timedelta(i)} for i in range(1000)]
+
+        async def run():
+            conn = AsyncConnection('localhost:8124', compression='gzip', compress_response=True)
+            cursor = conn.cursor()
+            cursor.max_batch_rows = 100
+            await cursor.bulkinsert('aiotest', rows[:250])
+            await cursor.bulkinsert('aiotest', iter(rows[250:500]))
+            cursor.insert_format = 'RowBinaryWithNamesAndTypes'
+            await cursor.bulkinsert('aiotest', rows[500:750])
+            await cursor.bulkinsert('aiotest', iter(rows[750:]))
+            await cursor.select('select * from aiotest order by id')
+            self.assertEqual(cursor.fetchall(), rows)
+            self.assertEqual([r async for r in cursor.iter_select('select * from aiotest order by id')], rows)
+            await conn.close()
+        asyncio.run(run())
+        self.cursor.ddl('drop table if exists aiotest')
+
+    def test_stand_in_server(self):
+        server = StandInServer(b'id\tname\nUInt64\tString\n1\ta\n2\tb\n3\tlonger text\n')
+
+        async def run():
+            port = await server.start()
+            async with AsyncConnection('127.0.0.1', port, pool_maxsize=2) as conn:
+                cursor = conn.cursor()
+                for i in range(5):
+                    await cursor.select('select id, name from t')
+                    self.assertEqual(cursor.fetchall(), [{'id': 1, 'name': 'a'}, {'id': 2, 'name': 'b'},
+                                                         {'id': 3, 'name': 'longer text'}])
+                rows = [r async for r in cursor.iter_select('select id, name from t')]
+                self.assertEqual([r['id'] for r in rows], [1, 2, 3])
+            await server.stop()
+        asyncio.run(run())
+        self.assertEqual(server.connections, 1)
+        self.assertEqual(len(server.requests), 6)
+        self.assertTrue(server.requests[0][1].endswith(b'FORMAT TabSeparatedWithNamesAndTypes'))
+
+
+if __name__ == '__main__':
+    unittest.main(__name__)
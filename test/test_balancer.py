@@ -0,0 +1,171 @@
+import unittest
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pyclickhouse
+from pyclickhouse import Balancer
+
+
+class StubServer(ThreadingHTTPServer):
+    """
+    Answers every query with the same one row result after delay seconds, counts the queries and records the paths
+    and bodies of the requests. KILL QUERY is answered immediately.
+    """
+    daemon_threads = True
+
+    def __init__(self, port=0, delay=0.0):
+        self.delay = delay
+        self.queries = 0
+        self.requests = []
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                self.respond(b'Ok.\n')
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                self.server.requests.append((self.path, body))
+                if not body.startswith(b'KILL QUERY'):
+                    self.server.queries += 1
+                    time.sleep(self.server.delay)
+                self.respond(b'one\nUInt8\n1\n')
+
+            def respond(self, body):
+                self.wfile.write(b'HTTP/1.1 200 OK\r\nContent-Length: %d\r\n\r\n' % len(body) + body)
+
+            def log_message(self, format, *args):
+                pass
+
+        ThreadingHTTPServer.__init__(self, ('127.0.0.1', port), Handler)
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def connection(self):
+        return pyclickhouse.Connection('127.0.0.1', self.server_address[1], transport='http.client')
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def unused_port():
+    s = socket.socket()
+    s.bind(('127.0.0.1', 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+class TestBalancer(unittest.TestCase):
+    def setUp(self):
+        self.servers = []
+
+    def tearDown(self):
+        for server in self.servers:
+            server.stop()
+
+    def start(self, port=0, delay=0.0):
+        server = StubServer(port, delay)
+        self.servers.append(server)
+        return server
+
+    def test_round_robin(self):
+        servers = [self.start(), self.start()]
+        cursor = Balancer([s.connection() for s in servers], policy='round_robin').cursor()
+        for i in range(10):
+            cursor.select('select 1 as one')
+            self.assertEqual(cursor.fetchone(), {'one': 1})
+        self.assertEqual([s.queries for s in servers], [5, 5])
+
+    def test_ewma_prefers_fast_node(self):
+        fast, slow = self.start(), self.start(delay=0.05)
+        cursor = Balancer([fast.connection(), slow.connection()], policy='ewma').cursor()
+        for i in range(40):
+            cursor.select('select 1 as one')
+        self.assertLessEqual(slow.queries, 2)
+        self.assertEqual(fast.queries + slow.queries, 40)
+
+    def test_ewma_readmitted_node(self):
+        balancer = Balancer([self.start().connection(), self.start().connection()], policy='ewma')
+        balancer.nodes[0].latency = 0.01
+        balancer.nodes[1].outstanding = 3
+        # the node without latency counts as an average one, so it doesn't get all calls
+        for i in range(4):
+            self.assertIs(balancer._choose([]), balancer.nodes[0])
+            balancer._done(balancer.nodes[0], None)
+
+    def test_least_outstanding(self):
+        servers = [self.start(delay=0.05), self.start(delay=0.05)]
+        balancer = Balancer([s.connection() for s in servers], policy='least_outstanding')
+
+        def select():
+            cursor = balancer.cursor()
+            for i in range(5):
+                cursor.select('select 1 as one')
+
+        threads = [threading.Thread(target=select) for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual([s.queries for s in servers], [10, 10])
+
+    def test_ejection_and_readmission(self):
+        port = unused_port()
+        alive = self.start()
+        balancer = Balancer([pyclickhouse.Connection('127.0.0.1', port, transport='http.client'), alive.connection()],
+                            policy='round_robin', ejection_time=0.1)
+        cursor = balancer.cursor()
+        for i in range(10):
+            cursor.select('select 1 as one')
+            self.assertEqual(cursor.fetchone(), {'one': 1})
+        self.assertEqual(alive.queries, 10)
+        self.assertIsNotNone(balancer.nodes[0].ejected_until)
+
+        revived = self.start(port)
+        for i in range(50):
+            if balancer.nodes[0].ejected_until is None:
+                break
+            time.sleep(0.1)
+        self.assertIsNone(balancer.nodes[0].ejected_until)
+        for i in range(10):
+            cursor.select('select 1 as one')
+        self.assertEqual(revived.queries, 5)
+        balancer.close()
+
+    def test_probing_after_close(self):
+        port = unused_port()
+        alive = self.start()
+        balancer = Balancer([pyclickhouse.Connection('127.0.0.1', port, transport='http.client'), alive.connection()],
+                            policy='round_robin', ejection_time=0.1)
+        balancer.close()
+        cursor = balancer.cursor()
+        for i in range(2):
+            cursor.select('select 1 as one')
+        self.assertIsNotNone(balancer.nodes[0].ejected_until)
+        self.start(port)
+        for i in range(50):
+            if balancer.nodes[0].ejected_until is None:
+                break
+            time.sleep(0.1)
+        self.assertIsNone(balancer.nodes[0].ejected_until)
+        balancer.close()
+
+    def test_query_errors_are_not_retried(self):
+        connections = [pyclickhouse.Connection('localhost:8124'), pyclickhouse.Connection('localhost:8124')]
+        balancer = Balancer(connections)
+        cursor = balancer.cursor()
+        self.assertRaises(Exception, lambda: cursor.select('select * from nonexistingtable'))
+        self.assertEqual([n.failures for n in balancer.nodes], [0, 0])
+        self.assertEqual([n.outstanding for n in balancer.nodes], [0, 0])
+        cursor.select('select 1 as one')
+        self.assertEqual(cursor.fetchone(), {'one': 1})
+
+
+if __name__ == '__main__':
+    unittest.main(__name__)
@@ -0,0 +1,98 @@
+# coding=utf-8
+import unittest
+import threading
+import time
+
+import pyclickhouse
+from pyclickhouse.formatter import ObjectAdapter
+
+
+class TestBufferedInserter(unittest.TestCase):
+    def setUp(self):
+        self.conn = pyclickhouse.Connection('localhost:8124')
+        self.cursor = self.conn.cursor()
+        self.cursor.ddl('drop table if exists bufferedtest')
+        self.cursor.ddl('create table bufferedtest (id Int64, thread Int64) Engine=MergeTree order by id')
+
+    def count(self):
+        self.cursor.select('select count() as c from bufferedtest')
+        return self.cursor.fetchone()['c']
+
+    def test_many_producers(self):
+        with pyclickhouse.BufferedInserter(self.conn, 'bufferedtest', max_rows=500, max_age=60) as inserter:
+            def produce(thread):
+                for i in range(1000):
+                    inserter.insert({'id': i, 'thread': thread})
+            threads = [threading.Thread(target=produce, args=(t,)) for t in range(4)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        self.assertEqual(self.count(), 4000)
+        self.assertRaises(Exception, lambda: inserter.insert({'id': 1, 'thread': 1}))
+
+    def test_max_age(self):
+        inserter = pyclickhouse.BufferedInserter(self.conn, 'bufferedtest', max_age=0.2)
+        inserter.insert_many([{'id': 1, 'thread': 0}, {'id': 2, 'thread': 0}])
+        self.assertEqual(self.count(), 0)
+        time.sleep(1)
+        self.assertEqual(self.count(), 2)
+        inserter.close()
+
+    def test_max_bytes(self):
+        inserter = pyclickhouse.BufferedInserter(self.conn, 'bufferedtest', max_bytes=1000, max_age=60)
+        inserter.insert_many([{'id': i, 'thread': 0} for i in range(10)])
+        time.sleep(0.5)
+        self.assertEqual(self.count(), 0)
+        inserter.insert_many([{'id': i, 'thread': 0} for i in range(1000)])
+        time.sleep(0.5)
+        self.assertEqual(self.count(), 1010)
+        inserter.close()
+
+    def test_failed_insert(self):
+        failed = []
+        inserter = pyclickhouse.BufferedInserter(self.conn, 'bufferedtest', max_age=60,
+                                                 on_failure=lambda rows, e: failed.extend(rows))
+        inserter.insert({'id': 1, 'thread': 'not a number'})
+        self.assertRaises(Exception, inserter.flush)
+        # a bad row is not retried, so that it doesn't block the following ones
+        self.assertEqual(len(inserter.rows), 0)
+        self.assertEqual(failed, [{'id': 1, 'thread': 'not a number'}])
+        inserter.insert({'id': 2, 'thread': 0})
+        inserter.close()
+        self.assertEqual(self.count(), 1)
+
+    def test_transient_error(self):
+        failed = []
+        unreachable = pyclickhouse.Connection('127.0.0.1', 1, transport='http.client')
+        unreachable.state = 'opened'  # skip the ping of cursor
+        inserter = pyclickhouse.BufferedInserter(unreachable, 'bufferedtest', fields=['id', 'thread'],
+                                                 types=['Int64', 'Int64'], max_age=60, max_retries=2,
+                                                 on_failure=lambda rows, e: failed.extend(rows))
+        inserter.insert({'id': 1, 'thread': 0})
+        for i in range(2):
+            self.assertRaises(Exception, inserter.flush)
+            self.assertEqual(len(inserter.rows), 1)
+        self.assertRaises(Exception, inserter.flush)
+        self.assertEqual(len(inserter.rows), 0)
+        self.assertEqual(len(failed), 1)
+        inserter.close()
+
+    def test_estimate_size(self):
+        class Row(object):
+            __slots__ = ['id', 'thread']
+
+            def __init__(self, id, thread):
+                self.id = id
+                self.thread = thread
+
+        inserter = pyclickhouse.BufferedInserter(self.conn, 'bufferedtest', max_age=60)
+        self.assertEqual(inserter._estimate_size({'id': 10, 'thread': 1}), 5)
+        inserter.cursor.formatter.adapter = ObjectAdapter()
+        self.assertEqual(inserter._estimate_size(Row(10, 1)), 5)
+        inserter.insert(Row(10, 1))
+        inserter.close()
+        self.assertEqual(self.count(), 1)
+
+if __name__ == '__main__':
+    unittest.main(__name__)
@@ -0,0 +1,36 @@
+# coding=utf-8
+import gzip
+import unittest
+import zlib
+
+import pyclickhouse
+from pyclickhouse.compression import compress_chunks, iter_slices
+
+
+class TestCompression(unittest.TestCase):
+    def test_compress_chunks(self):
+        data = b'abc\tdef\n' * 100000
+        compressed = b''.join(compress_chunks(iter_slices(data, 1000), 'gzip'))
+        self.assertEqual(gzip.decompress(compressed), data)
+        self.assertTrue(len(compressed) < len(data) / 100)
+        compressed = b''.join(compress_chunks([b'a', b'', b'b'], 'deflate', 9))
+        self.assertEqual(zlib.decompress(compressed), b'ab')
+        self.assertRaises(Exception, lambda: list(compress_chunks([b'a'], 'rar')))
+
+    def test_compressed_insert_and_select(self):
+        for compression in ['gzip', 'deflate']:
+            conn = pyclickhouse.Connection('localhost:8124', compression=compression, compress_response=True)
+            cursor = conn.cursor()
+            cursor.ddl('drop table if exists compressiontest')
+            cursor.ddl('create table compressiontest (id Int64, value String) Engine=MergeTree order by id')
+            cursor.bulkinsert('compressiontest', [{'id': i, 'value': 'value %d' % i} for i in range(1000)])
+            cursor.select('select count() as c, max(value) as m from compressiontest')
+            self.assertEqual(cursor.fetchone(), {'c': 1000, 'm': 'value 999'})
+            self.assertEqual(len(list(cursor.iter_select('select * from compressiontest'))), 1000)
+
+    def test_unavailable_compression(self):
+        self.assertRaises(Exception, lambda: pyclickhouse.Connection('localhost:8124', compression='rar'))
+
+
+if __name__ == '__main__':
+    unittest.main(__name__)
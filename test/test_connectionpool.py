@@ -0,0 +1,87 @@
+import unittest
+import threading
+
+from pyclickhouse import ConnectionPool
+
+
+class TestConnectionPool(unittest.TestCase):
+    def setUp(self):
+        self.pool = ConnectionPool('localhost:8124', maxsize=3, cursor_attributes={'row_format': 'tuple'})
+
+    def tearDown(self):
+        self.pool.close()
+
+    def test_threads(self):
+        errors = []
+
+        def select(i):
+            try:
+                for j in range(3):
+                    with self.pool.cursor() as cursor:
+                        cursor.select('select %s as i, number from system.numbers limit 3', i)
+                        self.assertEqual(cursor.fetchall(), [(i, 0), (i, 1), (i, 2)])
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=select, args=(i,)) for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(errors, [])
+        stats = self.pool.stats()
+        self.assertEqual(stats['acquired'], 24)
+        self.assertLessEqual(stats['max_in_use'], 3)
+        self.assertLessEqual(stats['created'], 3)
+        self.assertEqual(stats['in_use'], 0)
+        self.assertEqual(stats['idle'], stats['created'])
+
+    def test_timeout(self):
+        cursors = [self.pool.acquire() for i in range(3)]
+        self.assertEqual(self.pool.stats()['utilisation'], 1.0)
+        self.assertRaises(Exception, lambda: self.pool.acquire(block=False))
+        self.assertRaises(Exception, lambda: self.pool.acquire(timeout=0.05))
+        self.assertEqual(self.pool.stats()['timeouts'], 2)
+        self.pool.release(cursors[0])
+        self.assertIs(self.pool.acquire(timeout=0.05), cursors[0])
+
+    def test_double_release(self):
+        cursor = self.pool.acquire()
+        self.pool.release(cursor)
+        self.assertRaises(Exception, lambda: self.pool.release(cursor))
+        other = ConnectionPool('localhost:8124').acquire()
+        self.assertRaises(Exception, lambda: self.pool.release(other))
+        stats = self.pool.stats()
+        self.assertEqual((stats['in_use'], stats['idle']), (0, 1))
+        self.assertIsNot(self.pool.acquire(), self.pool.acquire())
+
+    def test_attributes_are_reset(self):
+        with self.pool.cursor() as cursor:
+            cursor.row_format = 'dict'
+            cursor.select_format = 'RowBinaryWithNamesAndTypes'
+            cursor.max_batch_rows = 10
+            cursor.custom = 1
+            cursor.select('select 1 as one')
+        with self.pool.cursor() as reused:
+            self.assertIs(reused, cursor)
+            self.assertEqual(reused.row_format, 'tuple')
+            self.assertEqual(reused.select_format, 'TabSeparatedWithNamesAndTypes')
+            self.assertIsNone(reused.max_batch_rows)
+            self.assertFalse(hasattr(reused, 'custom'))
+            self.assertIsNone(reused.description)
+            reused.select('select 1 as one')
+            self.assertEqual(reused.fetchone(), (1,))
+
+    def test_replicas(self):
+        pool = ConnectionPool(['localhost:8124', 'localhost:8124'], balancer='least_outstanding')
+        with pool.cursor() as cursor:
+            for i in range(4):
+                cursor.select('select 1 as one')
+                self.assertEqual(cursor.fetchone(), {'one': 1})
+        self.assertEqual([n.failures for n in pool.balancer.nodes], [0, 0])
+        pool.close()
+        self.assertRaises(Exception, lambda: pool.acquire())
+
+
+if __name__ == '__main__':
+    unittest.main(__name__)
@@ -0,0 +1,65 @@
+# coding=utf-8
+import unittest
+import datetime as dt
+
+import pyclickhouse
+
+try:
+    import pandas as pd
+    import pyarrow
+    has_pyarrow = True
+except ImportError:
+    has_pyarrow = False
+
+
+@unittest.skipIf(not has_pyarrow, 'pandas and pyarrow are required')
+class TestDataframe(unittest.TestCase):
+    def setUp(self):
+        self.conn = pyclickhouse.Connection('localhost:8124')
+        self.cursor = self.conn.cursor()
+
+    def test_pyarrow_engine(self):
+        query = """
+        select number as id, toInt32(number) as i, if(number = 1, NULL, number) as n, toString(number) as s,
+            number / 4 as f, toDate('2020-01-01') + number as d, toDateTime('2020-01-01 00:00:00', 'UTC') + number as t
+        from system.numbers limit 3
+        """
+        self.cursor.dataframe_engine = 'pyarrow'
+        df = self.cursor.select_as_dataframe(query)
+        self.assertEqual(list(df.columns), ['id', 'i', 'n', 's', 'f', 'd', 't'])
+        self.assertEqual(str(df['id'].dtype), 'uint64')
+        self.assertEqual(str(df['i'].dtype), 'int32')
+        self.assertEqual(str(df['n'].dtype), 'UInt64')
+        self.assertEqual(df['n'].tolist(), [0, pd.NA, 2])
+        self.assertEqual(df['s'].tolist(), ['0', '1', '2'])
+        self.assertEqual(df['f'].tolist(), [0.0, 0.25, 0.5])
+        self.assertEqual(df['d'].tolist(), [dt.date(2020, 1, 1), dt.date(2020, 1, 2), dt.date(2020, 1, 3)])
+        self.assertEqual(df['t'][2], pd.Timestamp('2020-01-01 00:00:02', tz='UTC'))
+
+    def test_pyarrow_engine_parameters(self):
+        self.cursor.dataframe_engine = 'pyarrow'
+        df = self.cursor.select_as_dataframe('select number from system.numbers where number > %s limit 2', 5)
+        self.assertEqual(df['number'].tolist(), [6, 7])
+        df = self.cursor.select_as_dataframe('select number from system.numbers limit 2 format Parquet')
+        self.assertEqual(df['number'].tolist(), [0, 1])
+        self.assertRaises(Exception, lambda: self.cursor.select_as_dataframe('select 1 format JSONEachRow'))
+
+    def test_insert_dataframe(self):
+        self.cursor.ddl('drop table if exists dataframeinsert')
+        self.cursor.ddl("""create table dataframeinsert (id Int64, n Nullable(Int32), s Nullable(String),
+            t DateTime('UTC'), c LowCardinality(String)) Engine=MergeTree order by id""")
+        df = pd.DataFrame({'id': [1, 2, 3], 'n': pd.array([1, None, 3], dtype='Int64'), 's': ['a', None, 'c'],
+                           't': pd.to_datetime(['2020-01-01 01:00:00'] * 3).tz_localize('Europe/Berlin'),
+                           'c': pd.Categorical(['x', 'y', 'x'])})
+        self.cursor.insert_dataframe('dataframeinsert', df)
+        self.cursor.dataframe_engine = 'pyarrow'
+        r = self.cursor.select_as_dataframe('select * from dataframeinsert order by id')
+        self.assertEqual(r['n'].tolist(), [1, pd.NA, 3])
+        self.assertEqual(r['s'].tolist()[0::2], ['a', 'c'])
+        self.assertTrue(pd.isna(r['s'][1]))
+        self.assertEqual(r['t'][0], pd.Timestamp('2020-01-01 00:00:00', tz='UTC'))
+        self.assertEqual(r['c'].tolist(), ['x', 'y', 'x'])
+
+
+if __name__ == '__main__':
+    unittest.main(__name__)
@@ -0,0 +1,94 @@
+# coding=utf-8
+import unittest
+import datetime as dt
+import threading
+import time
+
+import pyclickhouse
+from pyclickhouse.formatter import TabSeparatedWithNamesAndTypesFormatter
+from pyclickhouse.rowbinary import RowBinaryWithNamesAndTypesFormatter
+
+
+class TestEncodingPool(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.pool = pyclickhouse.EncodingPool(2, shard_rows=100)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.pool.close()
+
+    def setUp(self):
+        self.conn = pyclickhouse.Connection('localhost:8124')
+        self.cursor = self.conn.cursor()
+        self.rows = [{'id': i, 'name': u'nä\tme%d' % i, 'day': dt.date(2020, 1, 1) + dt.timedelta(i % 100),
+                      'tags': ['a'] * (1 + i % 3)} for i in range(1000)]
+
+    def test_same_payload(self):
+        fields = ['id', 'name', 'day', 'tags']
+        types = ['Int64', 'String', 'Date', 'Array(String)']
+        formatter = TabSeparatedWithNamesAndTypesFormatter()
+        batches = list(self.pool.iter_batches('TabSeparatedWithNamesAndTypes', self.rows, fields, types, 10 ** 9))
+        self.assertEqual(batches, [formatter.format(self.rows, fields, types)[2].encode('utf8') + b'\n'])
+        formatter = RowBinaryWithNamesAndTypesFormatter()
+        batches = list(self.pool.iter_batches('RowBinaryWithNamesAndTypes', self.rows, fields, types, 10 ** 9, 300))
+        self.assertEqual([len(formatter.unformat(b)) for b in batches], [300, 300, 300, 100])
+        self.assertEqual(sum([formatter.unformat(b) for b in batches], []), formatter.unformat(
+            formatter.format(self.rows, fields, types)))
+        self.assertRaises(Exception, lambda: list(self.pool.iter_batches('JSON', self.rows, fields, types, 10 ** 9)))
+
+    def test_bulkinsert(self):
+        self.cursor.ddl('drop table if exists encodingpooltest')
+        self.cursor.ddl('create table encodingpooltest (id Int64, name String, day Date, tags Array(String)) '
+                        'Engine=MergeTree order by id')
+        self.cursor.encoding_pool = self.pool
+        self.cursor.max_batch_bytes = 5000
+        for insert_format in ['TabSeparatedWithNamesAndTypes', 'RowBinaryWithNamesAndTypes']:
+            self.cursor.insert_format = insert_format
+            self.cursor.bulkinsert('encodingpooltest', self.rows)
+        self.pool.senders = 3
+        self.cursor.bulkinsert('encodingpooltest', self.rows)
+        self.pool.senders = 1
+        self.cursor.select('select count() as c, uniqExact(id) as u, max(name) as m from encodingpooltest')
+        self.assertEqual(self.cursor.fetchone(), {'c': 3000, 'u': 1000, 'm': u'nä\tme999'})
+
+    def test_concurrent_senders(self):
+        cursor = pyclickhouse.Cursor([pyclickhouse.Connection('localhost:8124'),
+                                      pyclickhouse.Connection('localhost:8124')])
+        cursor.ddl('drop table if exists encodingpoolsenders')
+        cursor.ddl('create table encodingpoolsenders (id Int64, name String, day Date, tags Array(String)) '
+                   'Engine=MergeTree order by id')
+        cursor.encoding_pool = pyclickhouse.EncodingPool(1, shard_rows=100, senders=4)
+        cursor.max_batch_rows = 100
+        cursor.select('select 1 as one')
+        cursor.bulkinsert('encodingpoolsenders', self.rows)
+        self.assertIsNotNone(cursor.lastresult)
+        self.assertIsNone(cursor.lastparsedresult)
+        self.assertIsNone(cursor.description)
+        cursor.select('select count() as c, uniqExact(id) as u from encodingpoolsenders')
+        self.assertEqual(cursor.fetchone(), {'c': 1000, 'u': 1000})
+        self.assertEqual(len(cursor.connections), 2)
+        cursor.encoding_pool.close()
+
+    def test_failed_send(self):
+        pool = pyclickhouse.EncodingPool(1, senders=3)
+        lock = threading.Lock()
+        started, finished = [], []
+
+        def call(batch):
+            with lock:
+                started.append(batch)
+            if batch == 2:
+                raise Exception('failed')
+            time.sleep(0.2)
+            with lock:
+                finished.append(batch)
+
+        self.assertRaises(Exception, lambda: pool.send(call, iter(range(100))))
+        self.assertEqual(sorted(finished), sorted(b for b in started if b != 2))
+        self.assertLess(len(started), 10)
+        pool.close()
+
+
+if __name__ == '__main__':
+    unittest.main(__name__)
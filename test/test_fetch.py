@@ -0,0 +1,68 @@
+# coding=utf-8
+import unittest
+
+import pyclickhouse
+
+
+class TestFetch(unittest.TestCase):
+    def setUp(self):
+        self.conn = pyclickhouse.Connection('localhost:8124')
+        self.cursor = self.conn.cursor()
+
+    def test_fetchmany(self):
+        for select_format in ['TabSeparatedWithNamesAndTypes', 'RowBinaryWithNamesAndTypes']:
+            self.cursor.select_format = select_format
+            self.cursor.select('select number from system.numbers limit 5')
+            self.assertEqual(self.cursor.fetchone(), {'number': 0})
+            self.assertEqual(self.cursor.fetchmany(3), [{'number': 1}, {'number': 2}, {'number': 3}])
+            self.assertEqual(self.cursor.fetchmany(), [{'number': 4}])
+            self.assertEqual(self.cursor.fetchmany(3), [])
+            self.assertEqual(self.cursor.fetchone(), None)
+            self.assertEqual(len(self.cursor.fetchall()), 5)
+
+    def test_fetchmany_unparsed_result(self):
+        self.cursor.select('select 1 as one format JSONEachRow')
+        self.assertRaises(Exception, lambda: self.cursor.fetchmany(2))
+        self.assertRaises(Exception, lambda: list(self.cursor))
+
+    def test_rows_are_parsed_on_demand(self):
+        self.cursor.select('select number from system.numbers limit 100000')
+        self.assertEqual(self.cursor.fetchmany(2), [{'number': 0}, {'number': 1}])
+        self.assertEqual(len(self.cursor.lastparsedresult.rows), 2)
+        self.assertEqual(len(self.cursor.fetchall()), 100000)
+        self.assertEqual(self.cursor.fetchone(), {'number': 2})
+
+    def test_iteration(self):
+        self.cursor.row_format = 'tuple'
+        self.cursor.select('select number from system.numbers limit 3')
+        self.cursor.fetchone()
+        self.assertEqual(list(self.cursor), [(1,), (2,)])
+
+    def test_fetchall_columns(self):
+        query = "select number as id, toString(number) as s, [number] as a, toDate('2020-01-01') as d, " \
+                "toNullable(toUUID('00000000-0000-0000-0000-000000000001')) as u, map('k', number) as m " \
+                "from system.numbers limit 3"
+        for select_format in ['TabSeparatedWithNamesAndTypes', 'RowBinaryWithNamesAndTypes']:
+            self.cursor.select_format = select_format
+            for row_format in ['dict', 'tuple', 'record']:
+                self.cursor.row_format = row_format
+                self.cursor.select(query)
+                r = self.cursor.fetchall(columns=['m', 'id'])
+                self.assertEqual(len(r), 3)
+                if row_format == 'dict':
+                    self.assertEqual(r[2], {'m': {'k': 2}, 'id': 2})
+                else:
+                    self.assertEqual(r[2], ({'k': 2}, 2))
+                self.assertEqual(len(self.cursor.fetchall()), 3)
+                # projection of already parsed rows
+                self.assertEqual(self.cursor.fetchall(columns=['s'])[1]['s' if row_format != 'tuple' else 0], '1')
+            self.assertRaises(Exception, lambda: self.cursor.fetchall(columns=['missing']))
+
+    def test_no_rows(self):
+        self.cursor.select('select number from system.numbers limit 0')
+        self.assertEqual(self.cursor.fetchone(), None)
+        self.assertEqual(self.cursor.fetchall(), [])
+
+
+if __name__ == '__main__':
+    unittest.main(__name__)
@@ -0,0 +1,99 @@
+import concurrent.futures
+import threading
+import unittest
+import time
+
+import pyclickhouse
+from pyclickhouse import Hedging
+from pyclickhouse.Cursor import Cursor
+from test.test_balancer import StubServer
+
+
+class TestHedging(unittest.TestCase):
+    def setUp(self):
+        self.servers = []
+        self.hedging = Hedging(delay=0.05)
+
+    def tearDown(self):
+        self.hedging.close()
+        for server in self.servers:
+            server.stop()
+
+    def start(self, delay=0.0):
+        server = StubServer(delay=delay)
+        self.servers.append(server)
+        return server
+
+    def test_slow_replica_is_hedged_and_killed(self):
+        slow, fast = self.start(delay=1.0), self.start()
+        cursor = Cursor([slow.connection(), fast.connection()])
+        cursor.hedging = self.hedging
+        start = time.time()
+        cursor.select('select 1 as one')
+        self.assertEqual(cursor.fetchone(), {'one': 1})
+        self.assertLess(time.time() - start, 0.5)
+        self.assertEqual(self.hedging.hedged, 1)
+        # the latency of the select is measured from its start, not from the hedge
+        self.assertGreaterEqual(self.hedging.latencies[0], 0.05)
+        for i in range(50):
+            if len(slow.requests) == 2:
+                break
+            time.sleep(0.01)
+        self.assertIn('query_id=', slow.requests[0][0])
+        query_id = slow.requests[0][0].split('query_id=')[1]
+        self.assertEqual(slow.requests[1][1], b"KILL QUERY WHERE query_id = '%s' ASYNC" % query_id.encode())
+
+        # the next select goes to the fast replica first and is not hedged
+        cursor.select('select 1 as one')
+        self.assertEqual(self.hedging.hedged, 1)
+        self.assertEqual(fast.queries, 2)
+
+    def test_failed_replica(self):
+        fast = self.start()
+        cursor = Cursor([pyclickhouse.Connection('127.0.0.1', 1, transport='http.client'), fast.connection()])
+        cursor.hedging = Hedging(delay=10)
+        start = time.time()
+        cursor.select('select 1 as one')
+        self.assertEqual(cursor.fetchone(), {'one': 1})
+        self.assertLess(time.time() - start, 5)
+        cursor.hedging.close()
+
+    def test_cancelled_loser(self):
+        class CancelledConnection(object):
+            host, port = 'replica', 8123
+
+            def _request(self, query, payload=None, stream=False, params=None):
+                raise Exception('Query %s raised error Code: 394. DB::Exception: Query was cancelled.' % query)
+
+        future = concurrent.futures.Future()
+        future.query_id = 'id'
+        with self.assertNoLogs(level='WARNING'):
+            Hedging._run(future, CancelledConnection(), 'select 1', time.time())
+        self.assertIsNotNone(future.exception())
+
+    def test_daemon_threads(self):
+        before = set(threading.enumerate())
+        hedging = Hedging(workers=2, kill_workers=1)
+        threads = set(threading.enumerate()) - before
+        self.assertTrue(len(threads) >= 3)
+        self.assertTrue(all(t.daemon for t in threads))
+        hedging.close()
+
+    def test_percentile(self):
+        hedging = Hedging(percentile=90, min_samples=10, min_delay=0.001)
+        self.assertEqual(hedging.current_delay(), 0.1)
+        hedging.latencies.extend([i / 100.0 for i in range(1, 101)])
+        self.assertAlmostEqual(hedging.current_delay(), 0.91)
+        hedging.close()
+
+    def test_clickhouse(self):
+        cursor = Cursor([pyclickhouse.Connection('localhost:8124'), pyclickhouse.Connection('localhost:8124')])
+        cursor.hedging = self.hedging
+        for i in range(4):
+            cursor.select('select number from system.numbers limit %s', 3)
+            self.assertEqual(cursor.fetchall(), [{'number': 0}, {'number': 1}, {'number': 2}])
+        self.assertRaises(Exception, lambda: cursor.select('select * from nonexistingtable'))
+
+
+if __name__ == '__main__':
+    unittest.main(__name__)
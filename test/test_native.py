@@ -0,0 +1,114 @@
+# coding=utf-8
+import unittest
+import datetime as dt
+
+import numpy as np
+
+import pyclickhouse
+
+
+class TestNative(unittest.TestCase):
+    def setUp(self):
+        self.conn = pyclickhouse.Connection('localhost:8124')
+        self.cursor = self.conn.cursor()
+
+    def test_select_as_numpy(self):
+        r = self.cursor.select_as_numpy("""
+        select number as u, toInt32(number - 1) as i, number / 2 as f, toString(number) as s,
+            if(modulo(number, 2) = 1, NULL, number) as n, toDate('2020-01-01') + number as d,
+            toDateTime('2020-01-01 00:00:00', 'UTC') + number as t, toDateTime64('2020-01-01 00:00:00.5', 3, 'UTC') as t64,
+            [number, 10] as a, toLowCardinality(toString(modulo(number, 2))) as lc
+        from system.numbers limit %s
+        """, 3)
+        self.assertEqual(r['u'].dtype, np.uint64)
+        self.assertEqual(r['u'].tolist(), [0, 1, 2])
+        self.assertEqual(r['i'].dtype, np.int32)
+        self.assertEqual(r['i'].tolist(), [-1, 0, 1])
+        self.assertEqual(r['f'].tolist(), [0.0, 0.5, 1.0])
+        self.assertEqual(r['s'].tolist(), ['0', '1', '2'])
+        self.assertTrue(isinstance(r['n'], np.ma.MaskedArray))
+        self.assertEqual(r['n'].tolist(), [0, None, 2])
+        self.assertEqual(r['d'].tolist()[2].isoformat(), '2020-01-03')
+        self.assertEqual(r['t'][1], np.datetime64('2020-01-01T00:00:01'))
+        self.assertEqual(r['t64'][0], np.datetime64('2020-01-01T00:00:00.500'))
+        self.assertEqual(r['a'][2].tolist(), [2, 10])
+        self.assertEqual(r['lc'].tolist(), ['0', '1', '0'])
+
+    def test_many_blocks(self):
+        r = self.cursor.select_as_numpy('select number from system.numbers limit 200000 settings max_block_size=7000')
+        self.assertTrue(np.array_equal(r['number'], np.arange(200000, dtype=np.uint64)))
+
+    def test_nested_lowcardinality(self):
+        r = self.cursor.select_as_numpy("""
+        select [toLowCardinality(toString(number))] as a, [[toLowCardinality(toString(number))]] as aa,
+            arrayMap(x -> toLowCardinality(toString(x)), range(number)) as v, number as n
+        from system.numbers limit 3
+        """)
+        self.assertEqual([list(x) for x in r['a']], [['0'], ['1'], ['2']])
+        self.assertEqual([[list(y) for y in x] for x in r['aa']], [[['0']], [['1']], [['2']]])
+        self.assertEqual([list(x) for x in r['v']], [[], ['0'], ['0', '1']])
+        self.assertEqual(r['n'].tolist(), [0, 1, 2])
+
+    def test_unsupported_type(self):
+        self.assertRaises(Exception, lambda: self.cursor.select_as_numpy("select map('a', 1) as m"))
+
+    def test_explicit_format(self):
+        r = self.cursor.select_as_numpy('select number as n from system.numbers limit 3 format Native')
+        self.assertEqual(r['n'].tolist(), [0, 1, 2])
+        self.assertRaises(Exception, lambda: self.cursor.select_as_numpy('select 1 as n format JSON'))
+
+    def test_insert_columns(self):
+        self.cursor.ddl('drop table if exists nativeinsert')
+        self.cursor.ddl("""create table nativeinsert (id Int64, i Int32, n Nullable(Float64), s String,
+            lc LowCardinality(Nullable(String)), d Date, t DateTime, t64 DateTime64(6), a Array(LowCardinality(String)),
+            m Map(String, UInt8), u UUID) Engine=MergeTree order by id""")
+        self.cursor.native_block_size = 2
+        self.cursor.insert_columns('nativeinsert', {
+            'id': np.arange(5), 'i': np.arange(5, dtype=np.uint8), 'n': np.array([0.5, np.nan, 1, 2, np.nan]),
+            's': ['a', 'b\tc', u'ö', '', None], 'lc': ['x', None, 'y', 'x', None],
+            'd': np.datetime64('2020-01-01') + np.arange(5), 't': [dt.datetime(2020, 1, 1, 0, 0, i) for i in range(5)],
+            't64': np.array(['2020-01-01T00:00:00.123456'] * 5, dtype='datetime64[us]'),
+            'a': [['x'] * i for i in range(5)], 'm': [{'k': i} for i in range(5)],
+            'u': ['61f0c404-5cb3-11e7-907b-a6006ad3dba0'] * 5})
+        self.cursor.select_format = 'RowBinaryWithNamesAndTypes'
+        self.cursor.select('select * from nativeinsert order by id')
+        r = self.cursor.fetchall()
+        self.assertEqual([x['n'] for x in r], [0.5, None, 1.0, 2.0, None])
+        self.assertEqual([x['s'] for x in r], ['a', 'b\tc', u'ö', '', ''])
+        self.assertEqual([x['lc'] for x in r], ['x', None, 'y', 'x', None])
+        self.assertEqual(r[4], {'id': 4, 'i': 4, 'n': None, 's': '', 'lc': None, 'd': dt.date(2020, 1, 5),
+                                't': dt.datetime(2020, 1, 1, 0, 0, 4), 't64': dt.datetime(2020, 1, 1, 0, 0, 0, 123456),
+                                'a': ['x'] * 4, 'm': {'k': 4}, 'u': '61f0c404-5cb3-11e7-907b-a6006ad3dba0'})
+        self.assertRaises(Exception, lambda: self.cursor.insert_columns('nativeinsert', {'id': [1], 'x': [1]}))
+        self.assertRaises(Exception, lambda: self.cursor.insert_columns('nativeinsert', {'id': [1], 'i': [1, 2]}))
+
+    def test_naive_datetimes(self):
+        self.cursor.ddl('drop table if exists nativetimezones')
+        self.cursor.ddl("create table nativetimezones (id Int64, t DateTime, b DateTime('Europe/Berlin'), "
+                        "b64 DateTime64(3, 'Europe/Berlin')) Engine=MergeTree order by id")
+        value = dt.datetime(2020, 7, 1, 12, 0, 0)
+        self.cursor.insert_columns('nativetimezones', {'id': [1], 't': [value], 'b': [value], 'b64': [value]})
+        self.cursor.bulkinsert('nativetimezones', [{'id': 2, 't': value, 'b': value, 'b64': value}],
+                               ['id', 't', 'b', 'b64'], ['Int64', 'DateTime', "DateTime('Europe/Berlin')",
+                                                         "DateTime64(3, 'Europe/Berlin')"])
+        self.cursor.select('select id, toUnixTimestamp(t) as t, toUnixTimestamp(b) as b, toUnixTimestamp(b64) as b64 '
+                           'from nativetimezones order by id')
+        r = self.cursor.fetchall()
+        self.assertEqual(r[0], dict(r[1], id=1))
+        self.assertEqual(r[0]['b'], 1593597600)  # 10:00 UTC
+
+    def test_numpy_roundtrip(self):
+        self.cursor.ddl('drop table if exists nativeroundtrip')
+        self.cursor.ddl('create table nativeroundtrip (number UInt64, d Date, f Float32) Engine=Memory')
+        self.cursor.insert('insert into nativeroundtrip select number, toDate(number), number / 3 '
+                           'from system.numbers limit 100000')
+        expected = self.cursor.select_as_numpy('select * from nativeroundtrip order by number')
+        self.cursor.ddl('truncate table nativeroundtrip')
+        self.cursor.insert_columns('nativeroundtrip', expected)
+        r = self.cursor.select_as_numpy('select * from nativeroundtrip order by number')
+        for field in ['number', 'd', 'f']:
+            self.assertTrue(np.array_equal(r[field], expected[field]))
+
+
+if __name__ == '__main__':
+    unittest.main(__name__)
@@ -52,6 +52,51 @@ class TestNewUnitTests(unittest.TestCase):
         formatter = TabSeparatedWithNamesAndTypesFormatter()
         formatter.unformatfield("['abc',,'def']", 'Array(String)')  # boom
 
+    def test_unformat_of_array_literals(self):
+        formatter = TabSeparatedWithNamesAndTypesFormatter()
+        r = formatter.unformatfield("['te\\tst','a\\'b','c\\\\d','x,y]','',NULL]", 'Array(Nullable(String))')
+        assert r == ['te\tst', "a'b", 'c\\d', 'x,y]', '', None]
+        assert formatter.unformatfield('[nan,inf,-1.5e-10]', 'Array(Float64)')[1:] == [float('inf'), -1.5e-10]
+        assert formatter.unformatfield('[[1,NULL],[]]', 'Array(Array(Nullable(Int64)))') == [[1, None], []]
+        assert formatter.unformatfield("[(1,'a'),(2,'b')]", 'Array(Tuple(Int32, String))') == [(1, 'a'), (2, 'b')]
+        assert formatter.unformatfield("['2020-01-01']", 'Array(Date)') == [dt.date(2020, 1, 1)]
+        assert formatter.unformatfield("[true,false]", 'Array(Bool)') == [True, False]
+        assert formatter.unformatfield("{'k\\'':[1,2]}", 'Map(String, Array(Int64))') == {"k'": [1, 2]}
+        self.assertRaises(Exception, lambda: formatter.unformatfield("[1,2]x", 'Array(Int64)'))
+        self.assertRaises(Exception, lambda: formatter.unformatfield("['__import__']", 'Array(Int64)'))
+
+    def test_unformat_of_dates(self):
+        formatter = TabSeparatedWithNamesAndTypesFormatter()
+        decode = formatter.make_decoder('DateTime')
+        assert decode('2020-01-02 03:04:05') == dt.datetime(2020, 1, 2, 3, 4, 5)
+        assert decode('2020-01-02 03:04:05') is decode('2020-01-02 03:04:05')
+        assert decode('0000-00-00 00:00:00') is None
+        self.assertRaises(Exception, lambda: decode('2020-01-02T03:04:05'))
+        self.assertRaises(Exception, lambda: decode('2020-13-02 03:04:05'))
+        assert formatter.unformatfield('2020-01-02', 'Date') == dt.date(2020, 1, 2)
+        assert formatter.unformatfield('2020-01-02 03:04:05.5', 'DateTime64(1)') == dt.datetime(2020, 1, 2, 3, 4, 5,
+                                                                                                  500000)
+        assert formatter.unformatfield('2020-01-02 03:04:05.123456789', 'DateTime64(9)').microsecond == 123456
+        assert formatter.unformatfield('2020-01-02 03:04:05', "DateTime('Europe/Berlin')").utcoffset() == \
+               dt.timedelta(hours=1)
+
+    def test_format_with_compiled_encoders(self):
+        formatter = TabSeparatedWithNamesAndTypesFormatter()
+        rows = [{'v': 1, 'm': {'k': [1, 2]}, 'n': None}, {'v': 'x', 'm': {}, 'n': "a'\tb"},
+                {'v': 2, 'm': None, 'n': 'c'}]
+        _, _, payload = formatter.format(rows, ['v', 'm', 'n'],
+                                         ['Variant(Int64, String)', 'Map(String, Array(Int64))', 'Nullable(String)'])
+        assert payload.split('\n')[2:] == ["1\t{'k':[1,2]}\t\\N", "x\t{}\ta'\\tb", '2\t{}\tc']
+        self.assertRaises(Exception, lambda: formatter.format([{'v': 1.5}], ['v'], ['Variant(Int64, String)']))
+
+    def test_select_of_array_literals(self):
+        self.cursor.select("""select ['te\\tst', 'a\\'b', 'c\\\\d', 'e\\nf', '', 'x,y'] as s, [(1, 'a')] as t,
+            map('k', [toDate('2020-01-02')]) as m""")
+        r = self.cursor.fetchone()
+        assert r['s'] == ['te\tst', "a'b", 'c\\d', 'e\nf', '', 'x,y']
+        assert r['t'] == [(1, 'a')]
+        assert r['m'] == {'k': [dt.date(2020, 1, 2)]}
+
     def test_store_doc(self):
         doc = {'id': 3, 'historydate': dt.date(2019,6,7), 'Offer': {'price': 5, 'count': 1}, 'Images': [{'file':                                                                                                               'a', 'size': 400}, {'file': 'b', 'size': 500}]}
         self.cursor.ddl('drop table if exists docs')
@@ -0,0 +1,69 @@
+# coding=utf-8
+import unittest
+import datetime as dt
+
+import pyclickhouse
+from pyclickhouse.records import make_record_class
+
+
+class TestRecords(unittest.TestCase):
+    def setUp(self):
+        self.conn = pyclickhouse.Connection('localhost:8124')
+        self.cursor = self.conn.cursor()
+
+    def test_record_class(self):
+        Record = make_record_class(['id', 'name', 'count', 'count()'])
+        r = Record([1, 'a', 5, 6])
+        self.assertEqual(r, (1, 'a', 5, 6))
+        self.assertEqual(r.id, 1)
+        self.assertEqual(r['name'], 'a')
+        self.assertEqual(r['count'], 5)
+        self.assertEqual(r['count()'], 6)
+        self.assertEqual(r[1], 'a')
+        self.assertEqual(r.get('missing', 7), 7)
+        self.assertEqual(dict(r), {'id': 1, 'name': 'a', 'count': 5, 'count()': 6})
+        self.assertRaises(AttributeError, lambda: setattr(r, 'id', 2))
+
+    def test_row_formats(self):
+        query = "select number as id, toString(number) as name, toDate('2020-01-01') + number as d " \
+                "from system.numbers limit 3"
+        for select_format in ['TabSeparatedWithNamesAndTypes', 'RowBinaryWithNamesAndTypes']:
+            self.cursor.select_format = select_format
+            self.cursor.row_format = 'tuple'
+            self.cursor.select(query)
+            self.assertEqual(self.cursor.fetchall()[2], (2, '2', dt.date(2020, 1, 3)))
+            self.assertEqual([x[:2] for x in self.cursor.description],
+                             [('id', 'UInt64'), ('name', 'String'), ('d', 'Date')])
+
+            self.cursor.row_format = 'record'
+            self.cursor.select(query)
+            r = self.cursor.fetchone()
+            self.assertEqual(r.name, '0')
+            self.assertEqual(r['d'], dt.date(2020, 1, 1))
+            self.assertEqual(r, (0, '0', dt.date(2020, 1, 1)))
+
+    def test_description_nullable(self):
+        self.cursor.select('select toNullable(1) as n, 1 as m')
+        self.assertEqual([x[6] for x in self.cursor.description], [True, False])
+
+    def test_iter_select_records(self):
+        self.cursor.row_format = 'record'
+        rows = list(self.cursor.iter_select('select number from system.numbers limit 2'))
+        self.assertEqual([x.number for x in rows], [0, 1])
+
+    def test_internal_selects_use_dicts(self):
+        self.cursor.ddl('drop table if exists recordstest')
+        self.cursor.ddl('create table recordstest (id Int64, value String) Engine=MergeTree order by id')
+        self.cursor.row_format = 'tuple'
+        self.cursor.store_documents('recordstest', [{'id': 1, 'value': 'a', 'extra': 5}])
+        self.assertEqual(self.cursor.get_schema('recordstest')[0], ['id', 'value', 'extra'])
+        self.assertEqual(self.cursor.cached_select('select * from recordstest', {'id': 1}),
+                         [{'id': 1, 'value': 'a', 'extra': 5}])
+
+    def test_unsupported_row_format(self):
+        self.cursor.row_format = 'list'
+        self.assertRaises(Exception, lambda: self.cursor.select('select 1'))
+
+
+if __name__ == '__main__':
+    unittest.main(__name__)
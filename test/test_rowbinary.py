@@ -0,0 +1,117 @@
+# coding=utf-8
+import unittest
+import datetime as dt
+from decimal import Decimal
+
+from dateutil import tz
+
+import pyclickhouse
+from pyclickhouse.rowbinary import RowBinaryWithNamesAndTypesFormatter
+
+
+class TestRowBinary(unittest.TestCase):
+    def setUp(self):
+        self.conn = pyclickhouse.Connection('localhost:8124')
+        self.cursor = self.conn.cursor()
+
+    def test_unformat(self):
+        formatter = RowBinaryWithNamesAndTypesFormatter()
+        payload = (b'\x03\x02id\x04name\x03day'
+                   b'\x05Int64\x10Nullable(String)\x04Date'
+                   b'\x01\x00\x00\x00\x00\x00\x00\x00\x00\x03abc\x01\x00'
+                   b'\xff\xff\xff\xff\xff\xff\xff\xff\x01\x00\x00')
+        r = formatter.unformat(payload)
+        self.assertEqual(r, [{'id': 1, 'name': 'abc', 'day': dt.date(1970, 1, 2)},
+                             {'id': -1, 'name': None, 'day': None}])
+
+    def test_same_as_tsv(self):
+        self.cursor.ddl('drop table if exists RowBinaryTest')
+        self.cursor.ddl("""
+        create table RowBinaryTest (
+            u8 UInt8, u64 UInt64, i32 Int32, i64 Int64, f32 Float32, f64 Float64,
+            s String, lc LowCardinality(String), ns Nullable(String), ni Nullable(Int64),
+            d Date, t DateTime, tu DateTime('UTC'), t64 DateTime64(3), ip4 IPv4, ip6 IPv6, id UUID,
+            ai Array(Int64), aas Array(Array(String)), ad Array(Date), m Map(String, Float64)
+        ) Engine=Memory
+        """)
+        self.cursor.insert("""
+        insert into RowBinaryTest values
+        (1, 18446744073709551615, -5, -9223372036854775808, 9.99, 3.1415, 'te\\tst\\n', 'lc', NULL, 42,
+         '2020-02-29', '2021-03-04 05:06:07', '2021-03-04 05:06:07', '2021-03-04 05:06:07.123', '10.1.2.3',
+         '::ffff:1.2.3.4', '61f0c404-5cb3-11e7-907b-a6006ad3dba0', [1, 2, 3], [['a', 'b'], []], ['2020-01-01'],
+         {'pi': 3.14}),
+        (0, 0, 0, 0, 0, 0, '', '', 'x', NULL, '1970-01-01', '1970-01-01 00:00:01', '1970-01-01 00:00:01',
+         '1970-01-01 00:00:01.000', '0.0.0.0', '::', '00000000-0000-0000-0000-000000000000', [], [], [], {})
+        """)
+        query = 'select * from RowBinaryTest order by u8'
+        self.cursor.select(query)
+        expected = self.cursor.fetchall()
+        self.cursor.select_format = 'RowBinaryWithNamesAndTypes'
+        self.cursor.select(query)
+        r = self.cursor.fetchall()
+        self.assertEqual(r, expected)
+        self.assertEqual(r[1]['tu'], dt.datetime(2021, 3, 4, 5, 6, 7, tzinfo=tz.UTC))
+        self.assertEqual(r[1]['s'], 'te\tst\n')
+        self.cursor.ddl('drop table if exists RowBinaryTest')
+
+    def test_types_without_text_support(self):
+        self.cursor.select_format = 'RowBinaryWithNamesAndTypes'
+        self.cursor.select("""
+        select toDecimal64(3.14, 4) dec, tuple(1, 'a') tp, CAST('b', 'Enum8(\\'a\\' = 1, \\'b\\' = 2)') e,
+            toBool(1) b, toDate32('2100-01-01') d32, toInt128(-3) i128, toFixedString('ab', 2) fs
+        """)
+        r = self.cursor.fetchone()
+        self.assertEqual(r, {'dec': Decimal('3.1400'), 'tp': (1, 'a'), 'e': 'b', 'b': True,
+                             'd32': dt.date(2100, 1, 1), 'i128': -3, 'fs': 'ab'})
+
+    def test_wide_decimals(self):
+        self.cursor.select_format = 'RowBinaryWithNamesAndTypes'
+        self.cursor.select("""
+        select toDecimal128('1234567890123456789012345678.9012345678', 10) d128,
+            toDecimal256('-12345678901234567890123456789012345678901234567890.123456', 6) d256
+        """)
+        r = self.cursor.fetchone()
+        self.assertEqual(r, {'d128': Decimal('1234567890123456789012345678.9012345678'),
+                             'd256': Decimal('-12345678901234567890123456789012345678901234567890.123456')})
+        formatter = RowBinaryWithNamesAndTypesFormatter()
+        fields, types = ['d128', 'd256'], ['Decimal(38, 10)', 'Decimal256(6)']
+        self.assertEqual(formatter.unformat(formatter.format([r], fields, types)), [r])
+
+    def test_unsupported_format(self):
+        self.cursor.select_format = 'JSON'
+        self.assertRaises(Exception, lambda: self.cursor.select('select 1'))
+        self.cursor.insert_format = 'JSON'
+        self.assertRaises(Exception, lambda: self.cursor.bulkinsert('t', [{'a': 1}]))
+
+    def test_format_roundtrip(self):
+        formatter = RowBinaryWithNamesAndTypesFormatter()
+        fields = ['i', 's', 'n', 'a', 'm', 'd', 't', 'v']
+        types = ['Int32', 'String', 'Nullable(Float64)', 'Array(LowCardinality(String))', 'Map(String, UInt8)',
+                 'Date', "DateTime('Europe/Berlin')", 'Variant(Int64, String)']
+        rows = [{'i': -5, 's': u'fö\to', 'n': None, 'a': ['x', 'y'], 'm': {'k': 1}, 'd': dt.date(2020, 2, 3),
+                 't': dt.datetime(2020, 1, 1, 12, 0, 0), 'v': 'x'},
+                {'i': None, 's': 5, 'n': 1.5, 'a': None, 'm': {}, 'd': None, 't': None, 'v': 3}]
+        r = formatter.unformat(formatter.format(rows, fields, types))
+        batches = list(formatter.iter_batches(rows, fields, types, 1))
+        self.assertEqual(len(batches), 2)
+        self.assertEqual(sum([formatter.unformat(b) for b in batches], []), r)
+        self.assertEqual(r[0], dict(rows[0], t=dt.datetime(2020, 1, 1, 12, 0, 0, tzinfo=tz.gettz('Europe/Berlin'))))
+        self.assertEqual(r[1], {'i': 0, 's': '5', 'n': 1.5, 'a': [], 'm': {}, 'd': None,
+                                't': dt.datetime(1970, 1, 1, 1, 0, tzinfo=tz.gettz('Europe/Berlin')), 'v': 3})
+
+    def test_bulkinsert(self):
+        self.cursor.ddl('drop table if exists rowbinaryinsert')
+        self.cursor.ddl("""create table rowbinaryinsert (id Int64, name String, price Float64, day Date, ts DateTime,
+            ts64 DateTime64(6), tags Array(String), opt Nullable(Int32)) Engine=MergeTree order by id""")
+        rows = [{'id': i, 'name': 'name\t%d' % i, 'price': i / 4.0, 'day': dt.date(2020, 1, 1) + dt.timedelta(i),
+                 'ts': dt.datetime(2020, 1, 1, 0, 0, i % 60), 'ts64': dt.datetime(2020, 1, 1, 0, 0, 0, i),
+                 'tags': ['a', 'b'][:1 + i % 2], 'opt': None if i % 2 else i} for i in range(1000)]
+        self.cursor.insert_format = 'RowBinaryWithNamesAndTypes'
+        self.cursor.bulkinsert('rowbinaryinsert', rows[:500])
+        self.cursor.bulkinsert('rowbinaryinsert', iter(rows[500:]))
+        self.cursor.select('select * from rowbinaryinsert order by id')
+        self.assertEqual(self.cursor.fetchall(), rows)
+
+
+if __name__ == '__main__':
+    unittest.main(__name__)
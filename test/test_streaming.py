@@ -0,0 +1,144 @@
+# coding=utf-8
+import unittest
+import datetime as dt
+import itertools
+import threading
+import time
+
+import pyclickhouse
+from pyclickhouse.formatter import TabSeparatedWithNamesAndTypesFormatter, iter_lines
+
+
+class TestStreaming(unittest.TestCase):
+    def setUp(self):
+        self.conn = pyclickhouse.Connection('localhost:8124')
+        self.cursor = self.conn.cursor()
+
+    def test_iter_lines(self):
+        payload = b'a\tb\nInt64\tString\n1\tx\n22\tyy\n'
+        for size in [1, 2, 3, 5, len(payload)]:
+            chunks = [payload[i:i + size] for i in range(0, len(payload), size)]
+            self.assertEqual(list(iter_lines(chunks)), [b'a\tb', b'Int64\tString', b'1\tx', b'22\tyy'])
+        self.assertEqual(list(iter_lines([b'abc', b'\nde', b'f'])), [b'abc', b'def'])
+        self.assertEqual(list(iter_lines([b'a', b'\n', b'\n', b'', b'b'])), [b'a', b'', b'b'])
+        long_line = [b'x'] * 100000 + [b'\nend']
+        self.assertEqual(list(iter_lines(long_line)), [b'x' * 100000, b'end'])
+
+    def test_unformat_stream(self):
+        formatter = TabSeparatedWithNamesAndTypesFormatter()
+        payload = u'id\tname\tday\nInt64\tString\tDate\n1\tföö\\tbar\t2020-01-02\n2\t\t2021-03-04\n'.encode('utf8')
+        chunks = [payload[i:i + 1] for i in range(len(payload))]
+        self.assertEqual(list(formatter.unformat_stream(chunks)), formatter.unformat(payload))
+
+    def test_iter_select(self):
+        self.cursor.select('select number, toString(number) as s, toDate(number) as d from system.numbers limit 10000')
+        expected = self.cursor.fetchall()
+        self.cursor.stream_chunk_size = 1000
+        r = list(self.cursor.iter_select('select number, toString(number) as s, toDate(number) as d '
+                                         'from system.numbers limit %s', 10000))
+        self.assertEqual(r, expected)
+
+    def test_iter_select_early_exit(self):
+        for row in self.cursor.iter_select('select number from system.numbers limit 1000000'):
+            if row['number'] == 10:
+                break
+        self.cursor.select('select 1 as one')
+        self.assertEqual(self.cursor.fetchone()['one'], 1)
+
+    def test_iter_select_format(self):
+        with self.assertRaises(Exception):
+            list(self.cursor.iter_select('select 1 FORMAT JSON'))
+        r = list(self.cursor.iter_select('select toDate(\'2020-01-01\') as d FORMAT TabSeparatedWithNamesAndTypes'))
+        self.assertEqual(r, [{'d': dt.date(2020, 1, 1)}])
+
+    def test_iter_format(self):
+        formatter = TabSeparatedWithNamesAndTypesFormatter()
+        rows = [{'id': i, 'name': 'n\t%d' % i} for i in range(1000)]
+        fields, types, chunks = formatter.iter_format(iter(rows), chunk_size=100)
+        chunks = list(chunks)
+        self.assertTrue(len(chunks) > 10)
+        self.assertEqual(b''.join(chunks).decode('utf8'), formatter.format(rows)[2] + '\n')
+        self.assertEqual(types, ['Int64', 'String'])
+        self.assertRaises(Exception, lambda: formatter.iter_format(iter([])))
+
+    def test_bulkinsert_stream(self):
+        for compression in [None, 'gzip']:
+            cursor = pyclickhouse.Connection('localhost:8124', compression=compression).cursor()
+            cursor.stream_chunk_size = 1000
+            cursor.ddl('drop table if exists streamtest')
+            cursor.ddl('create table streamtest (id Int64, day Date, name String) Engine=MergeTree order by id')
+            cursor.bulkinsert('streamtest', ({'id': i, 'day': dt.date(2020, 1, 1), 'name': 'x%d' % i}
+                                             for i in range(20000)))
+            cursor.bulkinsert_stream('streamtest', iter([]), ['id'], ['Int64'])
+            cursor.select('select count() as c, sum(id) as s, max(name) as m from streamtest')
+            self.assertEqual(cursor.fetchone(), {'c': 20000, 's': sum(range(20000)), 'm': 'x9999'})
+
+    def test_iter_batches(self):
+        formatter = TabSeparatedWithNamesAndTypesFormatter()
+        rows = [{'id': i, 'name': 'x' * i} for i in range(100)]
+        batches = list(formatter.iter_batches(rows, ['id', 'name'], ['Int64', 'String'], 500))
+        self.assertTrue(len(batches) > 5)
+        self.assertTrue(all(len(b) <= 500 for b in batches[:-1]))
+        self.assertEqual(sum([formatter.unformat(b) for b in batches], []), rows)
+        batches = list(formatter.iter_batches(rows, ['id', 'name'], ['Int64', 'String'], 10 ** 9, 30))
+        self.assertEqual([len(formatter.unformat(b)) for b in batches], [30, 30, 30, 10])
+        batches = list(formatter.iter_batches(rows[99:], ['id', 'name'], ['Int64', 'String'], 10))
+        self.assertEqual(formatter.unformat(batches[0]), rows[99:])
+        rows = [{'id': i, 'name': u'ё' * i} for i in range(100)]
+        batches = list(formatter.iter_batches(rows, ['id', 'name'], ['Int64', 'String'], 500))
+        self.assertTrue(all(len(b) <= 500 for b in batches[:-1]))
+        self.assertEqual(sum([formatter.unformat(b) for b in batches], []), rows)
+        batches = list(formatter.iter_batches(rows, ['id', 'name'], ['Int64', 'String'], None))
+        self.assertEqual(len(batches), 1)
+
+    def test_bulkinsert_batches(self):
+        self.cursor.ddl('drop table if exists batchtest')
+        self.cursor.ddl('create table batchtest (id Int64, name String) Engine=MergeTree order by id')
+        rows = [{'id': i, 'name': 'name%d' % i} for i in range(10000)]
+        self.assertEqual(self.cursor.max_batch_bytes, 2000000000)
+        for insert_format in ['TabSeparatedWithNamesAndTypes', 'RowBinaryWithNamesAndTypes']:
+            self.cursor.insert_format = insert_format
+            self.cursor.max_batch_bytes = 10000
+            self.cursor.bulkinsert('batchtest', rows)
+            self.cursor.max_batch_bytes = 10 ** 9
+            self.cursor.max_batch_rows = 3000
+            self.cursor.bulkinsert('batchtest', rows)
+            self.cursor.max_batch_rows = None
+        self.cursor.select('select count() as c, uniqExact(id) as u, max(name) as m from batchtest')
+        self.assertEqual(self.cursor.fetchone(), {'c': 40000, 'u': 10000, 'm': 'name9999'})
+
+    def test_bulkinsert_pipelined(self):
+        self.cursor.ddl('drop table if exists pipelinetest')
+        self.cursor.ddl('create table pipelinetest (id Int64, name String) Engine=MergeTree order by id')
+        batches = ([{'id': i, 'name': 'name%d' % i} for i in range(start, start + 1000)]
+                   for start in range(0, 10000, 1000))
+        self.cursor.bulkinsert_pipelined('pipelinetest', itertools.chain([[]], batches), queue_size=1)
+        self.cursor.select('select count() as c, uniqExact(id) as u, max(name) as m from pipelinetest')
+        self.assertEqual(self.cursor.fetchone(), {'c': 10000, 'u': 10000, 'm': 'name9999'})
+        self.cursor.bulkinsert_pipelined('pipelinetest', iter([]))
+
+        def failing():
+            yield [{'id': 1, 'name': 'x'}]
+            raise ValueError('broken batch')
+        self.assertRaises(ValueError, lambda: self.cursor.bulkinsert_pipelined('pipelinetest', failing()))
+
+        endless = ([{'id': 1, 'name': 'x'}] for i in itertools.count())
+        self.assertRaises(Exception, lambda: self.cursor.bulkinsert_pipelined('nonexistingtable', endless,
+                                                                              ['id'], ['Int64']))
+        self.assertFalse(any(t.name == 'pyclickhouse-encoder' for t in threading.enumerate()))
+
+        released = threading.Event()
+
+        def blocking():
+            yield [{'id': 1}]
+            released.wait()
+            yield [{'id': 2}]
+        start = time.time()
+        self.assertRaises(Exception, lambda: self.cursor.bulkinsert_pipelined('nonexistingtable', blocking(),
+                                                                              ['id'], ['Int64']))
+        self.assertLess(time.time() - start, 5)
+        released.set()
+
+
+if __name__ == '__main__':
+    unittest.main(__name__)
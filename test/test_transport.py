@@ -0,0 +1,66 @@
+# coding=utf-8
+import unittest
+import socket
+import threading
+
+import pyclickhouse
+from pyclickhouse.transport import HTTPClientTransport
+
+
+class TestTransport(unittest.TestCase):
+    def setUp(self):
+        self.conn = pyclickhouse.Connection('localhost:8124', transport='http.client')
+        self.cursor = self.conn.cursor()
+
+    def test_select_and_insert(self):
+        self.cursor.ddl('drop table if exists transporttest')
+        self.cursor.ddl('create table transporttest (id Int64, name String) Engine=MergeTree order by id')
+        rows = [{'id': i, 'name': u'näme\t%d' % i} for i in range(1000)]
+        self.cursor.bulkinsert('transporttest', rows[:500])
+        self.cursor.bulkinsert('transporttest', iter(rows[500:]))
+        self.cursor.select('select * from transporttest order by id')
+        self.assertEqual(self.cursor.fetchall(), rows)
+        self.assertEqual(list(self.cursor.iter_select('select * from transporttest order by id')), rows)
+        self.assertEqual(len(self.conn.transport.idle), 1)
+        self.assertRaises(Exception, lambda: self.cursor.select('select * from nonexistingtable'))
+        self.cursor.select('select 1 as one')
+        self.assertEqual(self.cursor.fetchone(), {'one': 1})
+        self.cursor.ddl('drop table if exists transporttest')
+
+    def test_compression(self):
+        cursor = pyclickhouse.Connection('localhost:8124', transport='http.client', compression='gzip',
+                                         compress_response=True).cursor()
+        cursor.select('select number from system.numbers limit 10000')
+        self.assertEqual(cursor.fetchall(), [{'number': i} for i in range(10000)])
+        # with an explicit FORMAT, the response is kept unparsed
+        cursor.select('select number from system.numbers limit 10000 format TabSeparated')
+        self.assertEqual(cursor.lastresult.headers.get('Content-Encoding'), 'gzip')
+        self.assertEqual(cursor.lastresult.content, ''.join(['%d\n' % i for i in range(10000)]).encode('ascii'))
+
+    def test_stale_connection(self):
+        # a server closing each connection after one response, like Clickhouse after its keep alive timeout
+        server = socket.socket()
+        server.bind(('127.0.0.1', 0))
+        server.listen(5)
+        connections = []
+
+        def serve():
+            for i in range(2):
+                client, _ = server.accept()
+                connections.append(client)
+                client.recv(65536)
+                client.sendall(b'HTTP/1.1 200 OK\r\nContent-Length: 4\r\n\r\nOk.\n')
+                client.close()
+
+        thread = threading.Thread(target=serve)
+        thread.start()
+        transport = HTTPClientTransport('127.0.0.1', server.getsockname()[1])
+        for i in range(2):
+            self.assertEqual(transport.request('GET', '/', None, {}).content, b'Ok.\n')
+        thread.join()
+        server.close()
+        self.assertEqual(len(connections), 2)
+
+
+if __name__ == '__main__':
+    unittest.main(__name__)
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""
+Measures the overhead per query of the transports of Connection, using a local stub server which answers every
+request immediately with the same small result, so that nearly all of the measured time is spent in the client.
+Optionally, the same point query is timed against a real Clickhouse too. Run it with
+python -m test.transportbenchmark [host:port]
+"""
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pyclickhouse
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    body = b'one\nUInt8\n1\n'
+
+    def do_GET(self):
+        self.respond(b'Ok.\n')
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.respond(self.body)
+
+    def respond(self, body):
+        # a single write, so that the measurement is not distorted by Nagle's algorithm and delayed ACKs
+        self.wfile.write(b'HTTP/1.1 200 OK\r\nContent-Length: %d\r\n\r\n' % len(body) + body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def measure(host, transport, count):
+    cursor = pyclickhouse.Connection(host, transport=transport).cursor()
+    for i in range(100):
+        cursor.select('select 1 as one')
+    start = time.time()
+    for i in range(count):
+        cursor.select('select 1 as one')
+    return (time.time() - start) / count
+
+
+if __name__ == '__main__':
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    hosts = [('stub', '127.0.0.1:%d' % server.server_address[1])]
+    if len(sys.argv) > 1:
+        hosts.append(('clickhouse', sys.argv[1]))
+    for name, host in hosts:
+        for transport in ['requests', 'http.client']:
+            print('%s, %s: %.1f microseconds per query' % (name, transport, measure(host, transport, 1000) * 1e6))
+    server.shutdown()